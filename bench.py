@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""Benchmarks for the registry CLI.
+
+    python bench.py startup [--runs 15]
+    python bench.py generate --companies 100000 [--seed 1] [--out data/downloads]
+    python bench.py run [--companies 10000] [--repeat 3] [--save-baseline]
+    python bench.py decoders [--companies 20000 | --file data/downloads/...yldandmed.json.zip]
+    python bench.py backends [--companies 10000] [--repeat 3]
+    python bench.py bulk [--companies 50000] [--repeat 2]
+
+startup runs each case as a fresh interpreter, the way scripts call the CLI in a loop,
+and reports the median wall time.
+
+generate writes a deterministic synthetic registry in the shape of the open-data files
+(lihtandmed CSV and the five JSON sections, zipped) so merge can run without the real dataset.
+
+run generates a registry, merges it and times populate_persons and typical queries, then
+compares the timings with the stored baseline (bench_baseline.json, one entry per scale)
+and exits with status 1 when a workload is slower than the tolerance allows.
+
+decoders times every installed JSON decoder on one registry file, streamed from its zip the
+way merge reads it.
+
+backends runs the merge and query workloads of run on the SQLite and the DuckDB backend
+over the same synthetic registry and prints the timings side by side.
+
+bulk merges one synthetic registry into two empty databases, once row by row with every index
+in place and once through the bulk-load path, and prints the per-file and per-step times.
+"""
+import argparse
+import csv
+import io
+import json
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+REGISTRY = str(ROOT / "registry.py")
+BASELINE = ROOT / "bench_baseline.json"
+
+STARTUP_CASES = [
+    ("python -c pass", [sys.executable, "-c", "pass"]),
+    ("import registry", [sys.executable, "-c", "import registry"]),
+    ("--list-industries", [sys.executable, REGISTRY, "--list-industries"]),
+    ("--no-db --help", [sys.executable, REGISTRY, "--no-db", "--help"]),
+    ("stats", [sys.executable, REGISTRY, "stats"]),
+    ("isik Tamm", [sys.executable, REGISTRY, "isik", "Tamm"]),
+    ("leia 10000000", [sys.executable, REGISTRY, "leia", "10000000"]),
+]
+
+
+def time_command(cmd, runs, cwd, env=None):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), min(times)
+
+
+def bench_startup(args):
+    import os
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    with tempfile.TemporaryDirectory() as tmp:
+        # First run creates data/registry.db; every timed run then opens an existing, current schema
+        subprocess.run([sys.executable, REGISTRY, "stats"], cwd=tmp, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        print(f"{'case':<22}{'median ms':>12}{'min ms':>10}")
+        for name, cmd in STARTUP_CASES:
+            median, best = time_command(cmd, args.runs, tmp, env)
+            print(f"{name:<22}{median * 1000:>12.1f}{best * 1000:>10.1f}")
+
+
+# ============================================================
+# Synthetic registry
+# ============================================================
+
+FIRST_NAMES = ["Mari", "Jaan", "Kadri", "Andres", "Liis", "Tõnu", "Piret", "Margus", "Kersti", "Urmas",
+               "Triin", "Rein", "Ülle", "Peeter", "Maarja", "Siim", "Anu", "Toomas", "Helen", "Mart"]
+LAST_NAMES = ["Tamm", "Saar", "Sepp", "Mägi", "Kask", "Kukk", "Rebane", "Ilves", "Pärn", "Koppel",
+              "Lepik", "Kuusk", "Oja", "Raudsepp", "Vaher", "Karu", "Lill", "Põder", "Mets", "Õun"]
+NAME_WORDS = ["Balti", "Põhja", "Tallinna", "Tartu", "Mere", "Metsa", "Kivi", "Tuule", "Päikese", "Digi",
+              "Andme", "Ehitus", "Kinnisvara", "Transpordi", "Agro", "Puidu", "Logistika", "Tarkvara",
+              "Konsult", "Disain", "Energia", "Tervise", "Auto", "Toidu", "Meedia", "Invest", "Arendus"]
+SUFFIXES = ["Grupp", "Teenused", "Lahendused", "Partnerid", "Holding", "Tehnika", "Stuudio", "Kaubandus", ""]
+LEGAL_FORMS = [("Osaühing", "OÜ", 70), ("Füüsilisest isikust ettevõtja", "FIE", 10), ("Mittetulundusühing", "MTÜ", 12),
+               ("Aktsiaselts", "AS", 3), ("Sihtasutus", "SA", 2), ("Täisühing", "TÜ", 1), ("Usaldusühing", "UÜ", 2)]
+STATUSES = [("R", "Registrisse kantud", 80), ("L", "Likvideerimisel", 4), ("N", "Pankrotis", 3), ("K", "Kustutatud", 13)]
+LOCATIONS = [("0784", "Kesklinna linnaosa, Tallinn, Harju maakond", 30), ("0793", "Tartu linn, Tartu maakond", 12),
+             ("0624", "Pärnu linn, Pärnu maakond", 6), ("0296", "Keila linn, Harju maakond", 3),
+             ("0198", "Harku vald, Harju maakond", 5), ("0353", "Jõhvi vald, Ida-Viru maakond", 3),
+             ("0511", "Narva linn, Ida-Viru maakond", 4), ("0919", "Viljandi linn, Viljandi maakond", 3),
+             ("0735", "Rakvere linn, Lääne-Viru maakond", 3), ("0446", "Kuressaare linn, Saare maakond", 2),
+             ("0170", "Haapsalu linn, Lääne maakond", 2), ("0338", "Kuusalu vald, Harju maakond", 2)]
+ACTIVITIES = [("62011", "Programmeerimine"), ("62021", "Arvutialane konsultatsioon"), ("41201", "Elamute ja mitteeluhoonete ehitus"),
+              ("43211", "Elektriinstallatsioon"), ("68201", "Oma või renditud kinnisvara üürile andmine ja käitus"),
+              ("49411", "Maanteekaubavedu"), ("47911", "Jaemüük posti või interneti teel"), ("56101", "Restoranid"),
+              ("70221", "Muu äri- ja juhtimisalane nõustamine"), ("01111", "Teravilja kasvatus"),
+              ("16101", "Puidu saagimine ja hööveldamine"), ("86231", "Hambaravi"), ("69201", "Raamatupidamine"),
+              ("73111", "Reklaamiagentuuride tegevus"), ("46901", "Spetsialiseerimata hulgikaubandus"), ("94991", "Mujal liigitamata organisatsioonid")]
+CONTACT_KINDS = [("Elektronposti aadress", "EMAIL"), ("Mobiiltelefon", "MOB"), ("Telefon", "TEL"), ("Interneti WWW aadress", "WWW")]
+ENTRY_KINDS = ["Esmakanne", "Muutmiskanne", "Muutmiskanne", "Muutmiskanne", "Aruande esitamine"]
+
+LIHTANDMED_COLUMNS = ["nimi", "ariregistri_kood", "ettevotja_oiguslik_vorm", "ettevotja_oigusliku_vormi_alaliik", "kmkr_nr",
+                      "ettevotja_staatus", "ettevotja_staatus_tekstina", "ettevotja_esmakande_kpv", "ettevotja_aadress",
+                      "asukoht_ettevotja_aadressis", "asukoha_ehak_kood", "asukoha_ehak_tekstina", "indeks_ettevotja_aadressis",
+                      "ads_adr_id", "ads_ads_oid", "ads_normaliseeritud_taisaadress", "teabesysteemi_link"]
+
+
+def _weighted(rng, options):
+    return rng.choices(options, weights=[o[-1] for o in options])[0]
+
+
+def _date(rng, start_year=1992, end_year=2025):
+    return f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(start_year, end_year)}"
+
+
+def _person(rng, person_count):
+    """One of person_count synthetic people; the same index always gives the same name and id code."""
+    idx = rng.randrange(person_count)
+    gender = 3 + idx % 2
+    return {"eesnimi": FIRST_NAMES[idx % len(FIRST_NAMES)], "nimi_arinimi": LAST_NAMES[(idx // len(FIRST_NAMES)) % len(LAST_NAMES)],
+            "isikukood_registrikood": f"{gender}{70 + idx % 30:02d}{1 + idx % 12:02d}{1 + idx % 28:02d}{idx % 10000:04d}",
+            "isiku_tyyp": "F"}
+
+
+def generate_company(rng, code, codes, person_count):
+    """All sections of one synthetic company, keyed by the open-data file they belong to."""
+    form, short, _ = _weighted(rng, LEGAL_FORMS)
+    status_code, status, _ = _weighted(rng, STATUSES)
+    ehak_code, ehak, _ = _weighted(rng, LOCATIONS)
+    founded = _date(rng)
+    name = " ".join(w for w in (rng.choice(NAME_WORDS), rng.choice(SUFFIXES), short) if w)
+    if rng.random() < 0.3: name = f"{rng.choice(NAME_WORDS)} {name}"
+    city = ehak.split(",")[-2].strip()
+    base = {"nimi": name, "ariregistri_kood": code, "ettevotja_oiguslik_vorm": form, "ettevotja_oigusliku_vormi_alaliik": "",
+            "kmkr_nr": f"EE10{code % 10000000:07d}" if rng.random() < 0.35 else "", "ettevotja_staatus": status_code,
+            "ettevotja_staatus_tekstina": status, "ettevotja_esmakande_kpv": founded,
+            "ettevotja_aadress": f"{rng.choice(LAST_NAMES)} tn {rng.randint(1, 120)}", "asukoht_ettevotja_aadressis": "",
+            "asukoha_ehak_kood": ehak_code, "asukoha_ehak_tekstina": ehak, "indeks_ettevotja_aadressis": f"{rng.randint(10000, 99999)}",
+            "ads_adr_id": str(rng.randint(1000000, 9999999)), "ads_ads_oid": f"ME{rng.randint(10000000, 99999999)}",
+            "ads_normaliseeritud_taisaadress": f"{ehak}, {city}", "teabesysteemi_link": f"https://ariregister.rik.ee/est/company/{code}"}
+
+    activities = rng.sample(ACTIVITIES, rng.choice([1, 1, 1, 2, 3]))
+    year = int(founded[-4:])
+    general = {
+        "esmaregistreerimise_kpv": founded, "staatus": status_code, "staatus_tekstina": status,
+        "teatatud_tegevusalad": [{"emtak_kood": emtak, "emtak_tekstina": text, "nace_kood": emtak[:4], "on_pohitegevusala": i == 0,
+                                  "algus_kpv": founded} for i, (emtak, text) in enumerate(activities)],
+        "kapitalid": [{"kapitali_suurus": rng.choice([2500, 2500, 2500, 0.01, 3000, 25000, 100000]), "kapitali_valuuta": "EUR",
+                       "algus_kpv": founded, "lopp_kpv": None}] if short in ("OÜ", "AS") else [],
+        "sidevahendid": [{"liik": kind, "liik_tekstina": text, "sisu": f"info@firma{code}.ee" if kind == "EMAIL" else
+                          f"www.firma{code}.ee" if kind == "WWW" else f"+372 5{rng.randint(1000000, 9999999)}"}
+                         for text, kind in CONTACT_KINDS if rng.random() < 0.4],
+        "info_majandusaasta_aruannetest": [{"majandusaasta_perioodi_lopp_kpv": f"{y}-12-31", "tootajate_arv": rng.randint(0, 40)}
+                                           for y in range(max(year, 2015), 2025) if rng.random() < 0.8],
+    }
+
+    board = [{**_person(rng, person_count), "isiku_roll": "JUHL", "isiku_roll_tekstina": "Juhatuse liige", "algus_kpv": founded,
+              "lopp_kpv": None} for _ in range(rng.choice([1, 1, 1, 2, 3]))]
+    shareholders = []
+    if short in ("OÜ", "AS", "TÜ", "UÜ"):
+        for _ in range(rng.choice([1, 1, 2, 3])):
+            if rng.random() < 0.12 and codes:
+                # Corporate shareholder: an earlier company, skewed towards the oldest ones so that
+                # holdings own many companies and find_group has multi-level chains to walk
+                owner = codes[int(rng.random() ** 3 * len(codes))]
+                holder = {"eesnimi": "", "nimi_arinimi": f"Firma {owner}", "isikukood_registrikood": str(owner), "isiku_tyyp": "J"}
+            else:
+                holder = _person(rng, person_count)
+            shareholders.append({**holder, "isiku_roll": "O", "isiku_roll_tekstina": "Osanik",
+                                 "osaluse_protsent": round(100 / rng.randint(1, 4), 2), "osaluse_suurus": 2500,
+                                 "osaluse_valuuta": "EUR", "osaluse_omandiliik_tekstina": "Täisomand",
+                                 "algus_kpv": founded, "lopp_kpv": None})
+    beneficiaries = [{"eesnimi": p["eesnimi"], "nimi": p["nimi_arinimi"], "isikukood_registrikood": p["isikukood_registrikood"],
+                      "kontrolli_teostamise_viis_tekstina": "Otsene osalus", "aadress_riik_tekstina": "Eesti",
+                      "algus_kpv": founded, "lopp_kpv": None}
+                     for p in (shareholders or board) if p["isiku_tyyp"] == "F"]
+    entries = [{"kpv": founded if i == 0 else _date(rng, year, 2025), "kande_nr": i + 1,
+                "kandeliik_tekstina": "Esmakanne" if i == 0 else rng.choice(ENTRY_KINDS[1:])} for i in range(rng.randint(1, 6))]
+    if status_code == "N":
+        entries.append({"kpv": _date(rng, max(year, 2010), 2025), "kande_nr": len(entries) + 1, "kandeliik_tekstina": "Pankrotikanne"})
+    cards = [{"kaardi_piirkond": 1, "kaardi_nr": code % 100000, "kaardi_tyyp": "A", "kanded": entries}]
+
+    head = {"ariregistri_kood": code, "nimi": name}
+    return {"lihtandmed": base, "yldandmed": {**head, "yldandmed": general},
+            "kaardile_kantud_isikud": {**head, "kaardile_kantud_isikud": board},
+            "osanikud": {**head, "osanikud": shareholders} if shareholders else None,
+            "kasusaajad": {**head, "kasusaajad": beneficiaries} if beneficiaries else None,
+            "registrikaardid": {**head, "registrikaardid": cards}}
+
+
+def generate_registry(out_dir, companies=10000, seed=1):
+    """Write the six registry zips for `companies` synthetic companies into out_dir.
+
+    The output depends only on companies and seed. Returns the list of written paths.
+    """
+    out_dir = Path(out_dir); out_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed); person_count = max(companies * 2, 100)
+    codes = [10000000 + i * 7 for i in range(companies)]
+    sections = ["yldandmed", "osanikud", "kasusaajad", "kaardile_kantud_isikud", "registrikaardid"]
+    paths = [out_dir / f"ettevotja_rekvisiidid__{s}.json.zip" for s in sections]
+    csv_path = out_dir / "ettevotja_rekvisiidid__lihtandmed.csv.zip"
+    zips = [zipfile.ZipFile(p, "w", zipfile.ZIP_DEFLATED, compresslevel=1) for p in [csv_path, *paths]]
+    try:
+        streams = [io.TextIOWrapper(zf.open(Path(zf.filename).stem, "w", force_zip64=True), encoding="utf-8") for zf in zips]
+        writer = csv.DictWriter(streams[0], LIHTANDMED_COLUMNS, delimiter=";", lineterminator="\n")
+        writer.writeheader()
+        first = [True] * len(sections)
+        for s in streams[1:]: s.write("[")
+        for i, code in enumerate(codes):
+            company = generate_company(rng, code, codes[:i], person_count)
+            writer.writerow(company["lihtandmed"])
+            for j, section in enumerate(sections):
+                item = company[section]
+                if item is None: continue
+                stream = streams[j + 1]
+                stream.write("\n" if first[j] else ",\n"); first[j] = False
+                stream.write(json.dumps(item, ensure_ascii=False))
+        for s in streams[1:]: s.write("\n]\n")
+        for s in streams: s.close()
+    finally:
+        for zf in zips: zf.close()
+    return [csv_path, *paths]
+
+
+def bench_generate(args):
+    start = time.perf_counter()
+    paths = generate_registry(args.out, companies=args.companies, seed=args.seed)
+    size = sum(p.stat().st_size for p in paths) / 2**20
+    print(f"Wrote {args.companies:,} companies ({size:.1f} MB zipped) to {args.out} in {time.perf_counter() - start:.1f} s")
+
+
+# ============================================================
+# Workloads
+# ============================================================
+
+def workloads(db, tmp, codes):
+    """(name, callable) pairs for the query benchmarks; each callable fully consumes its result."""
+    from registry import export_csv
+    # The company holding the most stakes in other companies: the deepest find_group tree
+    parent = db.conn.execute("""SELECT id_code FROM persons WHERE source = 'shareholder' AND length(id_code) = 8
+                                GROUP BY id_code ORDER BY COUNT(*) DESC, id_code LIMIT 1""").fetchone()
+    parent = int(parent[0]) if parent else codes[0]
+    return [
+        ("search:name", lambda: list(db.search(term="Tarkvara", limit=50))),
+        ("search:code", lambda: list(db.search(term=str(codes[len(codes) // 2])))),
+        ("search:filters", lambda: list(db.search(emtak=["62"], location="Tartu", status="Registrisse"))),
+        ("search:person", lambda: list(db.search(person="Tamm", limit=50))),
+        ("persons:name", lambda: db.search_persons(name="Kadri Kask", limit=200)),
+        ("analyze:county", lambda: db.analyze(by="county")),
+        ("analyze:emtak", lambda: db.analyze(by="emtak", top=20)),
+        ("analyze:legal-form", lambda: db.analyze(by="legal-form", status="Registrisse")),
+        ("employee_trend", lambda: db.employee_trend(emtak="62")),
+        ("events:bankruptcy", lambda: db.event_counts(by="county", event_type="bankruptcy", date_from="2020-01-01",
+                                                       date_to="2024-12-31")),
+        ("find_group", lambda: db.find_group(parent, direction="both")),
+        ("export_csv", lambda: quiet(export_csv, db, Path(tmp) / "export.csv", emtak=["62", "41"])),
+    ]
+
+
+def quiet(func, *args, **kwargs):
+    from contextlib import redirect_stdout
+    with redirect_stdout(io.StringIO()): return func(*args, **kwargs)
+
+
+def timed(func, repeat=1):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter(); func(); times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def run_benchmarks(companies=10000, seed=1, repeat=3, data_dir=None, backend="sqlite"):
+    """Generate, merge and query a synthetic registry on backend ("sqlite" or "duckdb"). Returns {workload: seconds}."""
+    import logging
+    from registry import EstonianRegistry, DuckDBBackend
+    logging.getLogger("registry").setLevel(logging.WARNING)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(data_dir or tmp) / "data"
+        start = time.perf_counter()
+        generate_registry(data_dir / "downloads", companies=companies, seed=seed)
+        results["generate"] = time.perf_counter() - start
+        reg = EstonianRegistry(data_dir=data_dir,
+                               backend=DuckDBBackend(data_dir / "registry.duckdb") if backend == "duckdb" else None)
+        start = time.perf_counter(); report = reg.merge()
+        results["merge"] = time.perf_counter() - start
+        for f in report["files"]: results[f"merge:{f['file'].split('__')[-1].split('.')[0]}"] = f["seconds"]
+        results["rebuild_derived_columns"] = timed(reg.db.rebuild_derived_columns)
+        results["populate_persons"] = timed(reg.db.populate_persons)
+        codes = [r[0] for r in reg.db.conn.execute("SELECT code FROM companies ORDER BY code").fetchall()]
+        for name, func in workloads(reg.db, tmp, codes):
+            func()  # warm the page cache so every workload starts from the same state
+            results[name] = timed(func, repeat)
+        reg.db.conn.close()
+    return {name: round(seconds, 4) for name, seconds in results.items()}
+
+
+def compare(results, baseline, tolerance):
+    """Rows of (workload, seconds, baseline seconds, ratio, regressed) for a printed report."""
+    rows = []
+    for name, seconds in results.items():
+        base = baseline.get(name)
+        ratio = seconds / base if base else None
+        # Sub-millisecond workloads are dominated by noise; only flag them past an absolute floor
+        regressed = ratio is not None and ratio > 1 + tolerance and seconds - base > 0.002
+        rows.append((name, seconds, base, ratio, regressed))
+    return rows
+
+
+def bench_run(args):
+    results = run_benchmarks(companies=args.companies, seed=args.seed, repeat=args.repeat)
+    stored = json.loads(BASELINE.read_text(encoding="utf-8")) if BASELINE.exists() else {}
+    baseline = stored.get(str(args.companies), {}).get("results", {})
+    rows = compare(results, baseline, args.tolerance)
+    print(f"{'workload':<28}{'seconds':>10}{'baseline':>10}{'ratio':>8}")
+    for name, seconds, base, ratio, regressed in rows:
+        print(f"{name:<28}{seconds:>10.4f}{base if base is not None else '-':>10}"
+              f"{f'{ratio:.2f}' if ratio is not None else '-':>8}{'  REGRESSION' if regressed else ''}")
+    if args.save_baseline:
+        import platform
+        stored[str(args.companies)] = {"results": results, "python": platform.python_version(),
+                                       "sqlite": __import__("sqlite3").sqlite_version, "machine": platform.machine()}
+        BASELINE.write_text(json.dumps(stored, indent=2) + "\n", encoding="utf-8")
+        print(f"Saved baseline for {args.companies:,} companies to {BASELINE.name}")
+    elif any(row[-1] for row in rows):
+        sys.exit(1)
+
+
+def bench_backends(args):
+    results = {backend: run_benchmarks(companies=args.companies, seed=args.seed, repeat=args.repeat, backend=backend)
+               for backend in ("sqlite", "duckdb")}
+    print(f"{'workload':<28}{'sqlite':>10}{'duckdb':>10}{'ratio':>8}")
+    for name, seconds in results["sqlite"].items():
+        other = results["duckdb"].get(name)
+        ratio = f"{other / seconds:.2f}" if other is not None and seconds else "-"
+        print(f"{name:<28}{seconds:>10.4f}{other if other is not None else '-':>10}{ratio:>8}")
+
+
+def bench_bulk(args):
+    import logging
+    import shutil
+    from registry import EstonianRegistry
+    logging.getLogger("registry").setLevel(logging.WARNING)
+    results = {"indexed": {}, "bulk": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        downloads = Path(tmp) / "downloads"
+        generate_registry(downloads, companies=args.companies, seed=args.seed)
+        # Alternate the modes and keep each step's best time, so neither pays for the other's leftovers
+        for run in range(args.repeat):
+            for mode in ("indexed", "bulk"):
+                data_dir = Path(tmp) / f"{mode}-{run}"
+                shutil.copytree(downloads, data_dir / "downloads")
+                reg = EstonianRegistry(data_dir=data_dir)
+                start = time.perf_counter(); report = reg.merge(force=True, bulk=mode == "bulk")
+                timings = {f["file"].split("__")[-1].split(".")[0]: f["seconds"] for f in report["files"]}
+                timings.update({step["step"]: step["seconds"] for step in report["steps"]})
+                timings["total"] = round(time.perf_counter() - start, 3)
+                for name, seconds in timings.items():
+                    results[mode][name] = min(seconds, results[mode].get(name, seconds))
+                reg.db.conn.close(); shutil.rmtree(data_dir)
+    print(f"{'step':<24}{'indexed':>10}{'bulk':>10}{'speedup':>9}")
+    for name in dict.fromkeys([*results["indexed"], *results["bulk"]]):
+        before, after = results["indexed"].get(name), results["bulk"].get(name)
+        speedup = f"{before / after:.2f}x" if before and after else "-"
+        print(f"{name:<24}{before if before is not None else '-':>10}{after if after is not None else '-':>10}{speedup:>9}")
+
+
+def bench_decoders(args):
+    import shutil
+    from registry import JSON_DECODERS, iter_json_batches, select_json_decoder
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(args.file) if args.file else generate_registry(tmp, companies=args.companies)[1]
+        with zipfile.ZipFile(path) as zf:
+            size = zf.infolist()[0].file_size
+        print(f"{path.name}: {size / 2**20:.1f} MB, auto = {select_json_decoder()}")
+        print(f"{'decoder':<16}{'items':>10}{'seconds':>10}{'items/s':>12}{'MB/s':>8}")
+        for decoder in JSON_DECODERS:
+            if decoder == "jq" and not shutil.which("jq"): continue
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                try:
+                    with zipfile.ZipFile(path) as zf, zf.open(zf.infolist()[0]) as raw:
+                        items = sum(len(batch) for batch in iter_json_batches(raw, decoder=decoder))
+                except ValueError:  # backend not installed
+                    break
+                times.append(time.perf_counter() - start)
+            if not times: continue
+            best = min(times)
+            print(f"{decoder:<16}{items:>10,}{best:>10.3f}{items / best:>12,.0f}{size / 2**20 / best:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    st = sub.add_parser("startup", help="Time CLI start-up for common commands")
+    st.add_argument("--runs", type=int, default=15)
+    gen = sub.add_parser("generate", help="Write a synthetic registry (the six open-data zips)")
+    gen.add_argument("--companies", type=int, default=10000)
+    gen.add_argument("--seed", type=int, default=1)
+    gen.add_argument("--out", default="data/downloads")
+    run = sub.add_parser("run", help="Time merge and query workloads on a synthetic registry against the baseline")
+    run.add_argument("--companies", type=int, default=10000)
+    run.add_argument("--seed", type=int, default=1)
+    run.add_argument("--repeat", type=int, default=3, help="Runs per query workload; the median is reported")
+    run.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown over the baseline (default: 0.25 = 25%%)")
+    run.add_argument("--save-baseline", action="store_true", help="Store these timings as the baseline for this scale")
+    dec = sub.add_parser("decoders", help="Compare the JSON decoders on one registry file")
+    dec.add_argument("--companies", type=int, default=20000, help="Size of the generated yldandmed file")
+    dec.add_argument("--file", help="Registry .json.zip to decode instead of a generated one")
+    dec.add_argument("--repeat", type=int, default=3, help="Runs per decoder; the fastest is reported")
+    bk = sub.add_parser("backends", help="Time merge and query workloads on SQLite and DuckDB side by side")
+    bk.add_argument("--companies", type=int, default=10000)
+    bk.add_argument("--seed", type=int, default=1)
+    bk.add_argument("--repeat", type=int, default=3, help="Runs per query workload; the median is reported")
+    bl = sub.add_parser("bulk", help="Time a full merge into an empty database with and without the bulk-load path")
+    bl.add_argument("--companies", type=int, default=50000)
+    bl.add_argument("--seed", type=int, default=1)
+    bl.add_argument("--repeat", type=int, default=2, help="Merges per mode; the fastest time of each step is reported")
+    args = parser.parse_args()
+    if args.cmd == "startup":
+        bench_startup(args)
+    elif args.cmd == "generate":
+        bench_generate(args)
+    elif args.cmd == "run":
+        bench_run(args)
+    elif args.cmd == "decoders":
+        bench_decoders(args)
+    elif args.cmd == "backends":
+        bench_backends(args)
+    elif args.cmd == "bulk":
+        bench_bulk(args)
+
+
+if __name__ == "__main__":
+    main()
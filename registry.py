@@ -4,37 +4,34 @@ Estonian Registry CLI - High Performance, Beautiful & Exhaustive
 """
 
 import argparse
+import base64
+import calendar
 import csv
 import json
 import os
 import shutil
-import subprocess
 import time
-import urllib.request
-import zipfile
 import io
 import re
 import sqlite3
 import sys
+import unicodedata
 from pathlib import Path
 from threading import Thread, Lock
-from pypdf import PdfReader
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from functools import lru_cache
+from contextlib import contextmanager, nullcontext
+from itertools import groupby, islice
 from datetime import datetime
 import logging
+import importlib.util
 from abc import ABC, abstractmethod
 
-from difflib import get_close_matches
 
+# Only the console is imported eagerly; pypdf, the rich widgets, asyncio, urllib and the
+# decoders are imported inside the commands that use them to keep CLI start-up short
 from rich.console import Console
-from rich.table import Table
-from rich.panel import Panel
-from rich.text import Text
-from rich.tree import Tree
-from rich.columns import Columns
 from rich.theme import Theme
-from rich.syntax import Syntax
-from rich import box
 
 # ============================================================
 # Logging & Translation
@@ -174,6 +171,8 @@ VALUE_TRANSLATIONS = {
     "Kapitali muutmise kanne": "Capital change entry",
     "Ärinime muutmise kanne": "Name change entry",
     "Asutamiskanne": "Founding entry",
+    "Likvideerimiskanne": "Liquidation entry",
+    "Pankrotikanne": "Bankruptcy entry",
     "Elektronposti aadress": "Email address",
     "Mobiiltelefon": "Mobile phone",
     "Telefon": "Telephone",
@@ -258,6 +257,7 @@ def resolve_industry(name):
     if key in INDUSTRY_MAP:
         return INDUSTRY_MAP[key]
     # Try close matches
+    from difflib import get_close_matches
     matches = get_close_matches(key, INDUSTRY_MAP.keys(), n=3, cutoff=0.6)
     if matches:
         console.print(f"[warning]Unknown industry '{name}'. Did you mean: {', '.join(matches)}?[/warning]")
@@ -265,6 +265,122 @@ def resolve_industry(name):
     console.print(f"[warning]Unknown industry '{name}'. Use --list-industries to see available options.[/warning]")
     return None
 
+# Legal-form words dropped before name matching ("Bolt Technology OÜ" ~ "bolt technology")
+LEGAL_FORM_TOKENS = {
+    "ou", "as", "mtu", "fie", "tu", "uu", "sa", "tuh", "ouhistu", "osauhing", "aktsiaselts",
+    "mittetulundusuhing", "taisuhing", "usaldusuhing", "sihtasutus", "tulundusuhistu", "filiaal",
+}
+_NAME_PHRASE_RE = re.compile(r"\bfuusilisest isikust ettevotja\b|\beuroopa aktsiaselts\b")
+_NAME_PUNCT_RE = re.compile(r"[^\w\s]|_")
+
+def fold_text(text):
+    """Casefold and strip diacritics: "Põltsamaa" -> "poltsamaa"."""
+    return "".join(ch for ch in unicodedata.normalize("NFKD", text.casefold()) if not unicodedata.combining(ch))
+
+def normalize_name(name):
+    """Casefold, strip diacritics, punctuation and legal-form words from a company name."""
+    if not name: return ""
+    text = fold_text(name)
+    words = _NAME_PUNCT_RE.sub(" ", _NAME_PHRASE_RE.sub(" ", text)).split()
+    kept = [w for w in words if w not in LEGAL_FORM_TOKENS]
+    return " ".join(kept or words)
+
+def normalize_person_name(name):
+    """fold_text() without punctuation, words sorted: "TAMM, Mari-Liis" -> "liis mari tamm"."""
+    if not name: return ""
+    return " ".join(sorted(_NAME_PUNCT_RE.sub(" ", fold_text(name)).split()))
+
+def name_trigrams(norm):
+    """Word-padded character trigrams of a normalized name, as in pg_trgm."""
+    grams = set()
+    for word in norm.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+# EHAK (administrative and settlement units) levels, largest first, and the companies column for each
+LOCATION_LEVELS = {1: "county_id", 2: "municipality_id", 3: "settlement_id"}
+# Unit words dropped when matching user input, so "Harju" finds "Harju maakond" (after fold_text)
+EHAK_UNIT_WORDS = {"maakond", "vald", "linn", "linnaosa", "alev", "alevik", "kula", "asum"}
+
+def parse_ehak(text):
+    """Split an EHAK description, smallest unit first, into (county, municipality, settlement).
+
+    "Kesklinna linnaosa, Tallinn, Harju maakond" -> ("Harju maakond", "Tallinn", "Kesklinna linnaosa").
+    Missing levels are None.
+    """
+    parts = [p.strip() for p in (text or "").split(",") if p.strip()]
+    county = parts.pop() if parts and "maakond" in parts[-1] else None
+    municipality = parts.pop() if parts else None
+    return county, municipality, ", ".join(parts) or None
+
+def normalize_location(name):
+    """fold_text() without hyphens and unit words: "Ida-Viru maakond" -> "ida viru"."""
+    words = fold_text(name or "").replace("-", " ").split()
+    return " ".join([w for w in words if w not in EHAK_UNIT_WORDS] or words)
+
+# Canonical company status codes: (registry letter, Estonian label, English label, other spellings)
+STATUS_CODES = {
+    "active": ("R", "Registrisse kantud", "Entered into register", ("aktiivne", "registered")),
+    "liquidating": ("L", "Likvideerimisel", "In liquidation", ("likvideerimine", "liquidation")),
+    "bankrupt": ("N", "Pankrotis", "Bankrupt", ("pankrot", "bankruptcy")),
+    "deleted": ("K", "Kustutatud", "Deleted", ("Registrist kustutatud", "Deleted from register", "kustutatud registrist")),
+    "warning": (None, "Hoiatuskandega", "With warning entry", ("hoiatus", "warning entry")),
+}
+STATUS_HELP = "Status: active, liquidating, bankrupt, deleted or warning; Estonian and English labels also work"
+# Folded code, letter, label or alias -> canonical code
+STATUS_LOOKUP = {fold_text(name): code for code, (letter, et, en, aliases) in STATUS_CODES.items()
+                 for name in (code, letter, et, en, *aliases) if name}
+
+def status_code(text):
+    """Canonical status code for a registry status label or letter ("Pankrotis", "N" -> "bankrupt"); None if unknown."""
+    folded = fold_text(text or "")
+    if not folded: return None
+    if folded in STATUS_LOOKUP: return STATUS_LOOKUP[folded]
+    # Longest contained name, so "Registrist kustutatud (...)" is deleted rather than active
+    hits = [name for name in STATUS_LOOKUP if len(name) > 1 and name in folded]
+    return STATUS_LOOKUP[max(hits, key=len)] if hits else None
+
+def resolve_status(text):
+    """Canonical codes for a user's status filter, in Estonian or English, full or partial.
+
+    "pankrotis", "bankrupt" and "N" give ["bankrupt"]; "Likvid" matches as a prefix, like the old LIKE filter.
+    An empty list means the input names no known status.
+    """
+    folded = fold_text(text or "")
+    if not folded: return []
+    if folded in STATUS_LOOKUP: return [STATUS_LOOKUP[folded]]
+    return sorted({code for name, code in STATUS_LOOKUP.items() if len(name) > 1 and folded in name})
+
+# Registry-card entry kinds, with the folded stems of the Estonian kandeliik_tekstina that mark each
+EVENT_TYPES = {"registration": ("esmakanne", "asutamiskanne"), "amendment": ("muutmiskanne",), "liquidation": ("likvideeri",),
+               "bankruptcy": ("pankrot",), "deletion": ("kustuta", "lopetamiskanne"), "merger": ("uhinemi",), "division": ("jagunemi",)}
+EVENT_HELP = f"Entry type: {', '.join(EVENT_TYPES)}, or an Estonian entry type such as Pankrotikanne"
+
+@lru_cache(maxsize=1024)
+def event_kind(text):
+    """Canonical kind of a registry-card entry type ("Pankrotikanne" -> "bankruptcy"); None for other entries."""
+    folded = fold_text(text or "")
+    return next((kind for kind, stems in EVENT_TYPES.items() if any(stem in folded for stem in stems)), None)
+
+def resolve_event_type(text):
+    """Event kind for a user's entry type filter ("bankrupt", "pankrot", "Likvideerimiskanne"); None if unknown."""
+    folded = fold_text(text or "").strip()
+    if len(folded) < 3: return None
+    return next((kind for kind, stems in EVENT_TYPES.items()
+                 if kind.startswith(folded) or any(stem.startswith(folded) for stem in stems)), None) or event_kind(folded)
+
+def period_range(period):
+    """(first, last) ISO dates of a period given as "2024", "2024-Q3" or "2024-07"."""
+    m = re.fullmatch(r"(\d{4})(?:-[Qq]([1-4])|-(\d{1,2}))?", (period or "").strip())
+    if not m or (m[3] and not 1 <= int(m[3]) <= 12):
+        raise ValueError(f"Invalid period: {period} (use 2024, 2024-Q3 or 2024-07)")
+    year = int(m[1])
+    if m[2]: first, last = int(m[2]) * 3 - 2, int(m[2]) * 3
+    elif m[3]: first = last = int(m[3])
+    else: first, last = 1, 12
+    return f"{year}-{first:02d}-01", f"{year}-{last:02d}-{calendar.monthrange(year, last)[1]:02d}"
+
 UI_LABELS = {
     "et": {
         "dossier": "Toimik", "core": "Põhiandmed", "enrichment": "PDF-i lisandmed", "general": "Üldatribuudid",
@@ -278,10 +394,11 @@ UI_LABELS = {
         "activities": "Tegevusalad", "reports": "Majandusaasta aruanded", "contacts": "Sidevahendid", "period_end": "Perioodi lõpp",
         "employees": "Töötajad", "activity": "Tegevusala", "main": "Põhitegevus", "date": "Kuupäev", "entry_type": "Kande liik",
         "entry_num": "Nr", "portal_link": "Link registrisse", "privacy_note": "* Eraisikute isikukoodid on avaandmetes peidetud (hash). PDF-i rikastamine unmaskib need.",
-        "results_found": "Leitud tulemusi", "no_results": "Tulemusi ei leitud.",
+        "results_found": "Leitud tulemusi", "no_results": "Tulemusi ei leitud.", "next_page": "Järgmine lehekülg",
         "analysis_title": "Analüüs", "rank": "Nr", "group": "Grupp", "count": "Arv", "pct": "Osakaal",
-        "analysis_by": {"county": "maakond", "status": "staatus", "legal-form": "õiguslik vorm", "emtak": "EMTAK kood", "year": "asutamisaasta",
-                        "capital-range": "kapitalivahemik", "employee-range": "tootajate vahemik", "role": "roll", "country": "riik"},
+        "analysis_by": {"county": "maakond", "municipality": "omavalitsus", "settlement": "asustusüksus", "status": "staatus", "legal-form": "õiguslik vorm", "emtak": "EMTAK kood", "year": "asutamisaasta",
+                        "capital-range": "kapitalivahemik", "employee-range": "tootajate vahemik", "role": "roll", "country": "riik",
+                        "type": "kande liik", "month": "kuu", "entry-year": "kande aasta"},
     },
     "en": {
         "dossier": "Dossier", "core": "Core Identity", "enrichment": "Live PDF Enrichment", "general": "General Attributes",
@@ -295,32 +412,73 @@ UI_LABELS = {
         "activities": "Activities", "reports": "Annual Reports", "contacts": "Contacts", "period_end": "Period End",
         "employees": "Employees", "activity": "Activity", "main": "Main", "date": "Date", "entry_type": "Entry Type",
         "entry_num": "Number", "portal_link": "Portal Link", "privacy_note": "* Personal ID codes for individuals are hashed in open data. PDF enrichment unmasks them.",
-        "results_found": "Found results", "no_results": "No results found.",
+        "results_found": "Found results", "no_results": "No results found.", "next_page": "Next page",
         "analysis_title": "Analysis", "rank": "Rank", "group": "Group", "count": "Count", "pct": "Share",
-        "analysis_by": {"county": "County", "status": "Status", "legal-form": "Legal Form", "emtak": "EMTAK Code", "year": "Founding Year",
-                        "capital-range": "Capital Range", "employee-range": "Employee Range", "role": "Person Role", "country": "Beneficiary Country"},
+        "analysis_by": {"county": "County", "municipality": "Municipality", "settlement": "Settlement", "status": "Status", "legal-form": "Legal Form", "emtak": "EMTAK Code", "year": "Founding Year",
+                        "capital-range": "Capital Range", "employee-range": "Employee Range", "role": "Person Role", "country": "Beneficiary Country",
+                        "type": "Entry Type", "month": "Month", "entry-year": "Entry Year"},
     }
 }
 
+# Precompiled lookups for the translator: full "English (Estonian)" labels, and a regex that
+# finds values containing a translatable comma-separated part without splitting every string
+_VALUE_LABELS = {k: f"{v} ({k})" for k, v in VALUE_TRANSLATIONS.items()}
+_VALUE_PART_RE = re.compile(r"(?:^|,)\s*(?:" + "|".join(re.escape(k) for k in sorted(VALUE_TRANSLATIONS, key=len, reverse=True)) + r")\s*(?:,|$)")
+
+@lru_cache(maxsize=4096)
+def _translate_compound(val):
+    parts = [p.strip() for p in val.split(",")]
+    return f"{', '.join(VALUE_TRANSLATIONS.get(p, p) for p in parts)} ({val})"
+
+def _translate_str(val):
+    label = _VALUE_LABELS.get(val)
+    if label is not None: return label
+    if ", " in val and _VALUE_PART_RE.search(val): return _translate_compound(val)
+    return val
+
 def translate_value(val, to_en=False):
     if not to_en or not isinstance(val, str): return val
-    if val in VALUE_TRANSLATIONS: return f"{VALUE_TRANSLATIONS[val]} ({val})"
-    if ", " in val:
-        parts = [VALUE_TRANSLATIONS.get(p.strip(), p.strip()) for p in val.split(",")]
-        if any(p in VALUE_TRANSLATIONS for p in [x.strip() for x in val.split(",")]): return f"{', '.join(parts)} ({val})"
-    return val
+    return _translate_str(val)
+
+def _translate_node(item, _key=TRANSLATIONS.get, _label=_VALUE_LABELS.get):
+    # Hot path of every English export: string values are resolved inline rather than via
+    # _translate_str(), which only runs for the few values containing ", "
+    if isinstance(item, dict):
+        out = {}
+        for k, v in item.items():
+            if type(v) is str:
+                label = _label(v)
+                if label is not None: v = label
+                elif ", " in v: v = _translate_str(v)
+            elif isinstance(v, (dict, list)):
+                v = _translate_node(v)
+            out[_key(k, k)] = v
+        return out
+    if isinstance(item, list):
+        return [_translate_str(v) if type(v) is str else _translate_node(v) if isinstance(v, (dict, list)) else v for v in item]
+    if isinstance(item, str): return _translate_str(item)
+    return item
 
 def translate_item(item, to_en=False):
     if not to_en: return item
-    if isinstance(item, list): return [translate_item(i, True) for i in item]
-    if isinstance(item, dict): return {TRANSLATIONS.get(k, k): translate_item(v, True) for k, v in item.items()}
-    if isinstance(item, str): return translate_value(item, True)
-    return item
+    return _translate_node(item)
 
 # ============================================================
 # Database Interfaces & Backends
 # ============================================================
 
+def encode_cursor(**key):
+    """Opaque continuation token holding the sort key of the last row of a page."""
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":"), ensure_ascii=False).encode()).decode().rstrip("=")
+
+def decode_cursor(token):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except ValueError:
+        key = None
+    if not isinstance(key, dict): raise ValueError(f"Invalid cursor: {token}")
+    return key
+
 class RegistryBackend(ABC):
     @abstractmethod
     def insert_batch_base(self, batch): pass
@@ -337,64 +495,104 @@ class RegistryBackend(ABC):
     @abstractmethod
     def mark_file_status(self, filename: str, status: str): pass
     @abstractmethod
-    def get_stats(self): pass
-    @abstractmethod
     def commit(self): pass
 
-class SQLiteBackend(RegistryBackend):
-    def __init__(self, db_path: Path):
-        self.db_path = db_path
-        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
-        self.conn.execute("PRAGMA journal_mode=WAL")
-        self.conn.row_factory = sqlite3.Row
-        self._create_tables()
+    # Optional MergeMetrics; the batch writers split their time into encode and write stages
+    metrics = None
+    # (level, parent_id, name) -> locations.id, and resolve_location() results; loaded on first use
+    _location_ids_cache = None
+    _resolved_locations = None
+    # Case-insensitive LIKE operator of the SQL dialect (SQLite's LIKE already folds ASCII case)
+    LIKE = "LIKE"
 
-    def _create_tables(self):
-        with self.conn:
-            self.conn.execute("""
-                CREATE TABLE IF NOT EXISTS companies (
-                    code INTEGER PRIMARY KEY, name TEXT, status TEXT, maakond TEXT, linn TEXT,
-                    legal_form TEXT, founded_at TEXT, full_data JSON DEFAULT '{}', enrichment JSON
-                )
-            """)
-            self.conn.execute("CREATE TABLE IF NOT EXISTS sync_state (filename TEXT PRIMARY KEY, status TEXT)")
-            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_name ON companies(name)")
-            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_legal_form ON companies(legal_form)")
-            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_status ON companies(status)")
-            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_founded_at ON companies(founded_at)")
-            # New columns (Phase 1)
-            existing = {r[1] for r in self.conn.execute("PRAGMA table_info(companies)").fetchall()}
-            new_cols = [
-                ("capital", "REAL"), ("capital_currency", "TEXT"), ("email", "TEXT"),
-                ("phone", "TEXT"), ("website", "TEXT"), ("employee_count", "INTEGER"),
-                ("vat_number", "TEXT"),
-            ]
-            for col, ctype in new_cols:
-                if col not in existing:
-                    self.conn.execute(f"ALTER TABLE companies ADD COLUMN {col} {ctype}")
-            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_capital ON companies(capital)")
-            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_employee_count ON companies(employee_count)")
-            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_vat_number ON companies(vat_number)")
-            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_email ON companies(email)")
-            # Persons denormalization table
-            self.conn.execute("""
-                CREATE TABLE IF NOT EXISTS persons (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    company_code INTEGER NOT NULL,
-                    source TEXT NOT NULL,
-                    first_name TEXT, last_name TEXT, full_name TEXT,
-                    id_code TEXT, id_hash TEXT,
-                    role TEXT, start_date TEXT, end_date TEXT,
-                    ownership_pct REAL, contribution_amount REAL, currency TEXT,
-                    country TEXT,
-                    FOREIGN KEY (company_code) REFERENCES companies(code)
-                )
-            """)
-            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_persons_name ON persons(full_name)")
-            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_persons_id_code ON persons(id_code)")
-            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_persons_company ON persons(company_code)")
-            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_persons_source ON persons(source)")
-            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_persons_role ON persons(role)")
+    # Helpers shared by the backends: parsing of registry items and the filters built from them
+
+    def _stage(self, name):
+        return self.metrics.stage(name) if self.metrics is not None else nullcontext()
+
+    def bulk_load(self):
+        """Context for loading a whole registry into empty tables (see SQLiteBackend.bulk_load())."""
+        return nullcontext()
+
+    def is_empty(self):
+        return self._query("is_empty", "SELECT 1 FROM companies LIMIT 1").fetchone() is None
+
+    def revisions(self, codes, chunk_size=500):
+        """{code: revision} for the given codes that exist; revision counts enrichments of a company."""
+        return dict(self._query_in("revisions", "SELECT code, revision FROM companies WHERE code IN ({marks})", codes, chunk_size))
+
+    def _query_in(self, label, query, values, chunk_size=500):
+        """Rows of query, whose {marks} is an IN list, run over values chunk_size at a time."""
+        values = list(values)
+        for i in range(0, len(values), chunk_size):
+            chunk = values[i:i + chunk_size]
+            yield from self._query(label, query.replace("{marks}", ",".join("?" * len(chunk))), chunk)
+
+    def resolve_location(self, text):
+        """{level: [location ids]} for user input such as "tartu", "Ida-Viru" or "Johvi vald".
+
+        Matches the normalized name exactly, else as a substring, else the closest names (typos).
+        A match at any level covers everything below it, through that level's companies column.
+        """
+        if self._resolved_locations is None: self._resolved_locations = {}
+        if text in self._resolved_locations: return self._resolved_locations[text]
+        from difflib import get_close_matches
+        norm = normalize_location(text)
+        places = self._query("locations", "SELECT id, level, norm FROM locations").fetchall()
+        hits = [p for p in places if p[2] == norm] or [p for p in places if norm and norm in p[2]]
+        if not hits and norm:
+            close = set(get_close_matches(norm, {p[2] for p in places}, n=3, cutoff=0.8))
+            hits = [p for p in places if p[2] in close]
+        resolved = defaultdict(list)
+        for loc_id, level, _ in hits: resolved[level].append(loc_id)
+        self._resolved_locations[text] = dict(resolved)
+        return self._resolved_locations[text]
+
+    def _location_ids(self, ehak_text, ehak_code=None):
+        """(county_id, municipality_id, settlement_id) for an EHAK description, adding unseen places."""
+        if self._location_ids_cache is None:
+            self._location_ids_cache = {(level, parent, name): loc_id for loc_id, level, parent, name
+                                        in self.conn.execute("SELECT id, level, parent_id, name FROM locations").fetchall()}
+        names = parse_ehak(ehak_text); smallest = max((lvl for lvl, n in enumerate(names, 1) if n), default=0)
+        ids = []; parent = None
+        for level, name in enumerate(names, 1):
+            if not name: ids.append(None); continue
+            loc_id = self._location_ids_cache.get((level, parent, name))
+            if loc_id is None:
+                loc_id = self._add_location(level, parent, name, ehak_code if level == smallest else None)
+                self._location_ids_cache[(level, parent, name)] = loc_id; self._resolved_locations = None
+            ids.append(loc_id); parent = loc_id
+        return tuple(ids)
+
+    def _location_clause(self, alias, location):
+        """Indexed equality filter on the location id columns; matches nothing for an unknown place."""
+        resolved = self.resolve_location(location); parts = []; params = []
+        for level, ids in sorted(resolved.items()):
+            parts.append(f"{alias}.{LOCATION_LEVELS[level]} IN ({','.join('?' * len(ids))})"); params.extend(ids)
+        return (f"({' OR '.join(parts)})" if parts else "0"), params
+
+    def _status_clause(self, alias, status):
+        """Indexed filter on status_code for a known status; LIKE on the status label otherwise."""
+        codes = resolve_status(status)
+        if codes: return f"{alias}.status_code IN ({','.join('?' * len(codes))})", codes
+        return f"{alias}.status {self.LIKE} ?", [f"%{status}%"]
+
+    def _emtak_clause(self, alias, emtak):
+        """EXISTS filter for companies with an activity whose EMTAK code starts with any of emtak."""
+        emtak = emtak if isinstance(emtak, list) else [emtak]
+        source, on, item = self._activities(alias, "e")
+        placeholders = " OR ".join([f"{item['code']} LIKE ?"] * len(emtak))
+        return f"EXISTS (SELECT 1 FROM {source} WHERE {on} AND ({placeholders}))", [f"{e}%" for e in emtak]
+
+    # Dialect hooks: where the reported activities and annual reports of company alias live. Each
+    # returns (FROM item named name, condition tying it to alias, {field: SQL expression}).
+    @abstractmethod
+    def _activities(self, alias, name): pass
+    @abstractmethod
+    def _annual_reports(self, alias, name): pass
+    @abstractmethod
+    def _person_clause(self, alias, person):
+        """(clause, params) matching companies that mention person anywhere in the dossier."""
 
     @staticmethod
     def _normalize_date(date_str):
@@ -406,19 +604,12 @@ class SQLiteBackend(RegistryBackend):
 
     @staticmethod
     def _extract_county(item):
-        ehak = item.get('asukoha_ehak_tekstina', '') or ''
-        parts = [p.strip() for p in ehak.split(',')]
-        for p in reversed(parts):
-            if 'maakond' in p: return p
-        return parts[-1] if parts and parts[-1] else None
+        return parse_ehak(item.get('asukoha_ehak_tekstina'))[0]
 
     @staticmethod
     def _extract_city(item):
-        ehak = item.get('asukoha_ehak_tekstina', '') or ''
-        parts = [p.strip() for p in ehak.split(',')]
-        for p in parts:
-            if 'linn' in p or 'vald' in p: return p
-        return parts[1] if len(parts) > 1 else (parts[0] if parts and parts[0] else None)
+        # The municipality: "Tallinn" for its districts, "Tartu linn", "Harku vald"
+        return parse_ehak(item.get('asukoha_ehak_tekstina'))[1]
 
     @staticmethod
     def _extract_latest_capital(item):
@@ -471,129 +662,191 @@ class SQLiteBackend(RegistryBackend):
                     pass
         return None
 
-    def insert_batch_base(self, batch):
-        with self.conn:
-            self.conn.executemany(
-                """INSERT OR REPLACE INTO companies
-                   (code, name, status, maakond, linn, legal_form, founded_at, full_data, vat_number)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                [(i.get('ariregistri_kood'), i.get('nimi'), i.get('ettevotja_staatus_tekstina'),
-                  self._extract_county(i), self._extract_city(i),
-                  i.get('ettevotja_oiguslik_vorm'), self._normalize_date(i.get('ettevotja_esmakande_kpv')),
-                  json.dumps(i), i.get('kmkr_nr') or None) for i in batch]
-            )
+    @staticmethod
+    def _extract_main_emtak(item):
+        activities = item.get('yldandmed', {}).get('teatatud_tegevusalad', [])
+        main = next((a for a in activities if a.get('on_pohitegevusala')), activities[0] if activities else None)
+        return (main.get('emtak_kood') or None) if main else None
 
-    def update_batch_json(self, key, data_map):
-        with self.conn:
-            self.conn.executemany(
-                "UPDATE companies SET full_data = json_set(full_data, ?, json(?)) WHERE code = ?",
-                [(f"$.{key}", json.dumps(val), code) for code, val in data_map.items()]
-            )
+    @staticmethod
+    def _section_entries(data, key, *aliases):
+        """Entries (persons, registry cards) of a dossier section, however it is nested.
 
-    def update_batch_general(self, batch):
-        with self.conn:
-            for item in batch:
-                code = item.get('ariregistri_kood')
-                if not code: continue
-                self.conn.execute("UPDATE companies SET full_data = json_patch(full_data, ?) WHERE code = ?", (json.dumps(item), code))
-                updates = []; params = []
-                status = item.get('staatus_tekstina')
-                if status: updates.append("status = COALESCE(?, status)"); params.append(status)
-                founded = self._normalize_date(item.get('esmaregistreerimise_kpv'))
-                if founded: updates.append("founded_at = COALESCE(?, founded_at)"); params.append(founded)
-                # Extract new derived columns
-                cap_amt, cap_cur = self._extract_latest_capital(item)
-                if cap_amt is not None:
-                    updates.append("capital = ?"); params.append(cap_amt)
-                    updates.append("capital_currency = ?"); params.append(cap_cur)
-                email, phone, website = self._extract_contacts(item)
-                if email: updates.append("email = ?"); params.append(email)
-                if phone: updates.append("phone = ?"); params.append(phone)
-                if website: updates.append("website = ?"); params.append(website)
-                emp = self._extract_latest_employees(item)
-                if emp is not None: updates.append("employee_count = ?"); params.append(emp)
-                if updates:
-                    params.append(code)
-                    self.conn.execute(f"UPDATE companies SET {', '.join(updates)} WHERE code = ?", params)
+        merge() stores each company's value from a section file, usually the list of entries,
+        so a section is a list of lists; older dossiers hold {key: [...]} groups or bare entries.
+        """
+        for k in (key, *aliases):
+            for group in data.get(k) or []:
+                if isinstance(group, list): yield from (e for e in group if isinstance(e, dict))
+                elif isinstance(group, dict):
+                    inner = group.get(key)
+                    if isinstance(inner, list): yield from (e for e in inner if isinstance(e, dict))
+                    else: yield group
 
-    def update_enrichment(self, code: int, enrichment: dict):
-        with self.conn: self.conn.execute("UPDATE companies SET enrichment = ? WHERE code = ?", (json.dumps(enrichment), code))
+    @classmethod
+    def _event_rows(cls, code, data):
+        """registry_events rows for the entries (kanded) on a dossier's registry cards."""
+        for card in cls._section_entries(data, 'registrikaardid', 'kaardid'):
+            for entry in card.get('kanded') or []:
+                if not isinstance(entry, dict): continue
+                entry_type = entry.get('kandeliik_tekstina')
+                yield (code, cls._normalize_date(entry.get('kpv')), entry_type, event_kind(entry_type), entry.get('kande_nr'))
 
-    def search(self, term=None, person=None, location=None, status=None, limit=None,
-               emtak=None, founded_after=None, founded_before=None, legal_form=None,
-               min_capital=None, max_capital=None, has_email=False, has_phone=False, has_website=False):
-        query = "SELECT * FROM companies WHERE 1=1"; params = []
+    @classmethod
+    def _person_rows(cls, code, data):
+        """persons rows (company_code, source, ..., country) for the board, shareholders and beneficiaries of a dossier."""
+        # Board members from kaardile_kantud_isikud
+        for p in cls._section_entries(data, 'kaardile_kantud_isikud', 'isikud'):
+            first = p.get('eesnimi', '')
+            last = p.get('nimi_arinimi', '')
+            full = f"{first} {last}".strip()
+            yield (code, 'board', first or None, last or None, full or None,
+                   str(p.get('isikukood_registrikood') or '') or None,
+                   p.get('isikukood_hash'),
+                   p.get('isiku_roll_tekstina'),
+                   p.get('algus_kpv'), p.get('lopp_kpv'),
+                   None, None, None, None)
+        # Shareholders from osanikud
+        for s in cls._section_entries(data, 'osanikud'):
+            first = s.get('eesnimi', '')
+            last = s.get('nimi_arinimi', '')
+            full = f"{first} {last}".strip()
+            pct = s.get('osaluse_protsent')
+            amt = s.get('osamaksu_summa') or s.get('osaluse_suurus')
+            cur = s.get('valuuta') or s.get('osaluse_valuuta')
+            try: pct = float(pct) if pct else None
+            except (TypeError, ValueError): pct = None
+            try: amt = float(amt) if amt else None
+            except (TypeError, ValueError): amt = None
+            yield (code, 'shareholder', first or None, last or None, full or None,
+                   str(s.get('isikukood_registrikood') or '') or None,
+                   s.get('isikukood_hash'),
+                   s.get('osaluse_omandiliik_tekstina'),
+                   s.get('algus_kpv'), s.get('lopp_kpv'),
+                   pct, amt, cur, None)
+        # Beneficiaries from kasusaajad
+        for b in cls._section_entries(data, 'kasusaajad'):
+            first = b.get('eesnimi', '')
+            last = b.get('nimi', '')
+            full = f"{first} {last}".strip()
+            yield (code, 'beneficiary', first or None, last or None, full or None,
+                   str(b.get('isikukood_registrikood') or '') or None,
+                   b.get('isikukood_hash'),
+                   b.get('kontrolli_teostamise_viis_tekstina'),
+                   None, None, None, None, None,
+                   b.get('aadress_riik_tekstina'))
+
+    def get_stats(self):
+        total = self._query("stats", "SELECT COUNT(*) FROM companies").fetchone()[0]
+        enriched = self._query("stats", "SELECT COUNT(*) FROM companies WHERE enrichment IS NOT NULL").fetchone()[0]
+        has_status = self._query("stats", "SELECT COUNT(*) FROM companies WHERE status IS NOT NULL").fetchone()[0]
+        has_county = self._query("stats", "SELECT COUNT(*) FROM companies WHERE maakond IS NOT NULL").fetchone()[0]
+        has_founded = self._query("stats", "SELECT COUNT(*) FROM companies WHERE founded_at IS NOT NULL").fetchone()[0]
+        has_emtak = self._query("stats", "SELECT COUNT(*) FROM companies WHERE main_emtak IS NOT NULL").fetchone()[0]
+        has_capital = self._query("stats", "SELECT COUNT(*) FROM companies WHERE capital IS NOT NULL").fetchone()[0]
+        has_email = self._query("stats", "SELECT COUNT(*) FROM companies WHERE email IS NOT NULL").fetchone()[0]
+        has_phone = self._query("stats", "SELECT COUNT(*) FROM companies WHERE phone IS NOT NULL").fetchone()[0]
+        has_website = self._query("stats", "SELECT COUNT(*) FROM companies WHERE website IS NOT NULL").fetchone()[0]
+        has_employees = self._query("stats", "SELECT COUNT(*) FROM companies WHERE employee_count IS NOT NULL").fetchone()[0]
+        has_vat = self._query("stats", "SELECT COUNT(*) FROM companies WHERE vat_number IS NOT NULL").fetchone()[0]
+        persons_count = 0
+        try:
+            persons_count = self._query("stats", "SELECT COUNT(*) FROM persons").fetchone()[0]
+        except sqlite3.OperationalError:
+            pass
+        top_counties = self._query("stats", "SELECT maakond, COUNT(*) AS cnt FROM companies WHERE maakond IS NOT NULL GROUP BY maakond ORDER BY cnt DESC LIMIT 5").fetchall()
+        top_legal = self._query("stats", "SELECT legal_form, COUNT(*) AS cnt FROM companies WHERE legal_form IS NOT NULL GROUP BY legal_form ORDER BY cnt DESC LIMIT 5").fetchall()
+        return {
+            "total": total, "enriched": enriched,
+            "has_status": has_status, "has_county": has_county, "has_founded": has_founded, "has_emtak": has_emtak,
+            "has_capital": has_capital, "has_email": has_email, "has_phone": has_phone, "has_website": has_website,
+            "has_employees": has_employees, "has_vat": has_vat, "persons_count": persons_count,
+            "top_counties": [(r[0], r[1]) for r in top_counties],
+            "top_legal": [(r[0], r[1]) for r in top_legal],
+        }
+
+    def _company_filters(self, alias="companies", term=None, person=None, location=None, status=None,
+                         emtak=None, founded_after=None, founded_before=None, legal_form=None,
+                         min_capital=None, max_capital=None, has_email=False, has_phone=False, has_website=False,
+                         min_employees=None, max_employees=None, code_range=None, codes=None, after=None):
+        """WHERE fragments and params for the company filters shared by search() and the exporters."""
+        a = alias; clauses = []; params = []
+        if after is not None: clauses.append(f"{a}.code > ?"); params.append(int(after))
+        if code_range:
+            lo, hi = code_range
+            if lo is not None: clauses.append(f"{a}.code >= ?"); params.append(lo)
+            if hi is not None: clauses.append(f"{a}.code < ?"); params.append(hi)
+        if codes is not None:
+            clauses.append(f"{a}.code IN ({','.join('?' * len(codes)) or 'NULL'})"); params.extend(int(c) for c in codes)
         if term:
-            if term.isdigit(): query += " AND code = ?"; params.append(int(term))
-            else: query += " AND name LIKE ?"; params.append(f"%{term}%")
-        if location: query += " AND (maakond LIKE ? OR linn LIKE ?)"; params.extend([f"%{location}%", f"%{location}%"])
-        if status: query += " AND (status LIKE ? OR full_data LIKE ?)"; params.extend([f"%{status}%", f"%{status}%"])
-        if person: query += " AND (full_data LIKE ? OR enrichment LIKE ?)"; params.extend([f"%{person}%", f"%{person}%"])
+            if term.isdigit(): clauses.append(f"{a}.code = ?"); params.append(int(term))
+            else: clauses.append(f"{a}.name {self.LIKE} ?"); params.append(f"%{term}%")
+        if location:
+            clause, ids = self._location_clause(a, location); clauses.append(clause); params.extend(ids)
+        if status:
+            clause, values = self._status_clause(a, status); clauses.append(clause); params.extend(values)
+        if person:
+            clause, values = self._person_clause(a, person); clauses.append(clause); params.extend(values)
         if emtak:
-            if isinstance(emtak, list):
-                placeholders = " OR ".join(["json_extract(e.value, '$.emtak_kood') LIKE ?"] * len(emtak))
-                query += f""" AND EXISTS (SELECT 1 FROM json_each(companies.full_data, '$.yldandmed.teatatud_tegevusalad') AS e
-                             WHERE {placeholders})"""
-                params.extend([f"{e}%" for e in emtak])
-            else:
-                query += """ AND EXISTS (SELECT 1 FROM json_each(companies.full_data, '$.yldandmed.teatatud_tegevusalad') AS e
-                             WHERE json_extract(e.value, '$.emtak_kood') LIKE ?)"""
-                params.append(f"{emtak}%")
-        if founded_after: query += " AND founded_at >= ?"; params.append(founded_after)
-        if founded_before: query += " AND founded_at <= ?"; params.append(founded_before)
-        if legal_form: query += " AND legal_form LIKE ?"; params.append(f"%{legal_form}%")
-        if min_capital is not None: query += " AND capital >= ?"; params.append(float(min_capital))
-        if max_capital is not None: query += " AND capital <= ?"; params.append(float(max_capital))
-        if has_email: query += " AND email IS NOT NULL"
-        if has_phone: query += " AND phone IS NOT NULL"
-        if has_website: query += " AND website IS NOT NULL"
-        if limit: query += f" LIMIT {int(limit)}"
-        for row in self.conn.execute(query, params):
-            data = json.loads(row['full_data'])
-            if row['enrichment']: data['enrichment'] = json.loads(row['enrichment'])
-            yield data
+            clause, values = self._emtak_clause(a, emtak); clauses.append(clause); params.extend(values)
+        if founded_after: clauses.append(f"{a}.founded_at >= ?"); params.append(founded_after)
+        if founded_before: clauses.append(f"{a}.founded_at <= ?"); params.append(founded_before)
+        if legal_form: clauses.append(f"{a}.legal_form {self.LIKE} ?"); params.append(f"%{legal_form}%")
+        if min_capital is not None: clauses.append(f"{a}.capital >= ?"); params.append(float(min_capital))
+        if max_capital is not None: clauses.append(f"{a}.capital <= ?"); params.append(float(max_capital))
+        if has_email: clauses.append(f"{a}.email IS NOT NULL")
+        if has_phone: clauses.append(f"{a}.phone IS NOT NULL")
+        if has_website: clauses.append(f"{a}.website IS NOT NULL")
+        # Same semantics as filter_by_employees(): unknown counts fail a minimum but pass a maximum
+        if min_employees is not None: clauses.append(f"{a}.employee_count >= ?"); params.append(int(min_employees))
+        if max_employees is not None: clauses.append(f"({a}.employee_count IS NULL OR {a}.employee_count <= ?)"); params.append(int(max_employees))
+        return clauses, params
+
+    def search_page(self, limit=50, cursor=None, **filters):
+        """One page of search() in code order and the cursor for the next page (None after the last)."""
+        after = decode_cursor(cursor)["code"] if cursor else None; limit = max(int(limit), 1)
+        items = list(self.search(limit=limit + 1, after=after, ordered=True, **filters))
+        next_cursor = encode_cursor(code=items[limit - 1]['ariregistri_kood']) if len(items) > limit else None
+        return items[:limit], next_cursor
 
     def analyze(self, by, emtak=None, location=None, status=None, legal_form=None,
                 founded_after=None, founded_before=None, top=20):
         where_clauses = []; params = []
         if emtak:
-            if isinstance(emtak, list):
-                placeholders = " OR ".join(["json_extract(e.value, '$.emtak_kood') LIKE ?"] * len(emtak))
-                where_clauses.append(f"""EXISTS (SELECT 1 FROM json_each(c.full_data, '$.yldandmed.teatatud_tegevusalad') AS e
-                                    WHERE {placeholders})""")
-                params.extend([f"{e}%" for e in emtak])
-            else:
-                where_clauses.append("""EXISTS (SELECT 1 FROM json_each(c.full_data, '$.yldandmed.teatatud_tegevusalad') AS e
-                                    WHERE json_extract(e.value, '$.emtak_kood') LIKE ?)""")
-                params.append(f"{emtak}%")
-        if location: where_clauses.append("(c.maakond LIKE ? OR c.linn LIKE ?)"); params.extend([f"%{location}%", f"%{location}%"])
-        if status: where_clauses.append("c.status LIKE ?"); params.append(f"%{status}%")
-        if legal_form: where_clauses.append("c.legal_form LIKE ?"); params.append(f"%{legal_form}%")
+            clause, values = self._emtak_clause("c", emtak); where_clauses.append(clause); params.extend(values)
+        if location:
+            clause, ids = self._location_clause("c", location); where_clauses.append(clause); params.extend(ids)
+        if status:
+            clause, values = self._status_clause("c", status); where_clauses.append(clause); params.extend(values)
+        if legal_form: where_clauses.append(f"c.legal_form {self.LIKE} ?"); params.append(f"%{legal_form}%")
         if founded_after: where_clauses.append("c.founded_at >= ?"); params.append(founded_after)
         if founded_before: where_clauses.append("c.founded_at <= ?"); params.append(founded_before)
         where_sql = (" AND " + " AND ".join(where_clauses)) if where_clauses else ""
 
-        if by == "county":
-            query = f"SELECT COALESCE(c.maakond, 'Unknown') AS grp, COUNT(*) AS cnt FROM companies c WHERE 1=1{where_sql} GROUP BY grp ORDER BY cnt DESC LIMIT ?"
+        if by in ("county", "municipality", "settlement"):
+            # Roll-up at any level of the EHAK hierarchy, grouped on the integer id columns
+            col = LOCATION_LEVELS[{"county": 1, "municipality": 2, "settlement": 3}[by]]
+            query = f"""SELECT COALESCE(l.name, 'Unknown') AS grp, COUNT(*) AS cnt FROM companies c
+                        LEFT JOIN locations l ON l.id = c.{col} WHERE 1=1{where_sql} GROUP BY c.{col}, l.name ORDER BY cnt DESC LIMIT ?"""
         elif by == "status":
-            query = f"SELECT COALESCE(c.status, 'Unknown') AS grp, COUNT(*) AS cnt FROM companies c WHERE 1=1{where_sql} GROUP BY grp ORDER BY cnt DESC LIMIT ?"
+            # Grouped on the canonical code and labelled in Estonian, like the other groupings
+            label = " ".join(f"WHEN '{code}' THEN '{et}'" for code, (_, et, *_) in STATUS_CODES.items())
+            query = f"""SELECT COALESCE(CASE c.status_code {label} END, c.status, 'Unknown') AS grp, COUNT(*) AS cnt
+                        FROM companies c WHERE 1=1{where_sql} GROUP BY c.status_code, grp ORDER BY cnt DESC LIMIT ?"""
         elif by == "legal-form":
             query = f"SELECT COALESCE(c.legal_form, 'Unknown') AS grp, COUNT(*) AS cnt FROM companies c WHERE 1=1{where_sql} GROUP BY grp ORDER BY cnt DESC LIMIT ?"
         elif by == "year":
             query = f"SELECT COALESCE(SUBSTR(c.founded_at, 1, 4), 'Unknown') AS grp, COUNT(*) AS cnt FROM companies c WHERE 1=1{where_sql} GROUP BY grp ORDER BY grp ASC LIMIT ?"
         elif by == "emtak":
-            emtak_filter = ""
+            source, on, item = self._activities("c", "items"); emtak_filter = ""
             if emtak:
-                if isinstance(emtak, list):
-                    emtak_filter = " AND (" + " OR ".join(["json_extract(items.value, '$.emtak_kood') LIKE ?"] * len(emtak)) + ")"
-                    params.extend([f"{e}%" for e in emtak])
-                else:
-                    emtak_filter = " AND json_extract(items.value, '$.emtak_kood') LIKE ?"
-                    params.append(f"{emtak}%")
-            query = f"""SELECT json_extract(items.value, '$.emtak_kood') || ' - ' || COALESCE(json_extract(items.value, '$.emtak_tekstina'), '?') AS grp, COUNT(*) AS cnt
-                FROM companies c, json_each(c.full_data, '$.yldandmed.teatatud_tegevusalad') AS items
-                WHERE json_extract(items.value, '$.emtak_kood') IS NOT NULL{emtak_filter}{where_sql}
-                GROUP BY json_extract(items.value, '$.emtak_kood') ORDER BY cnt DESC LIMIT ?"""
+                emtak = emtak if isinstance(emtak, list) else [emtak]
+                emtak_filter = " AND (" + " OR ".join([f"{item['code']} LIKE ?"] * len(emtak)) + ")"
+                params.extend([f"{e}%" for e in emtak])
+            query = f"""SELECT {item['code']} || ' - ' || COALESCE(MIN({item['text']}), '?') AS grp, COUNT(*) AS cnt
+                FROM companies c, {source}
+                WHERE {on} AND {item['code']} IS NOT NULL{emtak_filter}{where_sql}
+                GROUP BY {item['code']} ORDER BY cnt DESC LIMIT ?"""
         elif by == "capital-range":
             query = f"""SELECT CASE
                 WHEN c.capital IS NULL THEN 'No data'
@@ -628,79 +881,266 @@ class SQLiteBackend(RegistryBackend):
         else:
             return []
         params.append(top)
-        return [(row[0], row[1]) for row in self.conn.execute(query, params)]
-
-    def is_file_processed(self, filename: str):
-        return self.conn.execute("SELECT 1 FROM sync_state WHERE filename=? AND status='DONE'", (filename,)).fetchone() is not None
-
-    def mark_file_status(self, filename: str, status: str):
-        with self.conn: self.conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (filename, status))
-
-    def get_stats(self):
-        total = self.conn.execute("SELECT COUNT(*) FROM companies").fetchone()[0]
-        enriched = self.conn.execute("SELECT COUNT(*) FROM companies WHERE enrichment IS NOT NULL").fetchone()[0]
-        has_status = self.conn.execute("SELECT COUNT(*) FROM companies WHERE status IS NOT NULL").fetchone()[0]
-        has_county = self.conn.execute("SELECT COUNT(*) FROM companies WHERE maakond IS NOT NULL").fetchone()[0]
-        has_founded = self.conn.execute("SELECT COUNT(*) FROM companies WHERE founded_at IS NOT NULL").fetchone()[0]
-        has_emtak = self.conn.execute("SELECT COUNT(*) FROM companies WHERE full_data LIKE '%emtak_kood%'").fetchone()[0]
-        has_capital = self.conn.execute("SELECT COUNT(*) FROM companies WHERE capital IS NOT NULL").fetchone()[0]
-        has_email = self.conn.execute("SELECT COUNT(*) FROM companies WHERE email IS NOT NULL").fetchone()[0]
-        has_phone = self.conn.execute("SELECT COUNT(*) FROM companies WHERE phone IS NOT NULL").fetchone()[0]
-        has_website = self.conn.execute("SELECT COUNT(*) FROM companies WHERE website IS NOT NULL").fetchone()[0]
-        has_employees = self.conn.execute("SELECT COUNT(*) FROM companies WHERE employee_count IS NOT NULL").fetchone()[0]
-        has_vat = self.conn.execute("SELECT COUNT(*) FROM companies WHERE vat_number IS NOT NULL").fetchone()[0]
-        persons_count = 0
-        try:
-            persons_count = self.conn.execute("SELECT COUNT(*) FROM persons").fetchone()[0]
-        except sqlite3.OperationalError:
-            pass
-        top_counties = self.conn.execute("SELECT maakond, COUNT(*) AS cnt FROM companies WHERE maakond IS NOT NULL GROUP BY maakond ORDER BY cnt DESC LIMIT 5").fetchall()
-        top_legal = self.conn.execute("SELECT legal_form, COUNT(*) AS cnt FROM companies WHERE legal_form IS NOT NULL GROUP BY legal_form ORDER BY cnt DESC LIMIT 5").fetchall()
-        return {
-            "total": total, "enriched": enriched,
-            "has_status": has_status, "has_county": has_county, "has_founded": has_founded, "has_emtak": has_emtak,
-            "has_capital": has_capital, "has_email": has_email, "has_phone": has_phone, "has_website": has_website,
-            "has_employees": has_employees, "has_vat": has_vat, "persons_count": persons_count,
-            "top_counties": [(r[0], r[1]) for r in top_counties],
-            "top_legal": [(r[0], r[1]) for r in top_legal],
-        }
+        return [(row[0], row[1]) for row in self._query(f"analyze:{by}", query, params)]
 
-    def search_persons(self, name=None, id_code=None, role=None, source=None, company_code=None, limit=50):
+    def search_persons(self, name=None, id_code=None, role=None, source=None, company_code=None, limit=50, after=None):
+        """Person rows ordered by (full_name, id); after=(full_name, id) continues after that row."""
         query = """SELECT p.*, c.name AS company_name FROM persons p
                    JOIN companies c ON p.company_code = c.code WHERE 1=1"""
         params = []
-        if name: query += " AND p.full_name LIKE ?"; params.append(f"%{name}%")
+        if name: query += f" AND p.full_name {self.LIKE} ?"; params.append(f"%{name}%")
         if id_code: query += " AND p.id_code = ?"; params.append(str(id_code))
-        if role: query += " AND p.role LIKE ?"; params.append(f"%{role}%")
+        if role: query += f" AND p.role {self.LIKE} ?"; params.append(f"%{role}%")
         if source: query += " AND p.source = ?"; params.append(source)
         if company_code: query += " AND p.company_code = ?"; params.append(int(company_code))
-        query += " ORDER BY p.full_name"
+        if after is not None:
+            last_name, last_id = after
+            # NULL names sort first, so a page ending on one continues through the rest of the NULLs
+            if last_name is None: query += " AND (p.full_name IS NOT NULL OR p.id > ?)"; params.append(int(last_id))
+            else: query += " AND (p.full_name > ? OR (p.full_name = ? AND p.id > ?))"; params.extend([last_name, last_name, int(last_id)])
+        # id breaks ties between namesakes; idx_persons_name carries it, so pages are read in index order
+        query += " ORDER BY p.full_name, p.id"
         if limit: query += f" LIMIT {int(limit)}"
-        return [dict(row) for row in self.conn.execute(query, params)]
+        return [dict(row) for row in self._query("persons", query, params)]
+
+    def search_persons_page(self, limit=50, cursor=None, **filters):
+        """One page of search_persons() and the cursor for the next page (None after the last)."""
+        after = None; limit = max(int(limit), 1)
+        if cursor:
+            key = decode_cursor(cursor); after = (key.get("name"), key["id"])
+        rows = self.search_persons(limit=limit + 1, after=after, **filters)
+        next_cursor = encode_cursor(name=rows[limit - 1]['full_name'], id=rows[limit - 1]['id']) if len(rows) > limit else None
+        return rows[:limit], next_cursor
 
-    def person_network(self, name=None, id_code=None):
+    def person_network(self, name=None, id_code=None, entity=None):
+        """Every persons row of a person, with company name and status, ordered by source and company.
+
+        The person is found through person_entities: by entity id, or the entities with that id code
+        or normalized name, all exact index lookups. Namesakes stay separate entities, told apart
+        by person_entity_id. A name no entity has (or a database without entities yet) falls back
+        to a substring match on full_name, and an id code to the rows carrying it.
+        """
+        if entity is not None: ids = [int(entity)]
+        elif id_code: ids = [r[0] for r in self._query("network", "SELECT id FROM person_entities WHERE id_code = ?", [str(id_code)])]
+        elif name: ids = [r[0] for r in self._query("network", "SELECT id FROM person_entities WHERE norm = ?", [normalize_person_name(name)])]
+        else: return []
         query = """SELECT p.*, c.name AS company_name, c.status AS company_status FROM persons p
                    JOIN companies c ON p.company_code = c.code WHERE """
-        params = []
-        if id_code:
-            query += "p.id_code = ?"; params.append(str(id_code))
-        elif name:
-            query += "p.full_name LIKE ?"; params.append(f"%{name}%")
-        else:
-            return []
+        if ids: query += f"p.person_entity_id IN ({','.join('?' * len(ids))})"; params = ids
+        elif id_code: query += "p.id_code = ?"; params = [str(id_code)]
+        else: query += f"p.full_name {self.LIKE} ?"; params = [f"%{name}%"]
         query += " ORDER BY p.source, c.name"
-        return [dict(row) for row in self.conn.execute(query, params)]
+        return [dict(row) for row in self._query("network", query, params)]
+
+    def top_persons(self, source=None, kind="person", top=20):
+        """[(entity id, name, id code, companies)] of the people in the most companies, most first.
+
+        source counts only one kind of role ("board" gives board seats per person); kind is
+        "person", "company" (shareholding companies) or None for both.
+        """
+        where, params = [], []
+        if source: where.append("p.source = ?"); params.append(source)
+        if kind: where.append("e.kind = ?"); params.append(kind)
+        query = f"""SELECT e.id, e.name, e.id_code, COUNT(DISTINCT p.company_code) AS companies
+                    FROM persons p JOIN person_entities e ON e.id = p.person_entity_id
+                    {"WHERE " + " AND ".join(where) if where else ""}
+                    GROUP BY e.id, e.name, e.id_code ORDER BY companies DESC, e.id LIMIT ?"""
+        return [tuple(row) for row in self._query("top_persons", query, [*params, int(top)])]
+
+    # People in more companies than this (nominee directors, the state as shareholder) link every
+    # pair of them, n² edges that say little; company_links leaves them out
+    LINK_MAX_COMPANIES = 100
+
+    @staticmethod
+    def _iso_date_sql(column):
+        # Role dates are stored as the registry writes them, dd.mm.yyyy; the SQL twin of _normalize_date()
+        return (f"CASE WHEN {column} LIKE '__.__.____' THEN substr({column}, 7, 4) || '-' || substr({column}, 4, 2)"
+                f" || '-' || substr({column}, 1, 2) ELSE {column} END")
+
+    def _company_links_insert(self, where=""):
+        """INSERT ... SELECT that fills company_links from persons, one statement over the whole table.
+
+        Every two roles of a person entity in different companies give an edge each way, with the
+        role sources at both ends. since/until is the overlap of the two roles: the later start and
+        the earlier end, NULL for an open end. Roles that never overlapped (since after until) give
+        no edge: holding them one after the other does not connect the companies.
+        """
+        start_a, start_b = self._iso_date_sql("a.start_date"), self._iso_date_sql("b.start_date")
+        end_a, end_b = self._iso_date_sql("a.end_date"), self._iso_date_sql("b.end_date")
+        # since <= until as every start before every end; an open end skips the date conversions
+        starts, ends = (("a.start_date", start_a), ("b.start_date", start_b)), (("a.end_date", end_a), ("b.end_date", end_b))
+        overlap = " AND ".join(f"({start} IS NULL OR {end} IS NULL OR {iso_start} <= {iso_end})"
+                               for start, iso_start in starts for end, iso_end in ends)
+        return f"""INSERT INTO company_links (company_code, linked_code, person_entity_id, source, linked_source, since, until)
+                   SELECT DISTINCT a.company_code, b.company_code, a.person_entity_id, a.source, b.source,
+                          CASE WHEN a.start_date IS NULL THEN {start_b} WHEN b.start_date IS NULL THEN {start_a}
+                               WHEN {start_a} > {start_b} THEN {start_a} ELSE {start_b} END,
+                          CASE WHEN a.end_date IS NULL THEN {end_b} WHEN b.end_date IS NULL THEN {end_a}
+                               WHEN {end_a} < {end_b} THEN {end_a} ELSE {end_b} END
+                   FROM person_entities e
+                   JOIN persons a ON a.person_entity_id = e.id
+                   JOIN persons b ON b.person_entity_id = e.id AND b.company_code <> a.company_code
+                   WHERE e.companies BETWEEN 2 AND ?{where} AND {overlap}"""
+
+    def _company_links_statements(self, max_companies=None, entity_ids=None, chunk_size=500):
+        """(query, params) pairs that refill company_links: all of it, or only the edges of entity_ids."""
+        limit = max_companies or self.LINK_MAX_COMPANIES
+        if entity_ids is None:
+            yield "DELETE FROM company_links", []
+            yield self._company_links_insert(), [limit]
+            return
+        ids = sorted(entity_ids)
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]; marks = ",".join("?" * len(chunk))
+            yield f"DELETE FROM company_links WHERE person_entity_id IN ({marks})", chunk
+            yield self._company_links_insert(f" AND e.id IN ({marks})"), [limit, *chunk]
+
+    def linked_companies(self, code, max_hops=2, sources=None, current=False, limit=None):
+        """Companies within max_hops shared-person links of code, nearest first.
+
+        Walks company_links with a recursive CTE. Its rows are (company, hops) and UNION drops
+        repeats, so a company is expanded at most once per hop count and cycles end at max_hops.
+        sources keeps edges whose roles are both of those kinds ("board" gives co-directorships);
+        current keeps edges where both roles are still open. Each company lists as "via" every
+        link from a company one hop nearer: who connects them, in which roles, and since when.
+        Edges come in both directions, so those are read from the company's own edges, reversed.
+        """
+        edge, edge_params = "", []
+        if sources:
+            marks = ",".join("?" * len(sources))
+            edge += f" AND l.source IN ({marks}) AND l.linked_source IN ({marks})"; edge_params += [*sources, *sources]
+        if current: edge += " AND l.until IS NULL"
+        # +f.hops keeps SQLite from looking reached up by hop count, which scans the whole previous hop per edge
+        query = f"""WITH RECURSIVE walk(code, hops) AS (
+                        SELECT CAST(? AS BIGINT), 0
+                        UNION
+                        SELECT l.linked_code, w.hops + 1 FROM walk w JOIN company_links l ON l.company_code = w.code
+                        WHERE w.hops < ?{edge}),
+                    reached AS (SELECT code, MIN(hops) AS hops FROM walk GROUP BY code),
+                    kept AS (SELECT code, hops FROM reached WHERE hops > 0 ORDER BY hops, code{f" LIMIT {int(limit)}" if limit else ""})
+                    SELECT k.code, k.hops, c.name, c.status, l.linked_code, l.person_entity_id, e.name, l.linked_source,
+                           l.source, l.since, l.until
+                    FROM kept k
+                    JOIN company_links l ON l.company_code = k.code{edge}
+                    JOIN reached f ON f.code = l.linked_code AND +f.hops = k.hops - 1
+                    LEFT JOIN companies c ON c.code = k.code
+                    LEFT JOIN person_entities e ON e.id = l.person_entity_id
+                    ORDER BY k.hops, c.name, k.code, l.linked_code, l.person_entity_id, l.linked_source, l.source"""
+        results = {}
+        for row in self._query("links", query, [int(code), int(max_hops), *edge_params, *edge_params]):
+            linked, hops, name, status, from_code, entity, person, source, linked_source, since, until = row
+            if linked not in results:
+                results[linked] = {"code": linked, "name": name, "status": status, "hops": hops, "via": []}
+            results[linked]["via"].append({"from_code": from_code, "person_entity_id": entity, "person": person,
+                                           "source": source, "linked_source": linked_source, "since": since, "until": until})
+        return list(results.values())
+
+    # Evidence that put a person entity together, strongest first (person_entities.matched_by)
+    MATCH_RANK = {"id_code": 0, "enrichment": 1, "id_hash": 2, "name": 3}
+
+    def _entity_scope(self, codes):
+        """Ids of the person entities that enriching codes can regroup; None while persons are unresolved.
+
+        Those are the entities of the companies' own people and the ones with an id code their
+        enrichment unmasked, and then, until nothing new turns up, every entity named like one of
+        the people in them, since the name rule joins namesakes. merge --force resolves everyone.
+        """
+        pending = {r[0] for r in self._query_in("entities", "SELECT person_entity_id FROM persons WHERE company_code IN ({marks})", codes)}
+        if None in pending: return None
+        unmasked = set()
+        for (enrichment,) in self._query_in("entities", "SELECT enrichment FROM companies WHERE code IN ({marks}) AND enrichment IS NOT NULL", codes):
+            unmasked.update(str(i) for i in ((json.loads(enrichment) or {}).get("unmasked_ids") or {}).values())
+        pending.update(r[0] for r in self._query_in("entities", "SELECT person_entity_id FROM persons WHERE id_code IN ({marks})", unmasked))
+        pending.update(r[0] for r in self._query_in("entities", "SELECT id FROM person_entities WHERE id_code IN ({marks})", unmasked))
+        scope, names = set(), set()
+        while pending := pending - scope - {None}:
+            scope |= pending
+            new = {normalize_person_name(r[0]) for r in self._query_in("entities", "SELECT full_name FROM persons WHERE person_entity_id IN ({marks})", pending)}
+            new -= names | {""}; names |= new
+            pending = {r[0] for r in self._query_in("entities", "SELECT id FROM person_entities WHERE norm IN ({marks})", new)}
+        return scope
+
+    def _resolve_persons(self, scope=None):
+        """Cluster the persons rows into people. Returns (person_entities rows, [(entity id, persons.id)]).
+
+        Rows sharing an id code or id hash are one entity, and a row with both links the two.
+        A row without an id code takes the one its company's PDF enrichment unmasked for that
+        name. Rows with neither join the single entity with the same normalized name (and
+        country, when both have one); with no or several such entities, namesakes without ids
+        form one entity per name and country. Entity ids follow persons.id order. With scope
+        (see _entity_scope()) only the rows of those entities are clustered again; the new
+        entities reuse their ids, then continue past the largest id in use.
+        """
+        columns = "SELECT id, company_code, full_name, id_code, id_hash, country FROM persons"
+        if scope is None:
+            people = self._query("entities", f"{columns} ORDER BY id")
+            enriched = self._query("entities", "SELECT code, enrichment FROM companies WHERE enrichment IS NOT NULL")
+            number = lambda n: n + 1
+        else:
+            people = sorted(self._query_in("entities", f"{columns} WHERE person_entity_id IN ({{marks}})", scope), key=lambda r: r[0])
+            enriched = self._query_in("entities", "SELECT code, enrichment FROM companies WHERE code IN ({marks}) AND enrichment IS NOT NULL",
+                                      {r[1] for r in people})
+            free = sorted(scope); top = self._query("entities", "SELECT MAX(id) FROM person_entities").fetchone()[0] or 0
+            number = lambda n: free[n] if n < len(free) else top + 1 + n - len(free)
+        unmasked = {}
+        for code, enrichment in enriched:
+            ids = (json.loads(enrichment) or {}).get("unmasked_ids") or {}
+            if ids: unmasked[code] = {normalize_person_name(n): str(i) for n, i in ids.items()}
+        parent = {}
+        def find(key):
+            root = key
+            while parent.get(root, root) != root: root = parent[root]
+            while key != root: parent[key], key = root, parent.get(key, key)
+            return root
+        def union(a, b):
+            a, b = find(a), find(b)
+            if a != b: parent[b] = a
+        rows, info, named = [], {}, defaultdict(set)
+        for pid, code, full_name, id_code, id_hash, country in people:
+            norm = normalize_person_name(full_name); id_code = (id_code or "").strip() or None; via = "id_code"
+            if not id_code and norm in unmasked.get(code, ()): id_code = unmasked[code][norm]; via = "enrichment"
+            keys = [k for k in (id_code and ("id", id_code), id_hash and ("hash", id_hash)) if k]
+            if keys:
+                if len(keys) > 1: union(*keys)
+                if norm: named[norm].add((keys[0], country))
+            else:
+                via = "name"; keys = [("name", norm, country or "") if norm else ("row", pid)]
+            rows.append((pid, code, keys[0], via if id_code else "id_hash" if id_hash else "name"))
+            if keys[0] not in info: info[keys[0]] = (full_name, norm, id_code, id_hash, country)
+        for key in [k for k in info if k[0] == "name"]:
+            _, norm, country = key
+            roots = {find(k) for k, c in named.get(norm, ()) if not country or not c or c == country}
+            if len(roots) == 1: union(roots.pop(), key)
+        entity_ids, entities, assignments = {}, {}, []
+        for pid, code, key, via in rows:
+            root = find(key)
+            if root not in entity_ids:
+                entity_ids[root] = number(len(entity_ids))
+                full_name, norm, id_code, id_hash, country = info[root]
+                entities[root] = [entity_ids[root], full_name, norm, id_code, id_hash, country, None, via, 0, set()]
+            entity = entities[root]
+            if self.MATCH_RANK[via] < self.MATCH_RANK[entity[7]]: entity[7] = via
+            for pos, value in ((1, info[key][0]), (3, info[key][2]), (4, info[key][3]), (5, info[key][4])):
+                if entity[pos] is None: entity[pos] = value
+            entity[8] += 1; entity[9].add(code); assignments.append((entity[0], pid))
+        result = []
+        for entity in entities.values():
+            code = entity[3] or ""
+            # Registry codes of legal persons have 8 digits, personal id codes 11
+            entity[6] = "company" if len(code) == 8 and code.isdigit() else "person"
+            entity[9] = len(entity[9]); result.append(tuple(entity))
+        return result, assignments
 
     def find_group(self, code, direction="both", max_depth=5):
         results = {"company": None, "parents": [], "subsidiaries": []}
         # Get the root company
-        row = self.conn.execute("SELECT code, name, status FROM companies WHERE code = ?", (int(code),)).fetchone()
+        row = self._query("group", "SELECT code, name, status FROM companies WHERE code = ?", (int(code),)).fetchone()
         if not row: return results
         results["company"] = dict(row)
 
         if direction in ("up", "both"):
             # Find parent shareholders (who owns this company)
-            parents = self.conn.execute(
+            parents = self._query("group",
                 """SELECT p.*, c.name AS company_name FROM persons p
                    JOIN companies c ON p.company_code = c.code
                    WHERE p.company_code = ? AND p.source = 'shareholder'""",
@@ -716,7 +1156,7 @@ class SQLiteBackend(RegistryBackend):
                 if depth >= max_depth or current_code in visited:
                     continue
                 visited.add(current_code)
-                subs = self.conn.execute(
+                subs = self._query("group",
                     """SELECT DISTINCT p.company_code, c.name AS company_name, c.status,
                               p.ownership_pct, p.contribution_amount, p.currency
                        FROM persons p JOIN companies c ON p.company_code = c.code
@@ -732,9 +1172,9 @@ class SQLiteBackend(RegistryBackend):
 
     def employee_trend(self, code=None, emtak=None, location=None):
         if code:
-            row = self.conn.execute("SELECT full_data FROM companies WHERE code = ?", (int(code),)).fetchone()
-            if not row: return []
-            data = json.loads(row[0])
+            found = next(self.get_companies([code]), None)
+            if not found: return []
+            data = found[1]
             reports = data.get('yldandmed', {}).get('info_majandusaasta_aruannetest', [])
             trend = []
             for r in sorted(reports, key=lambda x: x.get('majandusaasta_perioodi_lopp_kpv', '')):
@@ -749,130 +1189,1544 @@ class SQLiteBackend(RegistryBackend):
             # Industry-wide aggregation
             where_clauses = []; params = []
             if emtak:
-                if isinstance(emtak, list):
-                    placeholders = " OR ".join(["json_extract(e2.value, '$.emtak_kood') LIKE ?"] * len(emtak))
-                    where_clauses.append(f"""EXISTS (SELECT 1 FROM json_each(c.full_data, '$.yldandmed.teatatud_tegevusalad') AS e2
-                                        WHERE {placeholders})""")
-                    params.extend([f"{e}%" for e in emtak])
-                else:
-                    where_clauses.append("""EXISTS (SELECT 1 FROM json_each(c.full_data, '$.yldandmed.teatatud_tegevusalad') AS e2
-                                        WHERE json_extract(e2.value, '$.emtak_kood') LIKE ?)""")
-                    params.append(f"{emtak}%")
+                clause, values = self._emtak_clause("c", emtak); where_clauses.append(clause); params.extend(values)
             if location:
-                where_clauses.append("(c.maakond LIKE ? OR c.linn LIKE ?)")
-                params.extend([f"%{location}%", f"%{location}%"])
+                clause, ids = self._location_clause("c", location); where_clauses.append(clause); params.extend(ids)
             where_sql = (" AND " + " AND ".join(where_clauses)) if where_clauses else ""
-            query = f"""SELECT SUBSTR(json_extract(r.value, '$.majandusaasta_perioodi_lopp_kpv'), 1, 4) AS yr,
-                               SUM(CAST(json_extract(r.value, '$.tootajate_arv') AS INTEGER)) AS total_emp,
+            source, on, report = self._annual_reports("c", "r")
+            query = f"""SELECT SUBSTR({report['period_end']}, 1, 4) AS yr,
+                               SUM(CAST({report['employees']} AS INTEGER)) AS total_emp,
                                COUNT(DISTINCT c.code) AS company_count
-                        FROM companies c, json_each(c.full_data, '$.yldandmed.info_majandusaasta_aruannetest') AS r
-                        WHERE json_extract(r.value, '$.tootajate_arv') IS NOT NULL{where_sql}
+                        FROM companies c, {source}
+                        WHERE {on} AND {report['employees']} IS NOT NULL{where_sql}
                         GROUP BY yr ORDER BY yr"""
-            return [{"year": r[0], "employees": r[1], "companies": r[2]} for r in self.conn.execute(query, params)]
+            return [{"year": r[0], "employees": r[1], "companies": r[2]} for r in self._query("employee_trend", query, params)]
+
+    def code_shards(self, n):
+        """Split the code space into up to n half-open (lo, hi) ranges holding similar row counts."""
+        total = self.conn.execute("SELECT COUNT(*) FROM companies").fetchone()[0]
+        n = max(1, min(n, total))
+        bounds = [self.conn.execute("SELECT code FROM companies ORDER BY code LIMIT 1 OFFSET ?", (total * i // n,)).fetchone()[0]
+                  for i in range(1, n)]
+        edges = [None] + sorted(set(bounds)) + [None]
+        return list(zip(edges[:-1], edges[1:]))
+
+    def iter_export_rows(self, table, batch_size=50000, limit=None, **filters):
+        """Yield batches of row tuples for one normalized export table (columns as in COLUMNAR_TABLES)."""
+        clauses, params = self._company_filters(alias="f", **filters)
+        scope = "1=1" + "".join(f" AND {c}" for c in clauses)
+        if limit: scope = f"f.code IN (SELECT f.code FROM companies f WHERE {scope} ORDER BY f.code LIMIT {int(limit)})"
+        if table == "companies":
+            query = f"""SELECT f.code, f.name, f.status, f.maakond, f.linn, f.legal_form, f.founded_at, f.capital,
+                               f.capital_currency, f.employee_count, f.vat_number, f.email, f.phone, f.website
+                        FROM companies f WHERE {scope} ORDER BY f.code"""
+        elif table == "persons":
+            where = "" if scope == "1=1" else f" WHERE p.company_code IN (SELECT f.code FROM companies f WHERE {scope})"
+            query = f"""SELECT p.company_code, p.source, p.first_name, p.last_name, p.full_name, p.id_code, p.id_hash,
+                               p.role, p.start_date, p.end_date, p.ownership_pct, p.contribution_amount, p.currency, p.country
+                        FROM persons p{where} ORDER BY p.company_code, p.id"""
+        elif table in ("activities", "annual_reports"):
+            if table == "activities":
+                source, on, a = self._activities("f", "a"); cols = (a['code'], a['text'], a['main'])
+            else:
+                source, on, a = self._annual_reports("f", "a"); cols = (a['period_end'], a['employees'], a['emtak_text'])
+            # json_each yields array order already; a table-backed dialect gives the position as "pos"
+            order = f"f.code, {a['pos']}" if "pos" in a else "f.code"
+            query = f"""SELECT f.code, {', '.join(cols)} FROM companies f, {source}
+                        WHERE {on} AND {scope} ORDER BY {order}"""
+        else:
+            raise ValueError(f"Unknown export table: {table}")
+        cursor = self._query(f"export:{table}", query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows: break
+            yield rows
+
+    def _event_filters(self, event_type=None, date_from=None, date_to=None, location=None, company_code=None):
+        """WHERE fragments and params over registry_events e joined to companies c."""
+        clauses = []; params = []
+        kind = resolve_event_type(event_type) if event_type else None
+        if kind: clauses.append("e.event_kind = ?"); params.append(kind)
+        elif event_type: clauses.append(f"e.event_type {self.LIKE} ?"); params.append(f"%{event_type}%")
+        if date_from: clauses.append("e.date >= ?"); params.append(date_from)
+        if date_to: clauses.append("e.date <= ?"); params.append(date_to)
+        if company_code: clauses.append("e.company_code = ?"); params.append(int(company_code))
+        if location:
+            clause, ids = self._location_clause("c", location); clauses.append(clause); params.extend(ids)
+        return clauses, params
+
+    def events(self, limit=100, after=None, **filters):
+        """Registry-card entries ordered by (date, id), with the company name; after=(date, id) continues after that row."""
+        clauses, params = self._event_filters(**filters)
+        if after is not None:
+            last_date, last_id = after
+            # Undated entries sort first, as in search_persons()
+            if last_date is None: clauses.append("(e.date IS NOT NULL OR e.id > ?)"); params.append(int(last_id))
+            else: clauses.append("(e.date > ? OR (e.date = ? AND e.id > ?))"); params.extend([last_date, last_date, int(last_id)])
+        query = f"""SELECT e.id, e.date, e.company_code, c.name AS company_name, e.event_type, e.event_kind, e.entry_no
+                    FROM registry_events e JOIN companies c ON c.code = e.company_code
+                    WHERE 1=1{''.join(f' AND {c}' for c in clauses)} ORDER BY e.date, e.id"""
+        if limit: query += f" LIMIT {int(limit)}"
+        return [dict(row) for row in self._query("events", query, params)]
+
+    def events_page(self, limit=50, cursor=None, **filters):
+        """One page of events() and the cursor for the next page (None after the last)."""
+        after = None; limit = max(int(limit), 1)
+        if cursor:
+            key = decode_cursor(cursor); after = (key.get("date"), key["id"])
+        rows = self.events(limit=limit + 1, after=after, **filters)
+        next_cursor = encode_cursor(date=rows[limit - 1]['date'], id=rows[limit - 1]['id']) if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    def event_counts(self, by, top=20, **filters):
+        """(group, count) of registry-card entries by county, municipality, type, month or year."""
+        clauses, params = self._event_filters(**filters)
+        where_sql = "".join(f" AND {c}" for c in clauses)
+        if by in ("county", "municipality"):
+            col = LOCATION_LEVELS[1 if by == "county" else 2]
+            group, join, order = f"c.{col}, l.name", f"LEFT JOIN locations l ON l.id = c.{col}", "cnt DESC"
+            label = "COALESCE(l.name, 'Unknown')"
+        elif by in ("month", "year"):
+            label = f"COALESCE(SUBSTR(e.date, 1, {7 if by == 'month' else 4}), 'Unknown')"; group, join, order = "grp", "", "grp"
+        elif by == "type":
+            label, group, join, order = "COALESCE(e.event_type, 'Unknown')", "grp", "", "cnt DESC"
+        else:
+            return []
+        query = f"""SELECT {label} AS grp, COUNT(*) AS cnt FROM registry_events e JOIN companies c ON c.code = e.company_code
+                    {join} WHERE 1=1{where_sql} GROUP BY {group} ORDER BY {order} LIMIT ?"""
+        return [(row[0], row[1]) for row in self._query(f"events:{by}", query, params + [top])]
+
+class QueryProfiler:
+    """Timing, work and query plans for the statements SQLiteBackend runs through _query().
+
+    A statement is timed from execute() until its cursor is exhausted or closed, so lazily
+    consumed results such as search() are measured end to end. SQLite does not report rows
+    examined through the Python API, so vm_steps (progress-handler ticks of 1000 VM
+    instructions) is the work measure; compare it with rows returned to spot scans.
+    Statements slower than threshold_ms have their EXPLAIN QUERY PLAN captured and are
+    appended to the JSON-lines slow log.
+    """
+    TICK = 1000
+    _log_lock = Lock()
+
+    def __init__(self, conn, threshold_ms=100.0, log_path=None, keep_records=True):
+        self.conn = conn; self.threshold_ms = threshold_ms; self.log_path = log_path
+        # Long-running callers (the service) only want the slow log, not an ever-growing list
+        self.records = [] if keep_records else None; self.steps = 0
+        conn.set_progress_handler(self._tick, self.TICK)
+
+    def _tick(self):
+        self.steps += 1
+        return 0
+
+    def execute(self, label, query, params=()):
+        return ProfiledCursor(self, label, query, params)
+
+    def record(self, label, query, params, ms, steps, rows):
+        rec = {"label": label, "ms": round(ms, 2), "rows": rows, "vm_steps": steps * self.TICK,
+               "sql": " ".join(query.split())}
+        if ms >= self.threshold_ms:
+            plan = [r[3] for r in self.conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+            # json_each and other table-valued functions are always "scanned"; only real tables matter
+            rec["plan"] = plan; rec["full_scans"] = [p for p in plan if p.startswith("SCAN ") and " VIRTUAL TABLE" not in p]
+            rec["params"] = [p if isinstance(p, (int, float, str)) or p is None else str(p) for p in params]
+            if self.log_path:
+                line = json.dumps({"at": datetime.now().isoformat(timespec="seconds"), **rec}, ensure_ascii=False)
+                with self._log_lock, open(self.log_path, "a", encoding="utf-8") as f: f.write(line + "\n")
+        if self.records is not None: self.records.append(rec)
+
+    def close(self):
+        self.conn.set_progress_handler(None, 0)
+
+
+class ProfiledCursor:
+    """sqlite3 cursor stand-in that reports to a QueryProfiler once the statement is done.
+
+    It reads one row ahead, so a fetchone() that takes the last row already reports; a cursor
+    left before its last row reports on close().
+    """
+    def __init__(self, profiler, label, query, params):
+        self.profiler = profiler; self.label = label; self.query = query; self.params = params
+        self.rows = 0; self.done = False
+        self.steps = profiler.steps; self.start = time.perf_counter()
+        self.cursor = profiler.conn.execute(query, params)
+        self.ahead = self.cursor.fetchone()
+
+    @property
+    def row_factory(self): return self.cursor.row_factory
+    @row_factory.setter
+    def row_factory(self, factory): self.cursor.row_factory = factory
+
+    def _finish(self):
+        if self.done: return
+        self.done = True
+        self.profiler.record(self.label, self.query, self.params, (time.perf_counter() - self.start) * 1000,
+                             self.profiler.steps - self.steps, self.rows)
+
+    def __iter__(self): return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None: raise StopIteration
+        return row
+
+    def fetchone(self):
+        return row[0] if (row := self.fetchmany(1)) else None
+
+    def fetchmany(self, size):
+        if self.ahead is None: self._finish(); return []
+        rows = [self.ahead, *self.cursor.fetchmany(size - 1)] if size > 1 else [self.ahead]
+        self.ahead = self.cursor.fetchone(); self.rows += len(rows)
+        if self.ahead is None: self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = [self.ahead, *self.cursor.fetchall()] if self.ahead is not None else []
+        self.ahead = None; self.rows += len(rows); self._finish()
+        return rows
+
+    def close(self):
+        # Left before the last row (e.g. search() stopped at a limit): record what ran
+        self._finish(); self.cursor.close()
+
+def _process_alive(pid):
+    """Whether pid is a running process on this machine. On Windows, where signal 0 is Ctrl+C, always assumed."""
+    if os.name == "nt": return True
+    try: os.kill(pid, 0)
+    except ProcessLookupError: return False
+    except PermissionError: return True  # someone else's process
+    return True
+
+# Bump when the schema changes and add a matching SQLiteBackend._migrate_vN
+SCHEMA_VERSION = 11
+
+class SQLiteBackend(RegistryBackend):
+    # Optional CompanySnapshot; when attached, search() filters on it and reads only the matching rows
+    snapshot = None
+    # Optional QueryProfiler, see enable_profiling()
+    profiler = None
+
+    def __init__(self, db_path: Path, read_only=False):
+        self.db_path = db_path
+        if read_only:
+            # Query-only connection for worker processes: no journal switch, no DDL
+            self.conn = sqlite3.connect(Path(db_path).resolve().as_uri() + "?mode=ro", uri=True,
+                                        check_same_thread=False, timeout=30)
+            self.conn.row_factory = sqlite3.Row
+            return
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self._ensure_schema()
+        self._restore_indexes()
+
+    # Connection settings while bulk_load() runs: no fsync per commit, a 512 MB page cache,
+    # sort b-trees for the index builds in memory and reads through a memory map
+    BULK_PRAGMAS = {"synchronous": "OFF", "cache_size": "-524288", "temp_store": "MEMORY", "mmap_size": str(2**30)}
+    # The load itself looks up rows by these (registrikaardid replaces a company's events), so they stay
+    BULK_KEEP_INDEXES = {"idx_events_company"}
+
+    @contextmanager
+    def bulk_load(self):
+        """Load with the secondary indexes dropped and durability relaxed; rebuild them when the block ends.
+
+        Maintaining ~15 indexes row by row during a full load costs more than building each once from
+        the finished table. The index definitions are kept in meta, with the loader's PID, until they
+        are rebuilt, so a load that is killed halfway gets its indexes back on the next open once that
+        process is gone (see _restore_indexes()).
+        ANALYZE then refreshes the planner statistics. synchronous=OFF means a power loss during the
+        load can corrupt the file, which is why merge() only does this for empty databases and --force.
+        """
+        self._restore_indexes(owned=True)  # left by an earlier load that an open could not repair
+        indexes = [(name, sql) for name, sql in self.conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ('companies', 'persons', 'registry_events', 'company_links')")
+            if name not in self.BULK_KEEP_INDEXES]
+        saved = {pragma: self.conn.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma in self.BULK_PRAGMAS}
+        for pragma, value in self.BULK_PRAGMAS.items(): self.conn.execute(f"PRAGMA {pragma} = {value}")
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('bulk_indexes', ?)",
+                              (json.dumps({"pid": os.getpid(), "indexes": [sql for _, sql in indexes]}),))
+            for name, _ in indexes: self.conn.execute(f"DROP INDEX {name}")
+        try:
+            yield
+        finally:
+            # Also on errors: a failed load must not leave the database without its indexes
+            with self.metrics.step("indexes") if self.metrics is not None else nullcontext():
+                self._restore_indexes(owned=True)
+            with self.metrics.step("analyze") if self.metrics is not None else nullcontext():
+                self.conn.execute("ANALYZE")
+            for pragma, value in saved.items(): self.conn.execute(f"PRAGMA {pragma} = {value}")
+
+    def _restore_indexes(self, owned=False):
+        """Recreate the indexes a bulk_load() dropped, if a load was interrupted before it finished.
+
+        Unless owned (called by the load itself), nothing happens while the loading process is
+        still running: rebuilding mid-load would index the rest of it row by row.
+        """
+        try:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'bulk_indexes'").fetchone()
+        except sqlite3.OperationalError:  # no meta table yet
+            return
+        if row is None: return
+        saved = json.loads(row[0])
+        if not owned and _process_alive(saved["pid"]): return
+        with self.conn:
+            for sql in saved["indexes"]:
+                self.conn.execute(re.sub(r"^CREATE (UNIQUE )?INDEX (IF NOT EXISTS )?", r"CREATE \1INDEX IF NOT EXISTS ", sql))
+            self.conn.execute("DELETE FROM meta WHERE key = 'bulk_indexes'")
+
+    def _query(self, label, query, params=()):
+        """Run a read query, through the profiler when one is enabled."""
+        if self.profiler is None: return self.conn.execute(query, params)
+        return self.profiler.execute(label, query, params)
+
+    def enable_profiling(self, threshold_ms=100.0, log_path=None, keep_records=True):
+        self.profiler = QueryProfiler(self.conn, threshold_ms=threshold_ms, log_path=log_path, keep_records=keep_records)
+        return self.profiler
+
+    def _ensure_schema(self):
+        """Create or upgrade the schema only when PRAGMA user_version is behind SCHEMA_VERSION."""
+        current = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if current >= SCHEMA_VERSION: return
+        # WAL is persistent in the database file, so it only needs setting once
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        if current == 0:
+            # Fresh file or a database built before versioning: the idempotent DDL covers both
+            self._create_tables()
+        for version in range(max(current, 1) + 1, SCHEMA_VERSION + 1):
+            with self.conn:
+                getattr(self, f"_migrate_v{version}")()
+        self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _create_tables(self):
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS companies (
+                    code INTEGER PRIMARY KEY, name TEXT, status TEXT, maakond TEXT, linn TEXT,
+                    legal_form TEXT, founded_at TEXT, full_data JSON DEFAULT '{}', enrichment JSON
+                )
+            """)
+            self.conn.execute("CREATE TABLE IF NOT EXISTS sync_state (filename TEXT PRIMARY KEY, status TEXT)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_name ON companies(name)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_legal_form ON companies(legal_form)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_status ON companies(status)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_founded_at ON companies(founded_at)")
+            # New columns (Phase 1)
+            existing = {r[1] for r in self.conn.execute("PRAGMA table_info(companies)").fetchall()}
+            new_cols = [
+                ("capital", "REAL"), ("capital_currency", "TEXT"), ("email", "TEXT"),
+                ("phone", "TEXT"), ("website", "TEXT"), ("employee_count", "INTEGER"),
+                ("vat_number", "TEXT"),
+            ]
+            for col, ctype in new_cols:
+                if col not in existing:
+                    self.conn.execute(f"ALTER TABLE companies ADD COLUMN {col} {ctype}")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_capital ON companies(capital)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_employee_count ON companies(employee_count)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_vat_number ON companies(vat_number)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_email ON companies(email)")
+            # Persons denormalization table
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS persons (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    company_code INTEGER NOT NULL,
+                    source TEXT NOT NULL,
+                    first_name TEXT, last_name TEXT, full_name TEXT,
+                    id_code TEXT, id_hash TEXT,
+                    role TEXT, start_date TEXT, end_date TEXT,
+                    ownership_pct REAL, contribution_amount REAL, currency TEXT,
+                    country TEXT,
+                    FOREIGN KEY (company_code) REFERENCES companies(code)
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_persons_name ON persons(full_name)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_persons_id_code ON persons(id_code)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_persons_company ON persons(company_code)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_persons_source ON persons(source)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_persons_role ON persons(role)")
+
+    def _migrate_v2(self):
+        # Key/value table for the sync generation used by DossierCache
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _migrate_v3(self):
+        # Trigram index for fuzzy name matching; filled here for databases merged before v3
+        self.conn.execute("CREATE TABLE IF NOT EXISTS name_index (code INTEGER PRIMARY KEY, norm TEXT)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_name_index_norm ON name_index(norm)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS name_trigrams (trigram TEXT, code INTEGER)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS name_trigram_df (trigram TEXT PRIMARY KEY, df INTEGER) WITHOUT ROWID")
+        self.build_name_index()
+
+    def _migrate_v4(self):
+        # Main EMTAK code as a plain column (for CompanySnapshot and cheap grouping)
+        if "main_emtak" not in {r[1] for r in self.conn.execute("PRAGMA table_info(companies)")}:
+            self.conn.execute("ALTER TABLE companies ADD COLUMN main_emtak TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_main_emtak ON companies(main_emtak)")
+        self.conn.execute("""UPDATE companies SET main_emtak = (
+            SELECT json_extract(e.value, '$.emtak_kood') FROM json_each(full_data, '$.yldandmed.teatatud_tegevusalad') AS e
+            ORDER BY json_extract(e.value, '$.on_pohitegevusala') IS NOT 1, e.key LIMIT 1)""")
+
+    def _migrate_v5(self):
+        # EHAK location hierarchy with integer ids on companies, for indexed location filters
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS locations (
+            id INTEGER PRIMARY KEY, level INTEGER NOT NULL, parent_id INTEGER, name TEXT NOT NULL,
+            norm TEXT NOT NULL, ehak_code TEXT)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_locations_norm ON locations(norm)")
+        existing = {r[1] for r in self.conn.execute("PRAGMA table_info(companies)")}
+        for col in LOCATION_LEVELS.values():
+            if col not in existing: self.conn.execute(f"ALTER TABLE companies ADD COLUMN {col} INTEGER")
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{col} ON companies({col})")
+        self.rebuild_locations()
+
+    def _migrate_v6(self):
+        # Canonical status code, so status filters are an indexed IN instead of LIKE over full_data
+        if "status_code" not in {r[1] for r in self.conn.execute("PRAGMA table_info(companies)")}:
+            self.conn.execute("ALTER TABLE companies ADD COLUMN status_code TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_status_code ON companies(status_code)")
+        labels = [r[0] for r in self.conn.execute("SELECT DISTINCT status FROM companies WHERE status IS NOT NULL")]
+        self.conn.executemany("UPDATE companies SET status_code = ? WHERE status = ?",
+                              [(status_code(label), label) for label in labels])
+        self.conn.executemany("""UPDATE companies SET status_code = ? WHERE status_code IS NULL
+                                 AND json_extract(full_data, '$.ettevotja_staatus') = ?""",
+                              [(code, letter) for code, (letter, *_) in STATUS_CODES.items() if letter])
+        # status_code feeds the snapshot
+        self.bump_generation()
+
+    def _migrate_v7(self):
+        # Registry-card entries as rows, for date-range and entry-type queries without the JSON
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS registry_events (
+            id INTEGER PRIMARY KEY, company_code INTEGER NOT NULL, date TEXT, event_type TEXT,
+            event_kind TEXT, entry_no INTEGER)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_events_company ON registry_events(company_code)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_events_date ON registry_events(date)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_events_kind_date ON registry_events(event_kind, date)")
+        # Filled by _migrate_v8, which moves the registry cards it reads into the sections table
+
+    # Section files stored in the sections table since v8, with the keys of older dumps
+    SECTION_KEYS = ("osanikud", "kasusaajad", "kaardile_kantud_isikud", "isikud", "registrikaardid", "kaardid")
+
+    def _migrate_v8(self):
+        # Section files in their own table, so a dossier loads without its (often large) registry cards
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS sections (
+            company_code INTEGER NOT NULL, key TEXT NOT NULL, data JSON NOT NULL, PRIMARY KEY (company_code, key))""")
+        for key in self.SECTION_KEYS:
+            self.conn.execute(f"""INSERT OR REPLACE INTO sections SELECT code, '{key}', json_extract(full_data, '$.{key}')
+                                  FROM companies WHERE json_type(full_data, '$.{key}') IS NOT NULL""")
+        paths = ", ".join(f"'$.{key}'" for key in self.SECTION_KEYS)
+        self.conn.execute(f"""UPDATE companies SET full_data = json_remove(full_data, {paths})
+                              WHERE code IN (SELECT company_code FROM sections)""")
+        if self.conn.execute("SELECT 1 FROM registry_events LIMIT 1").fetchone() is None: self.populate_events()
+
+    def _migrate_v9(self):
+        # One row per person across companies and roles, which persons rows point to (see _resolve_persons())
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS person_entities (
+            id INTEGER PRIMARY KEY, name TEXT, norm TEXT, id_code TEXT, id_hash TEXT, country TEXT, kind TEXT,
+            matched_by TEXT, roles INTEGER, companies INTEGER)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_person_entities_norm ON person_entities(norm)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_person_entities_id_code ON person_entities(id_code)")
+        if "person_entity_id" not in {r[1] for r in self.conn.execute("PRAGMA table_info(persons)")}:
+            self.conn.execute("ALTER TABLE persons ADD COLUMN person_entity_id INTEGER REFERENCES person_entities(id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_persons_entity ON persons(person_entity_id)")
+        # Rows from before v9 stored a missing id code as the text 'None', which would make all of them one person
+        self.conn.execute("UPDATE persons SET id_code = NULL WHERE id_code = 'None'")
+        if self.conn.execute("SELECT 1 FROM persons LIMIT 1").fetchone(): self.populate_person_entities()
+
+    def _migrate_v10(self):
+        # Company-to-company edges through shared people, for linked_companies() (see _company_links_insert())
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS company_links (
+            company_code INTEGER NOT NULL, linked_code INTEGER NOT NULL, person_entity_id INTEGER NOT NULL,
+            source TEXT, linked_source TEXT, since TEXT, until TEXT)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_links_company ON company_links(company_code, linked_code)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_links_person ON company_links(person_entity_id)")
+        if self.conn.execute("SELECT 1 FROM person_entities LIMIT 1").fetchone(): self.populate_company_links()
+
+    def _migrate_v11(self):
+        # Bumped per company by enrichment, so caches drop that dossier instead of a whole generation
+        if "revision" not in {r[1] for r in self.conn.execute("PRAGMA table_info(companies)")}:
+            self.conn.execute("ALTER TABLE companies ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+
+    def rebuild_locations(self):
+        """Rebuild the locations table and the companies location columns from each dossier's EHAK text."""
+        with self.conn:
+            self.conn.execute("DELETE FROM locations"); self._location_ids_cache = None
+            rows = self.conn.execute("""SELECT code, json_extract(full_data, '$.asukoha_ehak_tekstina'),
+                                        json_extract(full_data, '$.asukoha_ehak_kood') FROM companies""").fetchall()
+            updates = []
+            for code, ehak, ehak_code in rows:
+                county, municipality, _ = parse_ehak(ehak)
+                updates.append((county, municipality, *self._location_ids(ehak, ehak_code), code))
+            self.conn.executemany("""UPDATE companies SET maakond = ?, linn = ?, county_id = ?, municipality_id = ?,
+                                     settlement_id = ? WHERE code = ?""", updates)
+        # Location columns feed the snapshot, so an upgraded database must not reuse an older one
+        self.bump_generation()
+
+    def _add_location(self, level, parent, name, ehak_code):
+        return self.conn.execute("INSERT INTO locations (level, parent_id, name, norm, ehak_code) VALUES (?, ?, ?, ?, ?)",
+                                 (level, parent, name, normalize_location(name), ehak_code)).lastrowid
+
+    def insert_batch_base(self, batch):
+        with self._stage("encode"):
+            rows = [(i.get('ariregistri_kood'), i.get('nimi'), i.get('ettevotja_staatus_tekstina'),
+                     status_code(i.get('ettevotja_staatus_tekstina') or i.get('ettevotja_staatus')), self._extract_county(i), self._extract_city(i),
+                     *self._location_ids(i.get('asukoha_ehak_tekstina'), i.get('asukoha_ehak_kood')),
+                     i.get('ettevotja_oiguslik_vorm'), self._normalize_date(i.get('ettevotja_esmakande_kpv')),
+                     json.dumps(i), i.get('kmkr_nr') or None) for i in batch]
+            # In key order every insert appends to the rightmost leaf of the table b-tree
+            rows.sort(key=lambda r: r[0])
+        with self._stage("write"), self.conn:
+            self.conn.executemany(
+                """INSERT OR REPLACE INTO companies
+                   (code, name, status, status_code, maakond, linn, county_id, municipality_id, settlement_id,
+                    legal_form, founded_at, full_data, vat_number)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+
+    def update_batch_json(self, key, data_map):
+        with self._stage("encode"):
+            rows = [(code, key, json.dumps(val), code) for code, val in sorted(data_map.items())]
+            events = [e for code, val in data_map.items() for e in self._event_rows(code, {key: val})] \
+                if key == "registrikaardid" else None
+        with self._stage("write"), self.conn:
+            # Sections of companies missing from companies are dropped, as json_set() on no row would
+            self.conn.executemany("""INSERT OR REPLACE INTO sections (company_code, key, data)
+                                     SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM companies WHERE code = ?)""", rows)
+            if events is not None:
+                # The section replaces the dossier's cards, so it replaces their events too
+                self.conn.executemany("DELETE FROM registry_events WHERE company_code = ?", [(code,) for code in data_map])
+                self.conn.executemany(self.EVENT_INSERT, events)
+
+    def update_batch_general(self, batch):
+        patches, derived = [], []
+        with self._stage("encode"):
+            for item in sorted(batch, key=lambda i: i.get('ariregistri_kood') or 0):
+                code = item.get('ariregistri_kood')
+                if not code: continue
+                patches.append((json.dumps(item), code))
+                updates = []; params = []
+                status = item.get('staatus_tekstina') or item.get('yldandmed', {}).get('staatus_tekstina')
+                if status:
+                    updates.append("status = ?"); params.append(status)
+                    updates.append("status_code = ?"); params.append(status_code(status))
+                founded = self._normalize_date(item.get('esmaregistreerimise_kpv'))
+                if founded: updates.append("founded_at = COALESCE(?, founded_at)"); params.append(founded)
+                # Extract new derived columns
+                cap_amt, cap_cur = self._extract_latest_capital(item)
+                if cap_amt is not None:
+                    updates.append("capital = ?"); params.append(cap_amt)
+                    updates.append("capital_currency = ?"); params.append(cap_cur)
+                email, phone, website = self._extract_contacts(item)
+                if email: updates.append("email = ?"); params.append(email)
+                if phone: updates.append("phone = ?"); params.append(phone)
+                if website: updates.append("website = ?"); params.append(website)
+                emp = self._extract_latest_employees(item)
+                if emp is not None: updates.append("employee_count = ?"); params.append(emp)
+                main_emtak = self._extract_main_emtak(item)
+                if main_emtak: updates.append("main_emtak = ?"); params.append(main_emtak)
+                if updates:
+                    params.append(code); derived.append((f"UPDATE companies SET {', '.join(updates)} WHERE code = ?", params))
+        with self._stage("write"), self.conn:
+            self.conn.executemany("UPDATE companies SET full_data = json_patch(full_data, ?) WHERE code = ?", patches)
+            for query, params in derived: self.conn.execute(query, params)
+
+    def update_enrichment(self, code: int, enrichment: dict):
+        with self.conn:
+            self.conn.execute("UPDATE companies SET enrichment = ?, revision = revision + 1 WHERE code = ?", (json.dumps(enrichment), code))
+
+    def generation(self):
+        """Counter bumped whenever company documents change (merge, enrichment)."""
+        try:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        except sqlite3.OperationalError:  # read-only handle on a file that predates the meta table
+            return 0
+        return int(row[0]) if row else 0
+
+    def bump_generation(self):
+        with self.conn:
+            self.conn.execute("""INSERT INTO meta VALUES ('generation', '1')
+                                 ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1""")
+
+    def _activities(self, alias, name):
+        return (f"json_each({alias}.full_data, '$.yldandmed.teatatud_tegevusalad') AS {name}", "1",
+                {"code": f"json_extract({name}.value, '$.emtak_kood')", "text": f"json_extract({name}.value, '$.emtak_tekstina')",
+                 "main": f"json_extract({name}.value, '$.on_pohitegevusala')"})
+
+    def _annual_reports(self, alias, name):
+        return (f"json_each({alias}.full_data, '$.yldandmed.info_majandusaasta_aruannetest') AS {name}", "1",
+                {"period_end": f"json_extract({name}.value, '$.majandusaasta_perioodi_lopp_kpv')",
+                 "employees": f"json_extract({name}.value, '$.tootajate_arv')",
+                 "emtak_text": f"json_extract({name}.value, '$.tegevusala_emtak_tekstina')"})
+
+    def _person_clause(self, alias, person):
+        return (f"""({alias}.full_data LIKE ? OR {alias}.enrichment LIKE ?
+                    OR EXISTS (SELECT 1 FROM sections s WHERE s.company_code = {alias}.code AND s.data LIKE ?))""",
+                [f"%{person}%"] * 3)
+
+    def _sections(self, codes, keys=None):
+        """{code: [(key, JSON text)]} of the stored sections of codes, in write order; keys limits the keys loaded."""
+        parts = defaultdict(list)
+        if keys is not None and not keys: return parts
+        query = f"SELECT company_code, key, data FROM sections WHERE company_code IN ({','.join('?' * len(codes))})"
+        params = list(codes)
+        if keys is not None: query += f" AND key IN ({','.join('?' * len(keys))})"; params += list(keys)
+        # A primary-key lookup per code; not profiled, so each search reports as one query
+        for code, key, data in self.conn.execute(query + " ORDER BY company_code, rowid", params):
+            parts[code].append((key, data))
+        return parts
+
+    def _dossier(self, row, parts):
+        data = json.loads(row['full_data'])
+        for key, value in parts.get(row['code'], ()): data[key] = json.loads(value)
+        if row['enrichment']: data['enrichment'] = json.loads(row['enrichment'])
+        return data
+
+    def get_companies(self, codes, chunk_size=500, sections=None):
+        """Yield (code, dossier) for the given codes, one WHERE code IN (...) query per chunk.
+
+        Unknown codes are skipped; rows come back in primary-key order within a chunk. sections
+        lists the section keys to load (see stored_sections()); None loads the whole dossier.
+        """
+        codes = sorted({int(c) for c in codes})
+        for i in range(0, len(codes), chunk_size):
+            chunk = codes[i:i + chunk_size]; parts = self._sections(chunk, sections)
+            query = f"SELECT code, full_data, enrichment FROM companies WHERE code IN ({','.join('?' * len(chunk))})"
+            for row in self._query("get_companies", query, chunk):
+                yield row['code'], self._dossier(row, parts)
+
+    def search(self, term=None, person=None, location=None, status=None, limit=None,
+               emtak=None, founded_after=None, founded_before=None, legal_form=None,
+               min_capital=None, max_capital=None, has_email=False, has_phone=False, has_website=False,
+               min_employees=None, max_employees=None, code_range=None, codes=None, after=None, ordered=False, sections=None):
+        """Yield matching dossiers. after/ordered give code-ordered keyset pages (see search_page()).
+
+        sections limits the section keys loaded into each dossier (see get_companies()).
+        """
+        filters = dict(location=location, status=status, emtak=emtak, founded_after=founded_after,
+                       founded_before=founded_before, legal_form=legal_form, min_capital=min_capital,
+                       max_capital=max_capital, has_email=has_email, has_phone=has_phone, has_website=has_website,
+                       min_employees=min_employees, max_employees=max_employees, code_range=code_range)
+        if self.snapshot is not None and not (term or person or codes is not None) and self.snapshot.covers(**filters):
+            if location: filters["location"] = self.resolve_location(location)
+            matched = self.snapshot.filter(**filters)
+            if after is not None: matched = matched[matched.searchsorted(int(after), side="right"):]
+            for _, data in self.get_companies(matched[:limit] if limit else matched, sections=sections): yield data
+            return
+        clauses, params = self._company_filters(
+            term=term, person=person, location=location, status=status, emtak=emtak,
+            founded_after=founded_after, founded_before=founded_before, legal_form=legal_form,
+            min_capital=min_capital, max_capital=max_capital,
+            has_email=has_email, has_phone=has_phone, has_website=has_website,
+            min_employees=min_employees, max_employees=max_employees, code_range=code_range, codes=codes, after=after)
+        query = "SELECT * FROM companies WHERE 1=1" + "".join(f" AND {c}" for c in clauses)
+        if ordered or after is not None: query += " ORDER BY code"
+        if limit: query += f" LIMIT {int(limit)}"
+        cursor = self._query("search", query, params)
+        try:
+            while rows := cursor.fetchmany(500):
+                parts = self._sections([row['code'] for row in rows], sections)
+                for row in rows: yield self._dossier(row, parts)
+        finally:
+            cursor.close()  # also when the caller closes the generator before the last row
+
+    def build_name_index(self, batch_size=50000):
+        """Rebuild the normalized-name and trigram tables used by fuzzy_names()."""
+        with self.conn:
+            for table in ("name_index", "name_trigrams", "name_trigram_df"): self.conn.execute(f"DELETE FROM {table}")
+            # Loading into an unindexed table and indexing once is faster than 5M B-tree inserts
+            self.conn.execute("DROP INDEX IF EXISTS idx_name_trigrams")
+            cur = self.conn.execute("SELECT code, name FROM companies WHERE name IS NOT NULL")
+            while rows := cur.fetchmany(batch_size):
+                norms = [(code, normalize_name(name)) for code, name in rows]
+                self.conn.executemany("INSERT INTO name_index VALUES (?, ?)", norms)
+                self.conn.executemany("INSERT INTO name_trigrams VALUES (?, ?)",
+                                      [(g, code) for code, norm in norms for g in name_trigrams(norm)])
+            self.conn.execute("CREATE INDEX idx_name_trigrams ON name_trigrams(trigram, code)")
+            self.conn.execute("INSERT INTO name_trigram_df SELECT trigram, COUNT(*) FROM name_trigrams GROUP BY trigram")
+
+    def fuzzy_names(self, name, limit=10, min_score=0.3, candidates=200):
+        """Rank companies by trigram similarity (Dice coefficient) of their normalized names.
+
+        Candidates come from the rarer half of the query's trigrams, so common fragments such
+        as "  t" do not drag in most of the table. Returns [(code, name, score)], best first.
+        """
+        norm = normalize_name(name); grams = name_trigrams(norm)
+        if not grams: return []
+        df = dict(self.conn.execute(f"SELECT trigram, df FROM name_trigram_df WHERE trigram IN ({','.join('?' * len(grams))})", list(grams)))
+        known = sorted(df, key=df.get); probe = known[:max(4, (len(known) + 1) // 2)]
+        rows = self._query("fuzzy", f"""
+            SELECT n.code, n.norm, c.name FROM (
+                SELECT code FROM name_trigrams WHERE trigram IN ({','.join('?' * len(probe))})
+                GROUP BY code ORDER BY COUNT(*) DESC LIMIT ?) t
+            JOIN name_index n ON n.code = t.code JOIN companies c ON c.code = t.code
+            UNION SELECT n.code, n.norm, c.name FROM name_index n JOIN companies c ON c.code = n.code WHERE n.norm = ?""",
+            [*probe, candidates, norm]).fetchall() if probe else []
+        scored = []
+        for code, cand_norm, cand_name in rows:
+            other = name_trigrams(cand_norm)
+            score = 1.0 if cand_norm == norm else 2 * len(grams & other) / (len(grams) + len(other))
+            # Exact normalized matches rank above reordered words with the same trigram set
+            if score >= min_score: scored.append((-score, cand_norm != norm, cand_name, code))
+        scored.sort()
+        return [(code, cand_name, round(-neg, 3)) for neg, _, cand_name, code in scored[:limit]]
+
+    BATCH_COLUMNS = ("code", "name", "status", "maakond", "linn", "legal_form", "founded_at", "employee_count",
+                     "capital", "capital_currency", "vat_number", "email", "phone", "website")
+
+    def lookup_batch(self, values, chunk_size=50000, fuzzy=False, min_score=0.6):
+        """Resolve registry codes or company names in bulk.
+
+        values is consumed chunk_size at a time through a temp table, so memory stays bounded
+        for any input size. Codes join on the primary key and names on idx_name; with fuzzy,
+        names without an exact hit fall back to the best fuzzy_names() candidate. Yields
+        (seq, value, match, score, row) in input order; match is "code", "name", "fuzzy" or
+        None for no hit, and row is a tuple in BATCH_COLUMNS order. A name shared by several
+        companies yields one result per company.
+        """
+        cols = ", ".join(f"c.{c}" for c in self.BATCH_COLUMNS)
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS batch_input (seq INTEGER PRIMARY KEY, value TEXT, code INTEGER, name TEXT)")
+        query = f"""SELECT b.seq, b.value, b.code IS NOT NULL AS by_code, {cols}
+                    FROM batch_input b LEFT JOIN companies c ON c.code = b.code WHERE b.code IS NOT NULL
+                    UNION ALL
+                    SELECT b.seq, b.value, 0, {cols}
+                    FROM batch_input b LEFT JOIN companies c ON c.name = b.name WHERE b.code IS NULL
+                    ORDER BY 1"""
+        values = iter(values); seq = 0
+        while chunk := list(islice(values, chunk_size)):
+            rows = []
+            for value in chunk:
+                value = (value or "").strip(); is_code = value.isdigit()
+                rows.append((seq, value, int(value) if is_code else None, None if is_code else (value or None))); seq += 1
+            with self.conn:
+                self.conn.execute("DELETE FROM batch_input")
+                self.conn.executemany("INSERT INTO batch_input VALUES (?, ?, ?, ?)", rows)
+            cur = self._query("batch", query); cur.row_factory = None
+            for pos, value, by_code, *row in cur.fetchall():
+                if row[0] is not None:
+                    yield pos, value, ("code" if by_code else "name"), 1.0, tuple(row)
+                elif fuzzy and value and not by_code and (best := self.fuzzy_names(value, limit=1, min_score=min_score)):
+                    code, _, score = best[0]
+                    yield pos, value, "fuzzy", score, tuple(self.conn.execute(f"SELECT {cols} FROM companies c WHERE c.code = ?", (code,)).fetchone())
+                else:
+                    yield pos, value, None, None, None
+
+    def is_file_processed(self, filename: str):
+        return self.conn.execute("SELECT 1 FROM sync_state WHERE filename=? AND status='DONE'", (filename,)).fetchone() is not None
+
+    def mark_file_status(self, filename: str, status: str):
+        with self.conn: self.conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (filename, status))
+
+    EVENT_INSERT = "INSERT INTO registry_events (company_code, date, event_type, event_kind, entry_no) VALUES (?, ?, ?, ?, ?)"
+
+    def populate_events(self):
+        """Rebuild registry_events from the registry cards stored in every dossier."""
+        with self.conn:
+            self.conn.execute("DELETE FROM registry_events")
+            cursor = self.conn.execute("SELECT company_code, key, data FROM sections WHERE key IN ('registrikaardid', 'kaardid')")
+            batch = []
+            for code, key, data in cursor:
+                batch.extend(self._event_rows(code, {key: json.loads(data)}))
+                if len(batch) >= 10000: self.conn.executemany(self.EVENT_INSERT, batch); batch = []
+            if batch: self.conn.executemany(self.EVENT_INSERT, batch)
+        total = self.conn.execute("SELECT COUNT(*) FROM registry_events").fetchone()[0]
+        logger.info(f"Populated {total:,} registry events")
+
+    PERSON_INSERT = """INSERT INTO persons (company_code, source, first_name, last_name, full_name,
+                       id_code, id_hash, role, start_date, end_date,
+                       ownership_pct, contribution_amount, currency, country) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)"""
 
     def populate_persons(self):
         logger.info("Populating persons table...")
         with self.conn:
             self.conn.execute("DELETE FROM persons")
-            cursor = self.conn.execute("SELECT code, full_data FROM companies")
+            # Only the person sections, not whole dossiers; grouped so each company yields its rows once
+            cursor = self.conn.execute("""SELECT company_code, key, data FROM sections
+                                          WHERE key IN ('kaardile_kantud_isikud', 'isikud', 'osanikud', 'kasusaajad')
+                                          ORDER BY company_code""")
             batch = []; count = 0
-            for row in cursor:
-                code = row[0]
-                data = json.loads(row[1])
-                # Board members from kaardile_kantud_isikud
-                for group in data.get('isikud', []):
-                    if isinstance(group, dict):
-                        for p in group.get('kaardile_kantud_isikud', []):
-                            first = p.get('eesnimi', '')
-                            last = p.get('nimi_arinimi', '')
-                            full = f"{first} {last}".strip()
-                            batch.append((code, 'board', first or None, last or None, full or None,
-                                         str(p.get('isikukood_registrikood', '')) or None,
-                                         p.get('isikukood_hash'),
-                                         p.get('isiku_roll_tekstina'),
-                                         p.get('algus_kpv'), p.get('lopp_kpv'),
-                                         None, None, None, None))
-                # Shareholders from osanikud
-                for group in data.get('osanikud', []):
-                    if isinstance(group, dict):
-                        for s in group.get('osanikud', []):
-                            first = s.get('eesnimi', '')
-                            last = s.get('nimi_arinimi', '')
-                            full = f"{first} {last}".strip()
-                            pct = s.get('osaluse_protsent')
-                            amt = s.get('osamaksu_summa') or s.get('osaluse_suurus')
-                            cur = s.get('valuuta') or s.get('osaluse_valuuta')
-                            try: pct = float(pct) if pct else None
-                            except (TypeError, ValueError): pct = None
-                            try: amt = float(amt) if amt else None
-                            except (TypeError, ValueError): amt = None
-                            batch.append((code, 'shareholder', first or None, last or None, full or None,
-                                         str(s.get('isikukood_registrikood', '')) or None,
-                                         s.get('isikukood_hash'),
-                                         s.get('osaluse_omandiliik_tekstina'),
-                                         s.get('algus_kpv'), s.get('lopp_kpv'),
-                                         pct, amt, cur, None))
-                # Beneficiaries from kasusaajad
-                for group in data.get('kasusaajad', []):
-                    if isinstance(group, dict):
-                        for b in group.get('kasusaajad', []):
-                            first = b.get('eesnimi', '')
-                            last = b.get('nimi', '')
-                            full = f"{first} {last}".strip()
-                            batch.append((code, 'beneficiary', first or None, last or None, full or None,
-                                         str(b.get('isikukood_registrikood', '')) or None,
-                                         b.get('isikukood_hash'),
-                                         b.get('kontrolli_teostamise_viis_tekstina'),
-                                         None, None, None, None, None,
-                                         b.get('aadress_riik_tekstina')))
+            for code, group in groupby(cursor, key=lambda row: row[0]):
+                batch.extend(self._person_rows(code, {key: json.loads(data) for _, key, data in group}))
                 count += 1
                 if len(batch) >= 10000:
-                    self.conn.executemany(
-                        """INSERT INTO persons (company_code, source, first_name, last_name, full_name,
-                           id_code, id_hash, role, start_date, end_date,
-                           ownership_pct, contribution_amount, currency, country) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)""", batch)
+                    self.conn.executemany(self.PERSON_INSERT, batch)
                     batch = []
             if batch:
-                self.conn.executemany(
-                    """INSERT INTO persons (company_code, source, first_name, last_name, full_name,
-                       id_code, id_hash, role, start_date, end_date,
-                       ownership_pct, contribution_amount, currency, country) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)""", batch)
+                self.conn.executemany(self.PERSON_INSERT, batch)
+        total = self.conn.execute("SELECT COUNT(*) FROM persons").fetchone()[0]
+        logger.info(f"Populated {total:,} person records from {count:,} companies")
+
+    def populate_person_entities(self, codes=None):
+        """Rebuild person_entities and persons.person_entity_id from the persons rows.
+
+        With codes, only the entities that those companies' enrichment can regroup. Returns the ids
+        of the entities removed or written, for populate_company_links(), or None if all were.
+        """
+        scope = None if codes is None else self._entity_scope(codes)
+        entities, assignments = self._resolve_persons(scope)
+        with self.conn:
+            if scope is None: self.conn.execute("DELETE FROM person_entities")
+            else: self.conn.executemany("DELETE FROM person_entities WHERE id = ?", [(i,) for i in scope])
+            self.conn.executemany("INSERT INTO person_entities VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", entities)
+            self.conn.executemany("UPDATE persons SET person_entity_id = ? WHERE id = ?", assignments)
+        logger.info(f"Resolved {len(assignments):,} person records into {len(entities):,} people")
+        return None if scope is None else scope | {e[0] for e in entities}
+
+    def populate_company_links(self, max_companies=None, entity_ids=None):
+        """Rebuild company_links from persons and person_entities, skipping people in more than max_companies.
+
+        With entity_ids, only the edges of those people are rebuilt.
+        """
+        with self.conn:
+            for query, params in self._company_links_statements(max_companies, entity_ids): self.conn.execute(query, params)
+        total = self.conn.execute("SELECT COUNT(*) FROM company_links").fetchone()[0]
+        logger.info(f"Linked companies through shared people: {total:,} edges")
+
+    def rebuild_derived_columns(self):
+        logger.info("Rebuilding derived columns from full_data...")
+        cursor = self.conn.execute("SELECT code, full_data FROM companies")
+        count = 0
+        with self.conn:
+            for row in cursor:
+                code = row[0]
+                data = json.loads(row[1])
+                updates = []; params = []
+                cap_amt, cap_cur = self._extract_latest_capital(data)
+                if cap_amt is not None:
+                    updates.append("capital = ?"); params.append(cap_amt)
+                    updates.append("capital_currency = ?"); params.append(cap_cur)
+                email, phone, website = self._extract_contacts(data)
+                if email: updates.append("email = ?"); params.append(email)
+                if phone: updates.append("phone = ?"); params.append(phone)
+                if website: updates.append("website = ?"); params.append(website)
+                emp = self._extract_latest_employees(data)
+                if emp is not None: updates.append("employee_count = ?"); params.append(emp)
+                main_emtak = self._extract_main_emtak(data)
+                if main_emtak: updates.append("main_emtak = ?"); params.append(main_emtak)
+                if updates:
+                    params.append(code)
+                    self.conn.execute(f"UPDATE companies SET {', '.join(updates)} WHERE code = ?", params)
+                count += 1
+                if count % 50000 == 0:
+                    logger.info(f"  Processed {count:,} companies...")
+        logger.info(f"Rebuilt derived columns for {count:,} companies")
+
+    def commit(self): self.conn.commit()
+
+# Name used by older scripts and the test-suite
+RegistryDB = SQLiteBackend
+
+
+class _DuckRow(tuple):
+    """DuckDB result row with the by-name access and dict() support of sqlite3.Row."""
+    names = ()
+    def keys(self): return self.names
+    def __getitem__(self, key):
+        return tuple.__getitem__(self, self.names.index(key) if isinstance(key, str) else key)
+
+class _DuckCursor:
+    """Wraps a DuckDB cursor so its rows are _DuckRow (sqlite3.Row-like) and iteration is batched."""
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.row = type("DuckRow", (_DuckRow,), {"names": tuple(d[0] for d in cursor.description or ())})
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        return None if row is None else self.row(row)
+
+    def fetchmany(self, size):
+        return [self.row(r) for r in self.cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self.row(r) for r in self.cursor.fetchall()]
+
+    def __iter__(self):
+        while rows := self.fetchmany(10000): yield from rows
+
+
+class DuckDBBackend(RegistryBackend):
+    """Columnar backend on an embedded DuckDB file, for scan-heavy analytics (analyze, reports, trends).
+
+    The query layer is shared with SQLiteBackend; what differs is storage. DuckDB has no
+    counterpart to patching one big JSON document per company, so a dossier is kept as its
+    parts: the CSV row and the general data as JSON text on companies, one sections row per
+    section file, and the activities and annual reports that the filters scan as plain tables.
+    get_companies() reassembles the dossier SQLite would hold. Batches are bulk-inserted
+    through Arrow (executemany is row-at-a-time in DuckDB). Fuzzy names, batch lookups, the
+    snapshot and the profiler stay SQLite-only.
+    """
+    LIKE = "ILIKE"
+    # Columns and types of each table; drive both the DDL and the Arrow batches
+    TABLES = {
+        "companies": [("code", "BIGINT"), ("name", "VARCHAR"), ("status", "VARCHAR"), ("status_code", "VARCHAR"),
+                      ("maakond", "VARCHAR"), ("linn", "VARCHAR"), ("county_id", "INTEGER"), ("municipality_id", "INTEGER"),
+                      ("settlement_id", "INTEGER"), ("legal_form", "VARCHAR"), ("founded_at", "VARCHAR"),
+                      ("vat_number", "VARCHAR"), ("capital", "DOUBLE"), ("capital_currency", "VARCHAR"), ("email", "VARCHAR"),
+                      ("phone", "VARCHAR"), ("website", "VARCHAR"), ("employee_count", "BIGINT"), ("main_emtak", "VARCHAR"),
+                      ("base", "VARCHAR"), ("general", "VARCHAR"), ("enrichment", "VARCHAR")],
+        "sections": [("company_code", "BIGINT"), ("key", "VARCHAR"), ("data", "VARCHAR")],
+        "activities": [("company_code", "BIGINT"), ("pos", "INTEGER"), ("emtak_code", "VARCHAR"), ("emtak_text", "VARCHAR"),
+                       ("is_main", "BOOLEAN")],
+        "annual_reports": [("company_code", "BIGINT"), ("pos", "INTEGER"), ("period_end", "VARCHAR"), ("employees", "BIGINT"),
+                           ("emtak_text", "VARCHAR")],
+        "persons": [("company_code", "BIGINT"), ("source", "VARCHAR"), ("first_name", "VARCHAR"), ("last_name", "VARCHAR"),
+                    ("full_name", "VARCHAR"), ("id_code", "VARCHAR"), ("id_hash", "VARCHAR"), ("role", "VARCHAR"),
+                    ("start_date", "VARCHAR"), ("end_date", "VARCHAR"), ("ownership_pct", "DOUBLE"),
+                    ("contribution_amount", "DOUBLE"), ("currency", "VARCHAR"), ("country", "VARCHAR"),
+                    ("person_entity_id", "BIGINT")],
+        "person_entities": [("id", "BIGINT"), ("name", "VARCHAR"), ("norm", "VARCHAR"), ("id_code", "VARCHAR"),
+                            ("id_hash", "VARCHAR"), ("country", "VARCHAR"), ("kind", "VARCHAR"), ("matched_by", "VARCHAR"),
+                            ("roles", "BIGINT"), ("companies", "BIGINT")],
+        "company_links": [("company_code", "BIGINT"), ("linked_code", "BIGINT"), ("person_entity_id", "BIGINT"),
+                          ("source", "VARCHAR"), ("linked_source", "VARCHAR"), ("since", "VARCHAR"), ("until", "VARCHAR")],
+        "registry_events": [("company_code", "BIGINT"), ("date", "VARCHAR"), ("event_type", "VARCHAR"),
+                            ("event_kind", "VARCHAR"), ("entry_no", "BIGINT")],
+        "locations": [("id", "INTEGER"), ("level", "INTEGER"), ("parent_id", "INTEGER"), ("name", "VARCHAR"),
+                      ("norm", "VARCHAR"), ("ehak_code", "VARCHAR")],
+    }
+    # Tables whose rows get an id from a sequence, like SQLite's INTEGER PRIMARY KEY
+    SEQUENCES = ("persons", "registry_events")
+    # Derived company columns set by update_batch_general(), in TABLES order after code
+    DERIVED = ("status", "status_code", "founded_at", "capital", "capital_currency", "email", "phone", "website",
+               "employee_count", "main_emtak")
+
+    def __init__(self, db_path: Path, read_only=False):
+        import duckdb, pyarrow  # noqa: F401  (pyarrow carries the bulk inserts)
+        self.db_path = db_path
+        self.conn = duckdb.connect(str(db_path), read_only=read_only)
+        if not read_only: self._ensure_schema()
+
+    def _ensure_schema(self):
+        for table, columns in self.TABLES.items():
+            cols = ", ".join(f"{name} {kind}" for name, kind in columns)
+            if table in self.SEQUENCES:
+                self.conn.execute(f"CREATE SEQUENCE IF NOT EXISTS {table}_id")
+                cols = f"id BIGINT DEFAULT nextval('{table}_id'), {cols}"
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({cols})")
+        # Files created before person entities existed
+        self.conn.execute("ALTER TABLE persons ADD COLUMN IF NOT EXISTS person_entity_id BIGINT")
+        self.conn.execute("ALTER TABLE companies ADD COLUMN IF NOT EXISTS revision BIGINT DEFAULT 0")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS sync_state (filename VARCHAR PRIMARY KEY, status VARCHAR)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key VARCHAR PRIMARY KEY, value VARCHAR)")
+
+    def _query(self, label, query, params=()):
+        # A cursor per query: results on the shared connection would be replaced by the next execute()
+        return _DuckCursor(self.conn.cursor().execute(query, list(params)))
+
+    @contextmanager
+    def _transaction(self):
+        self.conn.execute("BEGIN TRANSACTION")
+        try: yield
+        except BaseException: self.conn.execute("ROLLBACK"); raise
+        else: self.conn.execute("COMMIT")
+
+    @contextmanager
+    def _batch(self, table, rows, columns=None, name="_batch"):
+        """Register rows (tuples in columns order, default all of table's) as the Arrow view name."""
+        import pyarrow as pa
+        kinds = {"id": "BIGINT", **dict(self.TABLES[table])}; columns = columns or [c for c, _ in self.TABLES[table]]
+        arrow = {"BIGINT": pa.int64(), "INTEGER": pa.int32(), "DOUBLE": pa.float64(), "VARCHAR": pa.string(), "BOOLEAN": pa.bool_()}
+        values = list(zip(*rows)) if rows else [()] * len(columns); arrays = []
+        for col, vals in zip(columns, values):
+            kind = kinds[col]
+            try: arrays.append(pa.array(vals, arrow[kind]))
+            except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+                # The registry is loosely typed (numbers as text and back); coerce like SQLite's column affinity
+                arrays.append(pa.array([self._coerce(v, kind) for v in vals], arrow[kind]))
+        self.conn.register(name, pa.table(arrays, names=list(columns)))
+        try: yield name
+        finally: self.conn.unregister(name)
+
+    @staticmethod
+    def _coerce(value, kind):
+        if value is None: return None
+        try:
+            if kind in ("BIGINT", "INTEGER"): return int(value)
+            if kind == "DOUBLE": return float(value)
+        except (TypeError, ValueError):
+            return None
+        if kind == "BOOLEAN": return bool(value)
+        return value if isinstance(value, str) else json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+
+    def _insert(self, table, rows, columns=None):
+        if not rows: return
+        with self._batch(table, rows, columns) as batch:
+            cols = ", ".join(columns or [c for c, _ in self.TABLES[table]])
+            self.conn.execute(f"INSERT INTO {table} ({cols}) SELECT * FROM {batch}")
+
+    def _add_location(self, level, parent, name, ehak_code):
+        # Places are only ever added, so ids run 1..n like SQLite's rowids
+        loc_id = len(self._location_ids_cache) + 1
+        self.conn.execute("INSERT INTO locations VALUES (?, ?, ?, ?, ?, ?)",
+                          [loc_id, level, parent, name, normalize_location(name), ehak_code])
+        return loc_id
+
+    def _activities(self, alias, name):
+        return (f"activities {name}", f"{name}.company_code = {alias}.code",
+                {"code": f"{name}.emtak_code", "text": f"{name}.emtak_text", "main": f"{name}.is_main", "pos": f"{name}.pos"})
+
+    def _annual_reports(self, alias, name):
+        return (f"annual_reports {name}", f"{name}.company_code = {alias}.code",
+                {"period_end": f"{name}.period_end", "employees": f"{name}.employees", "emtak_text": f"{name}.emtak_text",
+                 "pos": f"{name}.pos"})
+
+    def _person_clause(self, alias, person):
+        # The same text search as SQLite's LIKE over full_data, spread over the dossier's parts
+        return (f"""(EXISTS (SELECT 1 FROM sections s WHERE s.company_code = {alias}.code AND s.data ILIKE ?)
+                    OR {alias}.base ILIKE ? OR {alias}.general ILIKE ? OR {alias}.enrichment ILIKE ?)""",
+                [f"%{person}%"] * 4)
+
+    @staticmethod
+    def _merge_patch(target, patch):
+        """RFC 7396 merge of patch into target, as SQLite's json_patch() does."""
+        if not isinstance(patch, dict): return patch
+        target = dict(target) if isinstance(target, dict) else {}
+        for key, value in patch.items():
+            if value is None: target.pop(key, None)
+            else: target[key] = DuckDBBackend._merge_patch(target.get(key), value)
+        return target
+
+    def _codes(self, codes):
+        """Register codes as the one-column Arrow view _codes, for joins in place of long IN lists."""
+        return self._batch("companies", [(c,) for c in codes], ["code"], name="_codes")
+
+    def _delete_codes(self, table, codes, column="company_code"):
+        with self._codes(codes):
+            self.conn.execute(f"DELETE FROM {table} WHERE {column} IN (SELECT code FROM _codes)")
+
+    def insert_batch_base(self, batch):
+        with self._stage("encode"):
+            rows = {}
+            for i in batch:
+                status = i.get('ettevotja_staatus_tekstina')
+                rows[i.get('ariregistri_kood')] = (
+                    i.get('ariregistri_kood'), i.get('nimi'), status, status_code(status or i.get('ettevotja_staatus')),
+                    self._extract_county(i), self._extract_city(i),
+                    *self._location_ids(i.get('asukoha_ehak_tekstina'), i.get('asukoha_ehak_kood')),
+                    i.get('ettevotja_oiguslik_vorm'), self._normalize_date(i.get('ettevotja_esmakande_kpv')),
+                    i.get('kmkr_nr') or None, json.dumps(i))
+            rows = list(rows.values())
+        columns = ["code", "name", "status", "status_code", "maakond", "linn", "county_id", "municipality_id",
+                   "settlement_id", "legal_form", "founded_at", "vat_number", "base"]
+        with self._stage("write"), self._transaction():
+            # INSERT OR REPLACE in SQLite: the new row replaces the whole dossier
+            for table in ("sections", "activities", "annual_reports"): self._delete_codes(table, list(rows))
+            self._delete_codes("companies", list(rows), column="code")
+            self._insert("companies", rows, columns)
+
+    def update_batch_general(self, batch):
+        with self._stage("encode"):
+            items = {}
+            for item in batch:
+                code = item.get('ariregistri_kood')
+                if code: items[code] = self._merge_patch(items.get(code), item)
+            # Merge onto general data already stored, as json_patch() onto full_data would
+            with self._codes(items):
+                stored = self.conn.execute("""SELECT code, general FROM companies JOIN _codes USING (code)
+                                              WHERE general IS NOT NULL""").fetchall()
+            for code, general in stored: items[code] = self._merge_patch(json.loads(general), items[code])
+            derived, activities, reports = [], [], []
+            for code, item in items.items():
+                status = item.get('staatus_tekstina') or item.get('yldandmed', {}).get('staatus_tekstina') or None
+                cap_amt, cap_cur = self._extract_latest_capital(item)
+                email, phone, website = self._extract_contacts(item)
+                derived.append((code, status, status_code(status) if status else None,
+                                self._normalize_date(item.get('esmaregistreerimise_kpv')) or None, cap_amt, cap_cur,
+                                email or None, phone or None, website or None, self._extract_latest_employees(item),
+                                self._extract_main_emtak(item), json.dumps(item)))
+                general = item.get('yldandmed', {})
+                activities.extend((code, pos, a.get('emtak_kood'), a.get('emtak_tekstina'), a.get('on_pohitegevusala'))
+                                  for pos, a in enumerate(general.get('teatatud_tegevusalad') or []) if isinstance(a, dict))
+                reports.extend((code, pos, r.get('majandusaasta_perioodi_lopp_kpv'), r.get('tootajate_arv'),
+                                r.get('tegevusala_emtak_tekstina'))
+                               for pos, r in enumerate(general.get('info_majandusaasta_aruannetest') or []) if isinstance(r, dict))
+        # Each derived column changes only when the item has a value for it (capital brings its currency)
+        sets = ", ".join(f"{col} = COALESCE(b.{col}, c.{col})" for col in self.DERIVED if col != "capital_currency")
+        with self._stage("write"), self._transaction():
+            with self._batch("companies", derived, ["code", *self.DERIVED, "general"]) as b:
+                self.conn.execute(f"""UPDATE companies c SET {sets}, general = b.general, capital_currency =
+                                      CASE WHEN b.capital IS NULL THEN c.capital_currency ELSE b.capital_currency END
+                                      FROM {b} b WHERE c.code = b.code""")
+            for table, rows in (("activities", activities), ("annual_reports", reports)):
+                self._delete_codes(table, list(items))
+                with self._batch(table, rows) as b:
+                    self.conn.execute(f"INSERT INTO {table} SELECT * FROM {b} WHERE company_code IN (SELECT code FROM companies)")
+
+    def update_batch_json(self, key, data_map):
+        with self._stage("encode"):
+            rows = [(code, key, json.dumps(val)) for code, val in data_map.items()]
+            events = [e for code, val in data_map.items() for e in self._event_rows(code, {key: val})] \
+                if key == "registrikaardid" else None
+        with self._stage("write"), self._transaction():
+            with self._batch("sections", rows) as b:
+                self.conn.execute(f"DELETE FROM sections WHERE key = ? AND company_code IN (SELECT company_code FROM {b})", [key])
+                # json_set() on a missing company changes nothing; neither does this
+                self.conn.execute(f"INSERT INTO sections SELECT * FROM {b} WHERE company_code IN (SELECT code FROM companies)")
+            if events is not None:
+                self._delete_codes("registry_events", list(data_map))
+                self._insert("registry_events", events, [c for c, _ in self.TABLES["registry_events"]])
+
+    def update_enrichment(self, code: int, enrichment: dict):
+        self.conn.execute("UPDATE companies SET enrichment = ?, revision = revision + 1 WHERE code = ?", [json.dumps(enrichment), code])
+
+    def generation(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return int(row[0]) if row else 0
+
+    def bump_generation(self):
+        self.conn.execute("""INSERT INTO meta VALUES ('generation', '1')
+                             ON CONFLICT (key) DO UPDATE SET value = CAST(CAST(value AS INTEGER) + 1 AS VARCHAR)""")
+
+    def get_companies(self, codes, chunk_size=500, sections=None):
+        """Yield (code, dossier) for the given codes in code order, assembled as SQLiteBackend stores it.
+
+        sections limits the section keys loaded (None loads all of them).
+        """
+        codes = sorted({int(c) for c in codes})
+        for i in range(0, len(codes), chunk_size):
+            chunk = codes[i:i + chunk_size]; marks = ','.join('?' * len(chunk))
+            parts = defaultdict(list)
+            if sections is None or sections:
+                keys = f" AND key IN ({','.join('?' * len(sections))})" if sections is not None else ""
+                for code, key, data in self._query("get_companies", f"""SELECT company_code, key, data FROM sections
+                                                                      WHERE company_code IN ({marks}){keys} ORDER BY company_code, rowid""",
+                                                   [*chunk, *(sections or ())]):
+                    parts[code].append((key, data))
+            for code, base, general, enrichment in self._query("get_companies", f"""SELECT code, base, general, enrichment
+                                                                              FROM companies WHERE code IN ({marks}) ORDER BY code""", chunk):
+                data = json.loads(base) if base else {}
+                if general: data = self._merge_patch(data, json.loads(general))
+                for key, value in parts[code]: data[key] = json.loads(value)
+                if enrichment: data['enrichment'] = json.loads(enrichment)
+                yield code, data
+
+    def search(self, limit=None, after=None, ordered=False, sections=None, **filters):
+        """Yield matching dossiers in code order (after continues past a code, as in SQLiteBackend.search())."""
+        clauses, params = self._company_filters(after=after, **filters)
+        query = "SELECT code FROM companies WHERE 1=1" + "".join(f" AND {c}" for c in clauses) + " ORDER BY code"
+        if limit: query += f" LIMIT {int(limit)}"
+        cursor = self._query("search", query, params)
+        while rows := cursor.fetchmany(500):
+            for _, data in self.get_companies([r[0] for r in rows], sections=sections): yield data
+
+    def populate_persons(self):
+        logger.info("Populating persons table...")
+        # person_entity_id is set afterwards, by populate_person_entities()
+        columns = [c for c, _ in self.TABLES["persons"] if c != "person_entity_id"]; count = 0
+        with self._transaction():
+            self.conn.execute("DELETE FROM persons"); batch = []
+            # Only the person sections, not whole dossiers; grouped so each company yields its rows once
+            cursor = self._query("persons", """SELECT company_code, key, data FROM sections
+                                               WHERE key IN ('kaardile_kantud_isikud', 'isikud', 'osanikud', 'kasusaajad')
+                                               ORDER BY company_code""")
+            for code, group in groupby(cursor, key=lambda row: row[0]):
+                batch.extend(self._person_rows(code, {key: json.loads(data) for _, key, data in group})); count += 1
+                if len(batch) >= 50000: self._insert("persons", batch, columns); batch = []
+            self._insert("persons", batch, columns)
         total = self.conn.execute("SELECT COUNT(*) FROM persons").fetchone()[0]
         logger.info(f"Populated {total:,} person records from {count:,} companies")
 
+    def populate_person_entities(self, codes=None):
+        """Rebuild person_entities and persons.person_entity_id from the persons rows.
+
+        With codes, only the entities that those companies' enrichment can regroup. Returns the ids
+        of the entities removed or written, for populate_company_links(), or None if all were.
+        """
+        scope = None if codes is None else self._entity_scope(codes)
+        entities, assignments = self._resolve_persons(scope)
+        with self._transaction():
+            if scope is None: self.conn.execute("DELETE FROM person_entities")
+            else:
+                with self._batch("person_entities", [(i,) for i in scope], ["id"]) as b:
+                    self.conn.execute(f"DELETE FROM person_entities WHERE id IN (SELECT id FROM {b})")
+            self._insert("person_entities", entities)
+            with self._batch("persons", assignments, ["person_entity_id", "id"]) as b:
+                self.conn.execute(f"UPDATE persons SET person_entity_id = b.person_entity_id FROM {b} b WHERE persons.id = b.id")
+        logger.info(f"Resolved {len(assignments):,} person records into {len(entities):,} people")
+        return None if scope is None else scope | {e[0] for e in entities}
+
+    def populate_company_links(self, max_companies=None, entity_ids=None):
+        """Rebuild company_links from persons and person_entities, skipping people in more than max_companies.
+
+        With entity_ids, only the edges of those people are rebuilt.
+        """
+        with self._transaction():
+            for query, params in self._company_links_statements(max_companies, entity_ids): self.conn.execute(query, params)
+        total = self.conn.execute("SELECT COUNT(*) FROM company_links").fetchone()[0]
+        logger.info(f"Linked companies through shared people: {total:,} edges")
+
+    def populate_events(self):
+        """Rebuild registry_events from the registry-card sections."""
+        columns = [c for c, _ in self.TABLES["registry_events"]]
+        with self._transaction():
+            self.conn.execute("DELETE FROM registry_events"); batch = []
+            cursor = self._query("events", "SELECT company_code, key, data FROM sections WHERE key IN ('registrikaardid', 'kaardid')")
+            for code, key, data in cursor:
+                batch.extend(self._event_rows(code, {key: json.loads(data)}))
+                if len(batch) >= 50000: self._insert("registry_events", batch, columns); batch = []
+            self._insert("registry_events", batch, columns)
+        total = self.conn.execute("SELECT COUNT(*) FROM registry_events").fetchone()[0]
+        logger.info(f"Populated {total:,} registry events")
+
     def rebuild_derived_columns(self):
-        logger.info("Rebuilding derived columns from full_data...")
-        cursor = self.conn.execute("SELECT code, full_data FROM companies")
+        logger.info("Rebuilding derived columns from the general data...")
+        cursor = self._query("derived", "SELECT code, general FROM companies WHERE general IS NOT NULL")
         count = 0
-        with self.conn:
-            for row in cursor:
-                code = row[0]
-                data = json.loads(row[1])
-                updates = []; params = []
-                cap_amt, cap_cur = self._extract_latest_capital(data)
-                if cap_amt is not None:
-                    updates.append("capital = ?"); params.append(cap_amt)
-                    updates.append("capital_currency = ?"); params.append(cap_cur)
-                email, phone, website = self._extract_contacts(data)
-                if email: updates.append("email = ?"); params.append(email)
-                if phone: updates.append("phone = ?"); params.append(phone)
-                if website: updates.append("website = ?"); params.append(website)
-                emp = self._extract_latest_employees(data)
-                if emp is not None: updates.append("employee_count = ?"); params.append(emp)
-                if updates:
-                    params.append(code)
-                    self.conn.execute(f"UPDATE companies SET {', '.join(updates)} WHERE code = ?", params)
-                count += 1
-                if count % 50000 == 0:
-                    logger.info(f"  Processed {count:,} companies...")
+        while rows := cursor.fetchmany(50000):
+            self.update_batch_general([{**json.loads(general), 'ariregistri_kood': code} for code, general in rows])
+            count += len(rows)
         logger.info(f"Rebuilt derived columns for {count:,} companies")
 
-    def commit(self): self.conn.commit()
+    def build_name_index(self):
+        # Fuzzy name matching runs on SQLite's trigram tables; DuckDB searches names with ILIKE only
+        pass
+
+    def is_file_processed(self, filename: str):
+        return self.conn.execute("SELECT 1 FROM sync_state WHERE filename = ? AND status = 'DONE'", [filename]).fetchone() is not None
+
+    def mark_file_status(self, filename: str, status: str):
+        self.conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", [filename, status])
+
+    def commit(self):
+        # Every writer commits its own transaction
+        pass
+
+
+class DossierCache:
+    """Decoded and optionally translated dossiers keyed by (code, lang), for one sync generation.
+
+    An in-process LRU sits in front of an optional SQLite cache file, so repeated lookups of
+    the same companies skip json.loads of full_data and the translation walk. Every lookup
+    checks the generation (a merge drops everything) and the revisions of the requested
+    companies (an enrichment drops just that dossier), two small indexed reads.
+    Returned dicts are shared between callers and must not be modified.
+    """
+    def __init__(self, db, path=None, maxsize=1024):
+        self.db = db; self.maxsize = maxsize; self.lru = OrderedDict()
+        self.generation = None; self.disk = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self.disk = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            with self.disk:
+                columns = {r[1] for r in self.disk.execute("PRAGMA table_info(dossiers)")}
+                if columns and "revision" not in columns: self.disk.execute("DROP TABLE dossiers")  # from before revisions
+                self.disk.execute("""CREATE TABLE IF NOT EXISTS dossiers (
+                    code INTEGER, lang TEXT, generation INTEGER, revision INTEGER, data TEXT, PRIMARY KEY (code, lang))""")
+        self._check_generation()
+
+    def _check_generation(self):
+        generation = self.db.generation()
+        if generation == self.generation: return
+        self.generation = generation; self.lru.clear()
+        if self.disk:
+            with self.disk: self.disk.execute("DELETE FROM dossiers WHERE generation != ?", (generation,))
+
+    def get(self, code, lang=None):
+        return self.get_many([code], lang=lang).get(int(code))
+
+    def get_many(self, codes, lang=None, chunk_size=500):
+        """Map code -> dossier for every known code; lang="en" returns translated documents."""
+        lang = lang or "et"; found = {}; missing = []
+        self._check_generation()
+        codes = list(dict.fromkeys(int(c) for c in codes))
+        revisions = self.db.revisions(codes, chunk_size=chunk_size)  # unknown codes drop out here
+        for code in codes:
+            if code not in revisions: continue
+            hit = self.lru.get((code, lang))
+            if hit and hit[0] == revisions[code]: self.lru.move_to_end((code, lang)); found[code] = hit[1]
+            else: missing.append(code)
+        if missing and self.disk:
+            for i in range(0, len(missing), chunk_size):
+                chunk = missing[i:i + chunk_size]
+                query = f"SELECT code, revision, data FROM dossiers WHERE lang = ? AND generation = ? AND code IN ({','.join('?' * len(chunk))})"
+                for code, revision, data in self.disk.execute(query, [lang, self.generation, *chunk]):
+                    if revision == revisions[code]: found[code] = self._remember((code, lang), revision, json.loads(data))
+            missing = [c for c in missing if c not in found]
+        if missing:
+            fresh = []
+            for code, data in self.db.get_companies(missing, chunk_size=chunk_size):
+                if lang == "en": data = translate_item(data, to_en=True)
+                found[code] = self._remember((code, lang), revisions[code], data); fresh.append(code)
+            if self.disk and fresh:
+                with self.disk:
+                    self.disk.executemany("INSERT OR REPLACE INTO dossiers VALUES (?, ?, ?, ?, ?)",
+                                          [(c, lang, self.generation, revisions[c], json.dumps(found[c], ensure_ascii=False)) for c in fresh])
+        return found
+
+    def _remember(self, key, revision, data):
+        self.lru[key] = (revision, data); self.lru.move_to_end(key)
+        if len(self.lru) > self.maxsize: self.lru.popitem(last=False)
+        return data
+
+    def close(self):
+        if self.disk: self.disk.close()
+
+class CompanySnapshot:
+    """Derived company columns as typed NumPy arrays, for vectorized filtering.
+
+    Text columns (county, city, status, legal form) are dictionary-encoded; LIKE filters are
+    resolved against the small vocabularies and applied as integer masks. Locations are filtered
+    on the EHAK id columns with the ids from SQLiteBackend.resolve_location(), and known statuses
+    on status_code as resolve_status() gives them. All EMTAK codes of a company are kept as
+    padded integers so a prefix becomes a range test. save() writes one .npy per column and
+    load() memory-maps them, so opening a snapshot costs almost nothing.
+    """
+    TEXT = ("maakond", "linn", "status", "status_code", "legal_form")
+    FILTERS = {"location", "status", "emtak", "founded_after", "founded_before", "legal_form", "min_capital",
+               "max_capital", "has_email", "has_phone", "has_website", "min_employees", "max_employees", "code_range"}
+    EMAIL, PHONE, WEBSITE = 1, 2, 4
+    _LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+    def __init__(self, arrays, vocab, generation):
+        self.arrays = arrays; self.vocab = vocab; self.generation = generation
+
+    def __len__(self): return len(self.arrays["code"])
+
+    @staticmethod
+    def default_path(db_path): return Path(db_path).with_name("snapshot")
+
+    @staticmethod
+    def _emtak_int(code):
+        code = str(code or "")
+        return int(code.ljust(5, "0")) if code.isdigit() and len(code) <= 5 else -1
+
+    @staticmethod
+    def _date_int(text):
+        digits = "".join(ch for ch in str(text or "")[:10] if ch.isdigit())
+        return int(digits.ljust(8, "0")) if digits else 0
+
+    @classmethod
+    def build(cls, db, batch_size=100000):
+        import numpy as np
+        vocab = {col: [] for col in cls.TEXT}; ids = {col: {} for col in cls.TEXT}
+        cols = {k: [] for k in ("code", "capital", "employees", "founded", "flags", "main_emtak", *cls.TEXT, *LOCATION_LEVELS.values())}
+        cur = db.conn.execute(f"""SELECT code, {', '.join(cls.TEXT)}, capital, employee_count, founded_at,
+                                  (email IS NOT NULL) + 2 * (phone IS NOT NULL) + 4 * (website IS NOT NULL), main_emtak,
+                                  {', '.join(LOCATION_LEVELS.values())} FROM companies ORDER BY code""")
+        while rows := cur.fetchmany(batch_size):
+            for code, *texts, capital, employees, founded, flags, main_emtak, county, municipality, settlement in rows:
+                for col, val in zip(LOCATION_LEVELS.values(), (county, municipality, settlement)):
+                    cols[col].append(-1 if val is None else val)
+                cols["code"].append(code)
+                for col, val in zip(cls.TEXT, texts):
+                    if val is None: cols[col].append(-1); continue
+                    if val not in ids[col]: ids[col][val] = len(vocab[col]); vocab[col].append(val)
+                    cols[col].append(ids[col][val])
+                cols["capital"].append(float("nan") if capital is None else capital)
+                cols["employees"].append(-1 if employees is None else employees)
+                cols["founded"].append(cls._date_int(founded)); cols["flags"].append(flags)
+                cols["main_emtak"].append(cls._emtak_int(main_emtak))
+        arrays = {"code": np.array(cols["code"], dtype=np.int64), "capital": np.array(cols["capital"], dtype=np.float64),
+                  "employees": np.array(cols["employees"], dtype=np.int32), "founded": np.array(cols["founded"], dtype=np.int32),
+                  "flags": np.array(cols["flags"], dtype=np.uint8), "main_emtak": np.array(cols["main_emtak"], dtype=np.int32)}
+        for col in (*cls.TEXT, *LOCATION_LEVELS.values()): arrays[col] = np.array(cols[col], dtype=np.int32)
+        # Every reported activity, as (row, code) pairs, for the "any activity" semantics of search()
+        owners, codes = [], []
+        cur = db.conn.execute("""SELECT c.code, json_extract(e.value, '$.emtak_kood') FROM companies c,
+                                 json_each(c.full_data, '$.yldandmed.teatatud_tegevusalad') AS e ORDER BY c.code""")
+        while rows := cur.fetchmany(batch_size):
+            for code, emtak in rows: owners.append(code); codes.append(cls._emtak_int(emtak))
+        # Sorted by code so an EMTAK prefix is one searchsorted slice instead of a full scan
+        emtak_codes = np.array(codes, dtype=np.int32); order = np.argsort(emtak_codes, kind="stable")
+        arrays["activity_emtak"] = emtak_codes[order]
+        arrays["activity_row"] = np.searchsorted(arrays["code"], np.array(owners, dtype=np.int64)).astype(np.int32)[order]
+        return cls(arrays, vocab, db.generation())
+
+    def save(self, path):
+        import numpy as np
+        path = Path(path); path.mkdir(parents=True, exist_ok=True)
+        # Files carry the generation and every write goes through os.replace, so processes that
+        # still have the previous snapshot memory-mapped keep reading intact files
+        for name, arr in self.arrays.items():
+            with open(path / f"{name}-{self.generation}.npy.tmp", "wb") as f: np.save(f, arr)
+            os.replace(path / f"{name}-{self.generation}.npy.tmp", path / f"{name}-{self.generation}.npy")
+        meta = json.dumps({"generation": self.generation, "vocab": self.vocab, "columns": list(self.arrays)}, ensure_ascii=False)
+        (path / "meta.json.tmp").write_text(meta, encoding="utf-8"); os.replace(path / "meta.json.tmp", path / "meta.json")
+        for old in path.glob("*.npy"):
+            if not old.stem.endswith(f"-{self.generation}"): old.unlink()
+
+    @classmethod
+    def load(cls, path, generation=None):
+        """Memory-map a saved snapshot; None if it is missing or not from the given generation."""
+        import numpy as np
+        meta_path = Path(path) / "meta.json"
+        if not meta_path.exists(): return None
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        if generation is not None and meta["generation"] != generation: return None
+        arrays = {name: np.load(Path(path) / f"{name}-{meta['generation']}.npy", mmap_mode="r") for name in meta["columns"]}
+        return cls(arrays, meta["vocab"], meta["generation"])
+
+    def covers(self, **filters):
+        """True when every active filter can be answered from the snapshot."""
+        return all(name in self.FILTERS for name, val in filters.items() if val not in (None, False, "", []))
+
+    def _like(self, col, pattern):
+        """Boolean mask of rows whose text matches SQLite LIKE '%pattern%' (ASCII-only case folding)."""
+        import numpy as np
+        needle = pattern.translate(self._LOWER); values = self.arrays[col]
+        ids = [i for i, v in enumerate(self.vocab[col]) if needle in v.translate(self._LOWER)]
+        if len(ids) <= 4:
+            # A few equality tests are much cheaper than a gather over every row
+            mask = np.zeros(len(values), dtype=bool)
+            for i in ids: mask |= values == i
+            return mask
+        # One extra False slot at the end so the -1 used for NULL looks up False
+        table = np.zeros(len(self.vocab[col]) + 1, dtype=bool); table[ids] = True
+        return table[values]
+
+    def filter(self, location=None, status=None, emtak=None, founded_after=None, founded_before=None,
+               legal_form=None, min_capital=None, max_capital=None, has_email=False, has_phone=False,
+               has_website=False, min_employees=None, max_employees=None, code_range=None):
+        """Codes (ascending) of companies passing all filters, with search() semantics."""
+        import numpy as np
+        a = self.arrays; mask = np.ones(len(self), dtype=bool)
+        if code_range:
+            lo, hi = code_range
+            if lo is not None: mask &= a["code"] >= lo
+            if hi is not None: mask &= a["code"] < hi
+        if isinstance(location, dict):
+            # Resolved {level: ids}: equality on the id column of each matched level
+            hit = np.zeros(len(self), dtype=bool)
+            for level, ids in location.items(): hit |= np.isin(a[LOCATION_LEVELS[level]], ids)
+            mask &= hit
+        elif location: mask &= self._like("maakond", location) | self._like("linn", location)
+        if status:
+            codes = resolve_status(status)
+            if codes:
+                ids = [i for i, v in enumerate(self.vocab["status_code"]) if v in codes]
+                mask &= np.isin(a["status_code"], ids)
+            else: mask &= self._like("status", status)
+        if legal_form: mask &= self._like("legal_form", legal_form)
+        if emtak:
+            has = np.zeros(len(self), dtype=bool)
+            for prefix in (emtak if isinstance(emtak, list) else [emtak]):
+                prefix = str(prefix)
+                if not prefix.isdigit() or len(prefix) > 5: continue
+                lo = int(prefix.ljust(5, "0")); hi = lo + 10 ** (5 - len(prefix))
+                start, stop = np.searchsorted(a["activity_emtak"], [lo, hi])
+                has[a["activity_row"][start:stop]] = True
+            mask &= has
+        if founded_after: mask &= a["founded"] >= self._date_int(founded_after)
+        if founded_before:
+            mask &= (a["founded"] > 0) & (a["founded"] <= self._date_int(founded_before))
+        if min_capital is not None: mask &= a["capital"] >= float(min_capital)
+        if max_capital is not None: mask &= a["capital"] <= float(max_capital)
+        if has_email: mask &= (a["flags"] & self.EMAIL) > 0
+        if has_phone: mask &= (a["flags"] & self.PHONE) > 0
+        if has_website: mask &= (a["flags"] & self.WEBSITE) > 0
+        if min_employees is not None: mask &= a["employees"] >= int(min_employees)
+        if max_employees is not None: mask &= (a["employees"] < 0) | (a["employees"] <= int(max_employees))
+        return a["code"][mask]
 
 # ============================================================
 # Registry Logic
 # ============================================================
 
+def peak_rss_mb():
+    """Peak resident set size of this process and of its finished children (jq), in MiB.
+
+    Returns (None, None) where the resource module is unavailable (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is in bytes on macOS, KiB elsewhere
+    return tuple(round(resource.getrusage(who).ru_maxrss * scale / 2**20, 1)
+                 for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+
+class MergeMetrics:
+    """Per-file and per-stage counters for one merge run.
+
+    Stages are read (decompression and parsing), encode (json.dumps and derived-column extraction)
+    and write (SQLite statements including the batch commit); the rest of a file's wall time, such
+    as sorting a section file by company (group_sections()), is reported as other. Finished files
+    and post-processing steps are logged as one JSON object per line; report() returns the run as
+    a dict for data/runs/.
+    """
+    PROGRESS_SECONDS = 10.0
+
+    def __init__(self, decoder=None):
+        self.started_at = datetime.now(); self.start = time.perf_counter(); self.decoder = decoder
+        self.files = []; self.steps = []; self.current = None
+
+    def start_file(self, name, size):
+        now = time.perf_counter()
+        self.current = {"file": name, "bytes": size, "items": 0, "batches": 0,
+                        "stages": {}, "start": now, "last_progress": now}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try: yield
+        finally: self._add(name, time.perf_counter() - start)
+
+    def _add(self, name, seconds):
+        if self.current is None: return
+        st = self.current["stages"].get(name)
+        if st is None: st = self.current["stages"][name] = {"seconds": 0.0, "calls": 0, "max_ms": 0.0}
+        st["seconds"] += seconds; st["calls"] += 1; st["max_ms"] = max(st["max_ms"], seconds * 1000)
+
+    def timed(self, name, iterable):
+        """Yield from iterable, charging the time spent producing each item to stage name."""
+        it = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try: item = next(it)
+            except StopIteration:
+                self._add(name, time.perf_counter() - start); return
+            self._add(name, time.perf_counter() - start)
+            yield item
+
+    def batch(self, items):
+        """Count a written batch and log progress at most every PROGRESS_SECONDS."""
+        cur = self.current; cur["items"] += items; cur["batches"] += 1
+        now = time.perf_counter()
+        if now - cur["last_progress"] >= self.PROGRESS_SECONDS:
+            cur["last_progress"] = now
+            self._log("merge_progress", file=cur["file"], items=cur["items"],
+                      items_per_sec=round(cur["items"] / (now - cur["start"])))
+
+    def end_file(self):
+        cur = self.current; self.current = None
+        elapsed = time.perf_counter() - cur["start"]
+        stages = {name: {"seconds": round(st["seconds"], 3), "calls": st["calls"], "max_ms": round(st["max_ms"], 1)}
+                  for name, st in cur["stages"].items()}
+        stages["other"] = {"seconds": round(max(elapsed - sum(st["seconds"] for st in cur["stages"].values()), 0), 3)}
+        write = cur["stages"].get("write")
+        rss, children = peak_rss_mb()
+        record = {"file": cur["file"], "seconds": round(elapsed, 3), "items": cur["items"], "bytes_read": cur["bytes"],
+                  "items_per_sec": round(cur["items"] / elapsed) if elapsed else None,
+                  "mb_per_sec": round(cur["bytes"] / 2**20 / elapsed, 2) if elapsed else None,
+                  "batches": cur["batches"],
+                  "batch_commit_ms": {"mean": round(write["seconds"] * 1000 / write["calls"], 1), "max": round(write["max_ms"], 1)} if write else None,
+                  "stages": stages, "peak_rss_mb": rss, "peak_rss_children_mb": children}
+        self.files.append(record); self._log("merge_file", **record)
+
+    @contextmanager
+    def step(self, name):
+        """Time a post-processing step (derived columns, person index, name index, snapshot)."""
+        start = time.perf_counter()
+        try: yield
+        finally:
+            record = {"step": name, "seconds": round(time.perf_counter() - start, 3), "peak_rss_mb": peak_rss_mb()[0]}
+            self.steps.append(record); self._log("merge_step", **record)
+
+    def _log(self, event, **fields):
+        logger.info(json.dumps({"event": event, **fields}, ensure_ascii=False))
+
+    def report(self):
+        rss, children = peak_rss_mb()
+        return {"started_at": self.started_at.isoformat(timespec="seconds"),
+                "seconds": round(time.perf_counter() - self.start, 3), "decoder": self.decoder,
+                "python": sys.version.split()[0], "sqlite": sqlite3.sqlite_version,
+                "items": sum(f["items"] for f in self.files), "bytes_read": sum(f["bytes_read"] for f in self.files),
+                "peak_rss_mb": rss, "peak_rss_children_mb": children, "files": self.files, "steps": self.steps}
+
+    def save(self, runs_dir):
+        """Write report() to runs_dir/merge-<timestamp>.json and return the path."""
+        runs_dir = Path(runs_dir); runs_dir.mkdir(parents=True, exist_ok=True)
+        path = runs_dir / f"merge-{self.started_at.strftime('%Y%m%d-%H%M%S')}.json"
+        path.write_text(json.dumps(self.report(), indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        return path
+
+
 class EstonianRegistry:
     DATA_FILES = [
         "ettevotja_rekvisiidid__lihtandmed.csv.zip", "ettevotja_rekvisiidid__yldandmed.json.zip",
@@ -882,85 +2736,233 @@ class EstonianRegistry:
 
     def __init__(self, data_dir="data", chunk_size=50000, backend: RegistryBackend = None, use_db=True):
         self.data_dir = Path(data_dir); self.download_dir = self.data_dir / "downloads"
-        self.extracted_dir = self.data_dir / "extracted"; self.db_path = self.data_dir / "registry.db"
-        for d in [self.download_dir, self.extracted_dir]: d.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.data_dir / "registry.db"
+        self.download_dir.mkdir(parents=True, exist_ok=True)
         self.chunk_size = chunk_size
         if not use_db: self.db = None
         else: self.db = backend or SQLiteBackend(self.db_path)
 
-    def sync(self, force=False):
+    def sync(self, force=False, decoder="auto", swap=False):
         Downloader(self.download_dir, self.DATA_FILES).run()
-        self.merge(force=force)
+        return self.merge(force=force, decoder=decoder, swap=swap)
 
-    def merge(self, force=False):
-        if not self.db: return
+    def merge(self, force=False, decoder="auto", swap=False, bulk=None):
+        """Load the downloaded zips into the database. Returns the run report (see MergeMetrics).
+
+        Files are streamed straight from the zips; decoder picks the JSON decoder (see select_json_decoder).
+        With swap, the zips are loaded into a new database file next to the live one, which is only
+        read meanwhile; the new file is checked and then swapped in atomically (see _swap_in()).
+        bulk loads through the backend's bulk_load(); None picks it for force and for an empty database.
+        """
+        if not self.db: return None
+        decoder = select_json_decoder(decoder); metrics = MergeMetrics(decoder=decoder); swapped = None
+        if not swap:
+            if self._merge_files(force, decoder, metrics, bulk) and isinstance(self.db, SQLiteBackend) and importlib.util.find_spec("numpy"):
+                with metrics.step("snapshot"): self.load_snapshot()
+        else:
+            if not isinstance(self.db, SQLiteBackend): raise ValueError("swap needs the SQLite backend")
+            live = self.db; self.db = self._new_generation(live)
+            try:
+                self._merge_files(True, decoder, metrics, bulk, live=live)
+                with metrics.step("checks"): rows = self._check_generation(live)
+                with metrics.step("swap"): self._swap_in(live)
+            except BaseException:
+                self._discard_generation(live); raise
+            swapped = {"path": str(self.db.db_path), "rows": rows}
+            self._prune_generations()
+            if importlib.util.find_spec("numpy"):
+                with metrics.step("snapshot"): self.load_snapshot()
+        report = metrics.report()
+        if swapped: report["swap"] = swapped
+        if metrics.files or metrics.steps:
+            report["path"] = str(metrics.save(self.data_dir / "runs"))
+        return report
+
+    def _merge_files(self, force, decoder, metrics, bulk=None, live=None):
+        """Write the downloaded zips into self.db; True when anything was loaded. live is the database a swap replaces."""
         logger.info("Starting Merge...")
-        extracted = {}
+        if bulk is None: bulk = force or self.db.is_empty()
+        self.db.metrics = metrics
+        try:
+            if not bulk: return self._load_files(force, decoder, metrics, live)
+            logger.info("Bulk loading: indexes are built after the load")
+            with self.db.bulk_load(): return self._load_files(force, decoder, metrics, live)
+        finally:
+            self.db.metrics = None
+
+    def _load_files(self, force, decoder, metrics, live=None):
+        import zipfile
+        changed = False
         for f in self.DATA_FILES:
             zp = self.download_dir / f
-            if zp.exists():
-                with zipfile.ZipFile(zp, 'r') as zf:
-                    zf.extractall(self.extracted_dir); extracted[f] = self.extracted_dir / zf.namelist()[0]
-        for f, path in extracted.items():
+            if not zp.exists(): continue
             if not force and self.db.is_file_processed(f):
                 logger.info(f"Skipping {f}"); continue
             logger.info(f"Processing {f}...")
-            if f.endswith('.csv.zip'):
-                batch = []
-                with open(path, 'r', encoding='utf-8-sig') as csvf:
-                    for row in csv.DictReader(csvf, delimiter=';'):
-                        if row.get('ariregistri_kood'):
-                            row['ariregistri_kood'] = int(row['ariregistri_kood']); batch.append(row)
-                        if len(batch) >= self.chunk_size:
-                            self.db.insert_batch_base(batch); batch = []
-                if batch: self.db.insert_batch_base(batch)
-            elif 'yldandmed' in f:
-                batch = []
-                for item in iter_json_array(path):
-                    if item.get('ariregistri_kood'):
-                        item['ariregistri_kood'] = int(item['ariregistri_kood']); batch.append(item)
+            with zipfile.ZipFile(zp, 'r') as zf:
+                member = zf.infolist()[0]; metrics.start_file(f, member.file_size)
+                with zf.open(member) as raw: self._load_file(f, raw, decoder, metrics)
+            with metrics.stage("write"): self.db.mark_file_status(f, 'DONE'); self.db.commit()
+            metrics.end_file(); changed = True
+        # Before the person entities, which join namesakes through the id codes enrichment unmasked
+        if live is not None:
+            with metrics.step("enrichment"): self._copy_enrichment(live)
+        if force:
+            with metrics.step("derived_columns"): self.db.rebuild_derived_columns()
+            with metrics.step("persons"): self.db.populate_persons(); self.db.commit()
+            with metrics.step("person_entities"): self.db.populate_person_entities()
+            with metrics.step("company_links"): self.db.populate_company_links()
+        if changed:
+            logger.info("Rebuilding name index...")
+            with metrics.step("name_index"): self.db.build_name_index(); self.db.bump_generation()
+        return changed
+
+    # Blue/green builds: data/registry.db is a symlink to the current generation file,
+    # registry-<timestamp>.db. A merge with swap builds the next file beside it and repoints
+    # the link with one rename, so readers never see a half-built database or wait on its
+    # write locks; connections opened earlier keep reading their file until they reopen.
+
+    def _new_generation(self, live):
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S"); path = self.data_dir / f"registry-{stamp}.db"; n = 1
+        while path.exists(): path = self.data_dir / f"registry-{stamp}-{n}.db"; n += 1
+        logger.info(f"Building {path.name} next to the live database...")
+        db = SQLiteBackend(path)
+        # Continue the live counter, so caches and snapshots keyed by generation never see a number twice
+        with db.conn: db.conn.execute("INSERT OR REPLACE INTO meta VALUES ('generation', ?)", (str(live.generation()),))
+        return db
+
+    def _copy_enrichment(self, live):
+        """Copy the live database's PDF enrichment into the new file's companies."""
+        new = self.db
+        # PDF enrichment is not in the downloads; it only lives in the current file
+        new.conn.execute("ATTACH DATABASE ? AS live", (str(Path(live.db_path).resolve()),))
+        with new.conn:
+            new.conn.execute("""UPDATE companies SET enrichment = (SELECT enrichment FROM live.companies l WHERE l.code = companies.code)
+                                WHERE code IN (SELECT code FROM live.companies WHERE enrichment IS NOT NULL)""")
+        new.conn.execute("DETACH DATABASE live")
+
+    def _check_generation(self, live, min_ratio=0.9):
+        """Check the new file against the live one. Returns {table: (live rows, new rows)}.
+
+        Raises RuntimeError when the integrity check fails or a table lost more than 1 - min_ratio
+        of its rows (a truncated download, say), so a bad build never replaces the live database.
+        """
+        new = self.db
+        problems = []; rows = {}
+        integrity = new.conn.execute("PRAGMA integrity_check").fetchone()[0]
+        if integrity != "ok": problems.append(f"integrity_check: {integrity}")
+        for table in ("companies", "persons", "registry_events"):
+            try: before = live.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            except sqlite3.OperationalError: before = 0  # table newer than the live schema
+            after = new.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            rows[table] = (before, after)
+            if after < before * min_ratio: problems.append(f"{table} has {after:,} rows, the live database {before:,}")
+        if not rows["companies"][1]: problems.append("no companies loaded")
+        if problems: raise RuntimeError("New database failed its checks: " + "; ".join(problems))
+        return rows
+
+    def _swap_in(self, live):
+        """Point data/registry.db at the new generation file in one atomic rename."""
+        target = Path(self.db.db_path)
+        # Fold the WAL into the main file, so the generation file is complete on its own
+        self.db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        link = self.db_path; staged = link.with_name(link.name + ".swap"); staged.unlink(missing_ok=True)
+        try:
+            os.symlink(target.name, staged)
+        except (OSError, NotImplementedError):
+            # No symlinks (Windows without the privilege): move the file itself into place
+            self.db.conn.close(); live.conn.close()
+            os.replace(target, link); self.db = SQLiteBackend(link); return
+        os.replace(staged, link)
+        live.conn.close()
+        logger.info(f"Swapped in {target.name}")
+
+    def _discard_generation(self, live):
+        failed, self.db = self.db, live
+        failed.conn.close()
+        for suffix in ("", "-wal", "-shm"): Path(f"{failed.db_path}{suffix}").unlink(missing_ok=True)
+
+    def _prune_generations(self, keep=2):
+        """Delete generation files except the current one and the one before it (readers may still hold it)."""
+        current = self.db_path.resolve()
+        files = sorted(self.data_dir.glob("registry-*.db"), key=lambda p: p.stat().st_mtime, reverse=True)
+        others = [f for f in files if f.resolve() != current]
+        for old in others[keep - 1:]:
+            for suffix in ("", "-wal", "-shm"): Path(f"{old}{suffix}").unlink(missing_ok=True)
+        # WAL files left by the plain registry.db from before the first swap, now as old as the files above
+        if others and self.db_path.is_symlink():
+            for suffix in ("-wal", "-shm"): Path(f"{self.db_path}{suffix}").unlink(missing_ok=True)
+
+    def _load_file(self, f, raw, decoder, metrics):
+        """Write one registry file, read from the binary stream raw, in chunk_size batches."""
+        if f.endswith('.csv.zip'):
+            batch = []
+            with io.TextIOWrapper(raw, encoding='utf-8-sig', newline='') as csvf:
+                for row in metrics.timed("read", csv.DictReader(csvf, delimiter=';')):
+                    if row.get('ariregistri_kood'):
+                        row['ariregistri_kood'] = int(row['ariregistri_kood']); batch.append(row)
                     if len(batch) >= self.chunk_size:
-                        self.db.update_batch_general(batch); batch = []
+                        self.db.insert_batch_base(batch); metrics.batch(len(batch)); batch = []
+            if batch: self.db.insert_batch_base(batch); metrics.batch(len(batch))
+        elif 'yldandmed' in f:
+            for items in metrics.timed("read", iter_json_batches(raw, self.chunk_size, decoder)):
+                batch = [item for item in items if item.get('ariregistri_kood')]
+                for item in batch: item['ariregistri_kood'] = int(item['ariregistri_kood'])
                 if batch: self.db.update_batch_general(batch)
-            else:
-                key = f.split('__')[-1].split('.')[0]; groups = defaultdict(list); count = 0
-                for item in iter_json_array(path):
-                    code = item.get('ariregistri_kood')
-                    if code: groups[int(code)].append(item.get(key, item)); count += 1
-                    if count >= self.chunk_size:
-                        self.db.update_batch_json(key, groups); groups = defaultdict(list); count = 0
-                if groups: self.db.update_batch_json(key, groups)
-            self.db.mark_file_status(f, 'DONE'); self.db.commit()
-        if force:
-            self.db.rebuild_derived_columns()
-            self.db.populate_persons()
-            self.db.commit()
+                metrics.batch(len(batch))
+        else:
+            key = f.split('__')[-1].split('.')[0]
+            # A company's items can be anywhere in the file; grouping the whole file by code first means
+            # each section is written once and complete, instead of a later batch overwriting an earlier one
+            items = (item for batch in metrics.timed("read", iter_json_batches(raw, self.chunk_size, decoder)) for item in batch)
+            groups = {}; count = 0
+            for code, values in group_sections(items, key, self.chunk_size, tmp_dir=self.data_dir):
+                groups[code] = values; count += len(values)
+                if len(groups) >= self.chunk_size:
+                    self.db.update_batch_json(key, groups); metrics.batch(count); groups = {}; count = 0
+            if groups: self.db.update_batch_json(key, groups); metrics.batch(count)
+
+    def load_snapshot(self):
+        """Attach the NumPy snapshot to self.db, rebuilding it first if it is missing or stale."""
+        if not isinstance(self.db, SQLiteBackend): return None
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            console.print("[warning]NumPy is not installed; searching SQLite directly.[/warning]"); return None
+        path = CompanySnapshot.default_path(self.db_path)
+        snap = CompanySnapshot.load(path, generation=self.db.generation())
+        if snap is None:
+            logger.info("Building company snapshot...")
+            snap = CompanySnapshot.build(self.db); snap.save(path)
+        self.db.snapshot = snap
+        return snap
 
     def enrich(self, codes: list[str]):
         if not self.db: return
+        enriched = []
         for code_str in codes:
             try:
                 code = int(code_str); console.print(f"[info]Enriching {code}...[/info]")
                 pdf_bytes = download_registry_pdf(str(code))
                 if not pdf_bytes: continue
-                self.db.update_enrichment(code, parse_pdf_content(pdf_bytes))
+                self.db.update_enrichment(code, parse_pdf_content(pdf_bytes)); enriched.append(code)
                 console.print(f"[success]Updated {code}[/success]"); time.sleep(1)
             except Exception as e: logger.error(f"Error enriching {code_str}: {e}")
+        # Unmasked id codes can join person records into one entity, and so link their companies;
+        # only the people these companies can regroup are resolved and linked again
+        if enriched: self.db.populate_company_links(entity_ids=self.db.populate_person_entities(codes=enriched))
 
     def export(self, output_path: Path, translate: bool = False):
         if not self.db: return
         logger.info(f"Exporting to {output_path}...")
-        results = []
-        for row in self.db.search(limit=None):
-            if translate: row = translate_item(row, to_en=True)
-            results.append(row)
-        with open(output_path, 'w', encoding='utf-8') as f: json.dump(results, f, ensure_ascii=False, indent=2)
+        return write_json_stream(self.db.search(limit=None), output_path, translate=translate)
 
 # ============================================================
 # Utilities & PDF
 # ============================================================
 
 def download_registry_pdf(code: str):
+    import urllib.request
     url = f"https://ariregister.rik.ee/eng/company/{code}/registry_card_pdf?registry_card_lang=eng"
     agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0"
     try:
@@ -969,6 +2971,7 @@ def download_registry_pdf(code: str):
     except Exception as e: logger.error(f"Failed PDF download: {e}"); return None
 
 def parse_pdf_content(pdf_bytes: bytes):
+    from pypdf import PdfReader
     try:
         reader = PdfReader(io.BytesIO(pdf_bytes))
         full_text = "".join([page.extract_text() + "\n" for page in reader.pages])
@@ -990,22 +2993,144 @@ def parse_pdf_content(pdf_bytes: bytes):
         return info
     except Exception as e: logger.error(f"Error parsing PDF: {e}"); return {}
 
-def _convert_decimals(obj):
-    from decimal import Decimal
-    if isinstance(obj, Decimal): return float(obj) if obj % 1 else int(obj)
-    if isinstance(obj, dict): return {k: _convert_decimals(v) for k, v in obj.items()}
-    if isinstance(obj, list): return [_convert_decimals(v) for v in obj]
-    return obj
+def output_format(path):
+    """Split an output path like 'out.ndjson.gz' into ('.ndjson', 'gz')."""
+    suffixes = [s.lower() for s in Path(path).suffixes]
+    if suffixes and suffixes[-1] in (".gz", ".zst"):
+        return (suffixes[-2] if len(suffixes) > 1 else ""), suffixes[-1][1:]
+    return (suffixes[-1] if suffixes else ""), None
 
-def iter_json_array(path):
-    if shutil.which("jq"):
-        proc = subprocess.Popen(["jq", "-c", ".[]", str(path)], stdout=subprocess.PIPE)
-        for line in proc.stdout: yield json.loads(line)
-    else:
+def open_output(path, encoding='utf-8', newline=None):
+    """Open a text file for writing, compressing it when the name ends in .gz or .zst."""
+    _, compression = output_format(path)
+    if compression == "gz":
+        import gzip
+        return gzip.open(path, 'wt', encoding=encoding, newline=newline, compresslevel=6)
+    if compression == "zst":
+        import zstandard
+        return zstandard.open(path, 'wt', encoding=encoding, newline=newline)
+    return open(path, 'w', encoding=encoding, newline=newline)
+
+def write_json_stream(items, output_path, ndjson=None, translate=False):
+    """Write items as a JSON array (or NDJSON for .ndjson/.jsonl) one at a time. Returns the count."""
+    if ndjson is None:
+        ndjson = output_format(output_path)[0] in (".ndjson", ".jsonl")
+    count = 0
+    with open_output(output_path) as f:
+        if not ndjson: f.write("[")
+        for item in items:
+            if translate: item = translate_item(item, to_en=True)
+            if ndjson:
+                f.write(json.dumps(item, ensure_ascii=False)); f.write("\n")
+            else:
+                f.write(",\n" if count else "\n"); f.write(json.dumps(item, ensure_ascii=False, indent=2))
+            count += 1
+        if not ndjson: f.write("\n]\n" if count else "]\n")
+    return count
+
+JSON_DECODERS = ("ijson-c", "jq", "ijson-python")  # fastest first, see bench.py decoders
+JSON_BUFFER_SIZE = 1 << 20
+
+def _ijson_backend(native):
+    """ijson's C (yajl2_c, then yajl2_cffi) or pure-Python backend, or None if unavailable."""
+    try:
         import ijson
-        with open(path, 'rb') as f:
-            for item in ijson.items(f, 'item'):
-                yield _convert_decimals(item)
+    except ImportError:
+        return None
+    for name in (("yajl2_c", "yajl2_cffi") if native else ("python",)):
+        try: return ijson.get_backend(name)
+        except ImportError: continue
+    return None
+
+def select_json_decoder(preferred="auto"):
+    """Resolve "auto" to the fastest installed decoder: ijson's C backend, then jq, then pure-Python ijson."""
+    if preferred != "auto":
+        if preferred not in JSON_DECODERS: raise ValueError(f"Unknown JSON decoder: {preferred}")
+        return preferred
+    if _ijson_backend(native=True): return "ijson-c"
+    return "jq" if shutil.which("jq") else "ijson-python"
+
+def _jq_items(f):
+    import subprocess
+    proc = subprocess.Popen(["jq", "-c", ".[]"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=JSON_BUFFER_SIZE)
+    def feed():
+        try: shutil.copyfileobj(f, proc.stdin, JSON_BUFFER_SIZE)
+        except BrokenPipeError: pass
+        finally: proc.stdin.close()
+    feeder = Thread(target=feed, daemon=True); feeder.start()
+    try:
+        for line in proc.stdout: yield json.loads(line)
+    finally:
+        if proc.poll() is None: proc.kill()
+        proc.wait(); feeder.join()
+
+def _whole_floats(value):
+    """Turn integral floats (2500.0) into ints in place, in nested dicts and lists, as jq 1.6 and Decimal gave them."""
+    for key, v in (value.items() if type(value) is dict else enumerate(value)):
+        t = type(v)
+        if t is float:
+            if v.is_integer(): value[key] = int(v)
+        elif t is dict or t is list: _whole_floats(v)
+    return value
+
+def iter_json_batches(source, batch_size=10000, decoder="auto"):
+    """Yield lists of up to batch_size items of a top-level JSON array.
+
+    source is a path or a binary file object such as a zip member. The ijson backends read it in
+    JSON_BUFFER_SIZE chunks with use_float=True, so numbers arrive as int/float without a Decimal
+    pass; jq gets the same chunks on stdin and each output line goes through json.loads. Whole
+    floats (2500.0) become ints with every decoder, so stored dossiers do not depend on which ran.
+    """
+    decoder = select_json_decoder(decoder)
+    own = isinstance(source, (str, Path))
+    f = open(source, 'rb') if own else source
+    try:
+        if decoder == "jq":
+            items = _jq_items(f)
+        else:
+            backend = _ijson_backend(native=decoder == "ijson-c")
+            if backend is None: raise ValueError(f"JSON decoder {decoder} is not installed")
+            items = backend.items(f, 'item', use_float=True, buf_size=JSON_BUFFER_SIZE)
+        while batch := list(islice(items, batch_size)): yield [_whole_floats(item) if type(item) in (dict, list) else item for item in batch]
+    finally:
+        if own: f.close()
+
+def group_sections(items, key, run_size=50000, tmp_dir=None):
+    """Yield (code, [section values]) in code order, each company once with all of its items.
+
+    items are registry items of a section file (ariregistri_kood plus the section under key),
+    in any order. They are buffered run_size at a time, sorted by code and spilled to a temporary
+    run file, and the runs are k-way merged, so memory holds one run while reading and one block
+    per run while merging. Within a company the values keep their file order. Input that fits
+    in one run is never written to disk; tmp_dir is where runs go (the system default if None).
+    """
+    import heapq
+    runs = []; run = []; seq = 0
+    for item in items:
+        code = item.get('ariregistri_kood')
+        if not code: continue
+        # seq is unique, so sorting never compares the values and ties keep their file order
+        run.append((int(code), seq, item.get(key, item))); seq += 1
+        if len(run) >= run_size:
+            run.sort(); runs.append(_spill_run(run, tmp_dir)); run = []
+    run.sort()
+    merged = heapq.merge(*map(_read_run, runs), run) if runs else run
+    for code, group in groupby(merged, key=lambda r: r[0]):
+        yield code, [value for _, _, value in group]
+
+def _spill_run(run, tmp_dir, block_size=1000):
+    import pickle, tempfile
+    f = tempfile.TemporaryFile(prefix="merge-run-", dir=tmp_dir)
+    for i in range(0, len(run), block_size): pickle.dump(run[i:i + block_size], f, pickle.HIGHEST_PROTOCOL)
+    f.seek(0)
+    return f
+
+def _read_run(f):
+    import pickle
+    with f:
+        while True:
+            try: yield from pickle.load(f)
+            except EOFError: return
 
 class Downloader:
     def __init__(self, ddir, files):
@@ -1016,6 +3141,7 @@ class Downloader:
         for t in threads: t.join()
         return True
     def _dl(self, f):
+        import urllib.request
         path = self.ddir / f; url = self.base + f
         try:
             req = urllib.request.Request(url, method='HEAD')
@@ -1027,11 +3153,249 @@ class Downloader:
             logger.info(f"Finished {f}")
         except Exception as e: logger.error(f"Error {f}: {e}")
 
+# ============================================================
+# Query Service
+# ============================================================
+
+class RegistryService:
+    """Long-running, read-only JSON-over-HTTP front end for the query methods.
+
+    Connections are opened once (read-only, no DDL) and handed out from a pool to a thread
+    executor, so a request costs one query instead of a process start plus schema checks.
+    Aggregations and graph walks are cached for cache_ttl seconds, at most cache_size answers
+    (least recently used go first). With slow_ms set, queries at least that slow
+    are appended to slow_queries.jsonl next to the database. When merge --swap points the
+    database path at a new generation, the pool moves over to it between requests.
+    """
+    REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+    METHODS = ("GET", "HEAD")
+    CACHED = ("/analyze", "/employee-trend", "/group", "/links")
+
+    def __init__(self, db_path, pool_size=4, cache_ttl=300, slow_ms=None, cache_size=1024):
+        self.db_path = Path(db_path); self.pool_size = pool_size; self.cache_ttl = cache_ttl; self.slow_ms = slow_ms
+        self.cache = OrderedDict(); self.cache_size = cache_size; self.server = None; self.target = None; self.reloading = False
+        self.endpoints = {"/search": self._search, "/persons": self._persons, "/group": self._group,
+                          "/links": self._links, "/analyze": self._analyze, "/employee-trend": self._employee_trend,
+                          "/health": self._health}
+
+    async def start(self, host="127.0.0.1", port=8765):
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        self.executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="registry-db")
+        self.pool = asyncio.Queue(); self.target = self.db_path.resolve()
+        for db in self._connect(): self.pool.put_nowait(db)
+        self.server = await asyncio.start_server(self._handle, host, port)
+        return self.server
+
+    def _connect(self):
+        """pool_size read-only connections to the current database generation, sharing its snapshot."""
+        dbs = []; snapshot = None
+        for _ in range(self.pool_size):
+            db = SQLiteBackend(self.db_path, read_only=True)
+            # A current snapshot (written by merge or find --snapshot) is shared by all connections
+            if snapshot is None and importlib.util.find_spec("numpy"):
+                snapshot = CompanySnapshot.load(CompanySnapshot.default_path(self.db_path), generation=db.generation()) or False
+            db.snapshot = snapshot or None
+            if self.slow_ms is not None:
+                db.enable_profiling(self.slow_ms, self.db_path.parent / "slow_queries.jsonl", keep_records=False)
+            db.conn.execute("PRAGMA cache_size=-65536"); db.conn.execute("PRAGMA mmap_size=268435456")
+            # Warm the page cache with the primary key and person indexes
+            db.conn.execute("SELECT COUNT(*) FROM companies").fetchone(); db.conn.execute("SELECT COUNT(*) FROM persons").fetchone()
+            dbs.append(db)
+        return dbs
+
+    async def _follow_swap(self):
+        """Move to a new pool when the database path points at another generation file.
+
+        The new connections are opened and warmed in the executor while the old pool keeps
+        answering; connections of the old pool are closed as their requests finish.
+        """
+        import asyncio
+        target = self.db_path.resolve()
+        if target == self.target or self.reloading: return
+        self.reloading = True
+        try:
+            dbs = await asyncio.get_running_loop().run_in_executor(self.executor, self._connect)
+        finally:
+            self.reloading = False
+        old, self.pool = self.pool, asyncio.Queue()
+        for db in dbs: self.pool.put_nowait(db)
+        self.target = target; self.cache.clear()
+        while not old.empty(): old.get_nowait().conn.close()
+        logger.info(f"Service switched to {target.name}")
+
+    async def close(self):
+        if self.server: self.server.close(); await self.server.wait_closed()
+        while not self.pool.empty(): self.pool.get_nowait().conn.close()
+        self.executor.shutdown(wait=False)
+
+    async def _handle(self, reader, writer):
+        import asyncio
+        try:
+            while True:
+                line = await reader.readline()
+                if not line: break
+                method, target, version = line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""): break
+                    k, _, v = h.decode("latin-1").partition(":"); headers[k.strip().lower()] = v.strip()
+                if int(headers.get("content-length", 0) or 0): await reader.readexactly(int(headers["content-length"]))
+                status, payload = await self.dispatch(method, target)
+                body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+                keep = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                allow = f"Allow: {', '.join(self.METHODS)}\r\n" if status == 405 else ""
+                # HEAD gets the headers of the GET response, Content-Length included, without its body
+                writer.write((f"HTTP/1.1 {status} {self.REASONS[status]}\r\nContent-Type: application/json; charset=utf-8\r\n{allow}"
+                              f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep else 'close'}\r\n\r\n").encode("latin-1")
+                             + (body if method != "HEAD" else b""))
+                await writer.drain()
+                if not keep: break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, target):
+        import asyncio
+        from urllib.parse import urlsplit, parse_qsl
+        url = urlsplit(target)
+        handler = self.endpoints.get(url.path.rstrip("/") or "/")
+        if not handler:
+            return 404, {"error": f"Unknown endpoint: {method} {url.path}", "endpoints": sorted(self.endpoints)}
+        if method not in self.METHODS:
+            return 405, {"error": f"{method} is not supported on {url.path}", "allow": list(self.METHODS)}
+        params = dict(parse_qsl(url.query))
+        await self._follow_swap()
+        key = (url.path, tuple(sorted(params.items())))
+        hit = self.cache.get(key)
+        if hit and hit[0] > time.monotonic(): self.cache.move_to_end(key); return 200, hit[1]
+        pool = self.pool; db = await pool.get()
+        try:
+            payload = await asyncio.get_running_loop().run_in_executor(self.executor, handler, db, params)
+        except (ValueError, KeyError) as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            logger.error(f"Service error on {target}: {e}"); return 500, {"error": str(e)}
+        finally:
+            # A connection to a generation that was swapped out is closed instead of returned
+            if pool is self.pool: pool.put_nowait(db)
+            else: db.conn.close()
+        if url.path in self.CACHED: self._remember(key, payload)
+        return 200, payload
+
+    def _remember(self, key, payload):
+        """Cache an answer: expired answers are dropped, then the least recently used past cache_size."""
+        now = time.monotonic()
+        for stale in [k for k, (expires, _) in self.cache.items() if expires <= now]: del self.cache[stale]
+        self.cache[key] = (now + self.cache_ttl, payload); self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size: self.cache.popitem(last=False)
+
+    # --- Endpoint handlers (run in executor threads; params are query-string values) ---
+
+    @staticmethod
+    def _flag(params, name): return params.get(name, "").lower() in ("1", "true", "yes")
+
+    @staticmethod
+    def _num(params, name, cast=int, default=None):
+        val = params.get(name)
+        if val in (None, ""): return default
+        try: return cast(val)
+        except ValueError: raise ValueError(f"Invalid {name}: {val}")
+
+    def _emtak(self, params):
+        if params.get("industry"):
+            # Same lookup as resolve_industry(), minus the console suggestions
+            name = params["industry"].strip()
+            emtak = [name] if name.isdigit() else INDUSTRY_MAP.get(name.lower())
+            if not emtak: raise ValueError(f"Unknown industry: {params['industry']}")
+            return emtak
+        return params.get("emtak")
+
+    def _filters(self, params):
+        return dict(location=params.get("location"), status=params.get("status"), emtak=self._emtak(params),
+                    legal_form=params.get("legal_form"), founded_after=params.get("founded_after"),
+                    founded_before=params.get("founded_before"))
+
+    def _search(self, db, params):
+        limit = min(self._num(params, "limit", default=50), 1000)
+        items, next_cursor = db.search_page(
+            term=params.get("term"), person=params.get("person"), limit=limit, cursor=params.get("cursor"),
+            min_capital=self._num(params, "min_capital", float), max_capital=self._num(params, "max_capital", float),
+            has_email=self._flag(params, "has_email"), has_phone=self._flag(params, "has_phone"),
+            has_website=self._flag(params, "has_website"), **self._filters(params))
+        if params.get("lang") == "en": items = [translate_item(i, to_en=True) for i in items]
+        return {"count": len(items), "results": items, "next_cursor": next_cursor}
+
+    def _persons(self, db, params):
+        rows, next_cursor = db.search_persons_page(
+            name=params.get("name"), id_code=params.get("id_code"), role=params.get("role"),
+            source=params.get("source"), company_code=self._num(params, "code"),
+            limit=min(self._num(params, "limit", default=50), 1000), cursor=params.get("cursor"))
+        return {"count": len(rows), "results": rows, "next_cursor": next_cursor}
+
+    def _group(self, db, params):
+        if not params.get("code"): raise ValueError("code is required")
+        return db.find_group(self._num(params, "code"), direction=params.get("direction", "both"),
+                             max_depth=self._num(params, "depth", default=5))
+
+    def _links(self, db, params):
+        if not params.get("code"): raise ValueError("code is required")
+        sources = [s for s in params.get("source", "").split(",") if s]
+        results = db.linked_companies(self._num(params, "code"), max_hops=min(self._num(params, "hops", default=2), 4),
+                                      sources=sources, current=self._flag(params, "current"),
+                                      limit=min(self._num(params, "limit", default=200), 5000))
+        return {"count": len(results), "results": results}
+
+    def _analyze(self, db, params):
+        if not params.get("by"): raise ValueError("by is required")
+        rows = db.analyze(by=params["by"], top=self._num(params, "top", default=20), **self._filters(params))
+        return {"by": params["by"], "results": [{"group": g, "count": c} for g, c in rows]}
+
+    def _employee_trend(self, db, params):
+        return {"results": db.employee_trend(code=self._num(params, "code"), emtak=self._emtak(params),
+                                             location=params.get("location"))}
+
+    def _health(self, db, params):
+        return {"status": "ok", "companies": db.conn.execute("SELECT COUNT(*) FROM companies").fetchone()[0],
+                "generation": db.generation()}
+
+def serve(db_path, host="127.0.0.1", port=8765, pool_size=4, slow_ms=None):
+    import asyncio
+    if not Path(db_path).exists():
+        console.print(f"[warning]Database {db_path} not found. Run sync first.[/warning]"); return
+    async def run():
+        service = RegistryService(db_path, pool_size=pool_size, slow_ms=slow_ms)
+        server = await service.start(host, port)
+        console.print(f"[success]Serving {db_path} on http://{host}:{port} ({pool_size} connections)[/success]")
+        try:
+            async with server: await server.serve_forever()
+        finally:
+            await service.close()
+    try: asyncio.run(run())
+    except KeyboardInterrupt: pass
+
 # ============================================================
 # Beautiful Display Logic
 # ============================================================
 
+# Stored section keys (the sections table) read by each display_company() section; the others
+# (core, general, history, operations, enrichment) come from the companies row alone
+DISPLAY_SECTIONS = {"personnel": ("kaardile_kantud_isikud", "isikud"), "ownership": ("osanikud",),
+                    "beneficiaries": ("kasusaajad",), "registry": ("registrikaardid", "kaardid")}
+
+def stored_sections(sections):
+    """Section keys to load for display_company(item, sections); None (load everything) for all sections."""
+    if not sections or "all" in sections: return None
+    return tuple(key for s in sections for key in DISPLAY_SECTIONS.get(s, ()))
+
 def display_company(item, sections=None, lang="et"):
+    from rich.table import Table
+    from rich.tree import Tree
+    from rich.panel import Panel
+    from rich.columns import Columns
+    from rich import box
     lbl = UI_LABELS[lang]; to_en = (lang == "en")
     if sections is None or "all" in sections:
         sections = ["core", "general", "history", "personnel", "ownership", "beneficiaries", "operations", "registry", "enrichment"]
@@ -1128,12 +3492,44 @@ def display_company(item, sections=None, lang="et"):
     if "registry" in sections:
         t = Table(title=lbl["registry"], box=box.ROUNDED, header_style="bold yellow", expand=True)
         t.add_column(lbl["date"], style="cyan"); t.add_column(lbl["entry_type"]); t.add_column(lbl["entry_num"], justify="right")
-        for card in get_nested_list('kaardid', 'registrikaardid'):
-            for k in card.get('kanded', []): t.add_row(k.get('kpv'), translate_value(k.get('kandeliik_tekstina'), to_en), f"#{k.get('kande_nr')}")
+        for card in SQLiteBackend._section_entries(item, 'registrikaardid', 'kaardid'):
+            for k in card.get('kanded') or []: t.add_row(k.get('kpv'), translate_value(k.get('kandeliik_tekstina'), to_en), f"#{k.get('kande_nr')}")
         console.print(t)
     console.print(f"\n[dim]{lbl['privacy_note']}[/dim]")
 
+def print_json(data):
+    from rich.syntax import Syntax
+    console.print(Syntax(json.dumps(data, indent=2, ensure_ascii=False), "json", theme="monokai"))
+
+def display_merge_report(report, lang="et"):
+    """Summary of a merge run: one row per file with its stage split, then the post-processing steps."""
+    from rich.table import Table
+    from rich import box
+    to_en = (lang == "en")
+    if not report or not (report["files"] or report["steps"]): return
+    t = Table(title="Merge Metrics" if to_en else "Ühendamise mõõdikud", box=box.SIMPLE_HEAD, header_style="bold cyan")
+    t.add_column("File" if to_en else "Fail", style="bold white", no_wrap=True)
+    for col in ["Items" if to_en else "Kirjeid", "Items/s" if to_en else "Kirjeid/s", "MB/s", "s"]: t.add_column(col, justify="right", no_wrap=True)
+    t.add_column("Stages, s" if to_en else "Etapid, s", style="dim")
+    t.add_column("Commit ms", justify="right", no_wrap=True); t.add_column("RSS MB", justify="right", no_wrap=True)
+    for f in report["files"]:
+        commit = f["batch_commit_ms"]
+        stages = ", ".join(f"{name} {st['seconds']:.1f}" for name, st in f["stages"].items())
+        t.add_row(f["file"].split("__")[-1].split(".")[0], f"{f['items']:,}", f"{f['items_per_sec'] or 0:,}",
+                  f"{f['mb_per_sec'] or 0:.1f}", f"{f['seconds']:.1f}", stages,
+                  f"{commit['mean']:.0f}/{commit['max']:.0f}" if commit else "-", str(f["peak_rss_mb"] or "-"))
+    for step in report["steps"]:
+        t.add_row(step["step"], "", "", "", f"{step['seconds']:.1f}", "", "", str(step["peak_rss_mb"] or "-"))
+    console.print(t)
+    console.print(f"[info]{'Total' if to_en else 'Kokku'} {report['seconds']:.1f} s, {report['decoder']}"
+                  + (f" -> {report['path']}" if report.get("path") else "") + "[/info]")
+    if report.get("swap"):
+        rows = ", ".join(f"{table} {after:,} ({after - before:+,})" for table, (before, after) in report["swap"]["rows"].items())
+        console.print(f"[success]{'Swapped in' if to_en else 'Kasutusele võetud'} {Path(report['swap']['path']).name}: {rows}[/success]")
+
 def display_stats(stats, lang="et"):
+    from rich.table import Table
+    from rich import box
     lbl = UI_LABELS[lang]; to_en = (lang == "en")
     title = lbl.get("stats_title", "Database Statistics" if to_en else "Andmebaasi statistika")
     t = Table(title=title, box=box.ROUNDED, header_style="bold yellow", expand=True)
@@ -1232,22 +3628,15 @@ def filter_growing(results):
 
 def shorten_status(status, to_en=False):
     """Shorten status labels for compact display."""
-    status_map = {
-        "Registrisse kantud": "Active", "Entered into register": "Active",
-        "Kustutatud": "Deleted", "Deleted": "Deleted",
-        "Likvideerimisel": "Liquidating", "In liquidation": "Liquidating",
-        "Pankrotis": "Bankrupt", "Bankrupt": "Bankrupt",
-        "Registrist kustutatud": "Deleted", "Deleted from register": "Deleted",
-    }
     if not status:
         return "Unknown"
-    for key, short in status_map.items():
-        if key in status:
-            return short
-    return status[:20]
+    code = status_code(status)
+    return code.capitalize() if code else status[:20]
 
-def display_company_summary(items, lang="et"):
-    """Display companies as a compact summary table (one row per company)."""
+def display_company_summary(items, lang="et", scores=None):
+    """Display companies as a compact summary table (one row per company); scores adds a fuzzy-match column."""
+    from rich.table import Table
+    from rich import box
     lbl = UI_LABELS[lang]; to_en = (lang == "en")
     t = Table(title="Companies" if to_en else "Ettevotted", box=box.ROUNDED, header_style="bold yellow", expand=True)
     t.add_column("Name" if to_en else "Nimi", style="bold white", max_width=35)
@@ -1258,6 +3647,7 @@ def display_company_summary(items, lang="et"):
     t.add_column("Emp" if to_en else "Toot", justify="right", style="green")
     t.add_column("Founded" if to_en else "Asutatud", style="dim")
     t.add_column("Status" if to_en else "Staatus")
+    if scores: t.add_column("Score" if to_en else "Skoor", justify="right", style="magenta")
     count = 0
     for item in items:
         count += 1
@@ -1283,13 +3673,16 @@ def display_company_summary(items, lang="et"):
             founded = founded[:10]
         status = item.get('yldandmed', {}).get('staatus_tekstina', '') or item.get('ettevotja_staatus_tekstina', '') or ''
         status = shorten_status(status, to_en)
-        t.add_row(name, code, county, activity, cap_str, emp_str, founded, status)
+        row = [name, code, county, activity, cap_str, emp_str, founded, status]
+        if scores: row.append(f"{scores.get(item.get('ariregistri_kood'), 0):.2f}")
+        t.add_row(*row)
     console.print(t)
     console.print(f"\n[success]{'Found' if to_en else 'Leitud'}: {count} {'companies' if to_en else 'ettevottet'}[/success]")
     return count
 
 def display_industry_list(lang="et"):
     """Display all available industry names grouped by category."""
+    from rich.tree import Tree
     to_en = (lang == "en")
     categories = {
         "IT & Technology": ["software", "it", "tech", "programming", "consulting", "it consulting", "data processing", "hosting", "web", "telecom"],
@@ -1317,6 +3710,61 @@ def display_industry_list(lang="et"):
             node.add(f"[cyan]{name}[/cyan] -> EMTAK {', '.join(codes)}")
     console.print(tree)
 
+CSV_HEADERS = ["code", "name", "status", "county", "city", "legal_form", "founded",
+               "main_industry_code", "main_industry_name", "employees", "capital", "capital_currency",
+               "vat_number", "email", "phone", "website"]
+
+def csv_row(item, to_en=False):
+    """Flatten one company dossier into a row matching CSV_HEADERS."""
+    yld = item.get('yldandmed', {})
+    # Extract contacts
+    contacts = yld.get('sidevahendid', [])
+    email = phone = website = ""
+    for c in contacts:
+        ctype = c.get('liik_tekstina', '')
+        val = c.get('sisu', '')
+        if 'mail' in ctype.lower() or 'post' in ctype.lower():
+            email = email or val
+        elif 'telefon' in ctype.lower() or 'mobiil' in ctype.lower():
+            phone = phone or val
+        elif 'www' in ctype.lower() or 'internet' in ctype.lower():
+            website = website or val
+    # Extract main activity
+    activities = yld.get('teatatud_tegevusalad', [])
+    main_code = main_name = ""
+    for a in activities:
+        if a.get('on_pohitegevusala'):
+            main_code = a.get('emtak_kood', '')
+            main_name = a.get('emtak_tekstina', '')
+            break
+    if not main_code and activities:
+        main_code = activities[0].get('emtak_kood', '')
+        main_name = activities[0].get('emtak_tekstina', '')
+    # County/city from ehak
+    ehak = item.get('asukoha_ehak_tekstina', '')
+    county = city = ""
+    if ehak:
+        parts = [p.strip() for p in ehak.split(',')]
+        county = next((p for p in reversed(parts) if 'maakond' in p), '')
+        city = next((p for p in parts if 'linn' in p or 'vald' in p), '')
+
+    emp = get_latest_employees(item)
+    status_val = yld.get('staatus_tekstina', '') or item.get('ettevotja_staatus_tekstina', '')
+    if to_en:
+        status_val = translate_value(status_val, True)
+        main_name = translate_value(main_name, True)
+
+    cap_amt, cap_cur = SQLiteBackend._extract_latest_capital(item)
+    return [
+        item.get('ariregistri_kood', ''), item.get('nimi', ''), status_val,
+        county, city, item.get('ettevotja_oiguslik_vorm', ''),
+        yld.get('esmaregistreerimise_kpv', '') or item.get('ettevotja_esmakande_kpv', ''),
+        main_code, main_name, emp if emp is not None else '',
+        cap_amt if cap_amt is not None else '', cap_cur or '',
+        item.get('kmkr_nr', ''),
+        email, phone, website
+    ]
+
 def export_csv(db, output_path, lang="et", emtak=None, location=None, status=None,
                legal_form=None, founded_after=None, founded_before=None,
                min_employees=None, max_employees=None, limit=None,
@@ -1331,66 +3779,209 @@ def export_csv(db, output_path, lang="et", emtak=None, location=None, status=Non
     if min_employees or max_employees:
         results = filter_by_employees(results, min_employees, max_employees)
 
-    headers = ["code", "name", "status", "county", "city", "legal_form", "founded",
-               "main_industry_code", "main_industry_name", "employees", "capital", "capital_currency",
-               "vat_number", "email", "phone", "website"]
-
     count = 0
-    with open(output_path, 'w', encoding='utf-8-sig', newline='') as f:
+    with open_output(output_path, encoding='utf-8-sig', newline='') as f:
         writer = csv.writer(f)
-        writer.writerow(headers)
+        writer.writerow(CSV_HEADERS)
         for item in results:
             count += 1
-            yld = item.get('yldandmed', {})
-            # Extract contacts
-            contacts = yld.get('sidevahendid', [])
-            email = phone = website = ""
-            for c in contacts:
-                ctype = c.get('liik_tekstina', '')
-                val = c.get('sisu', '')
-                if 'mail' in ctype.lower() or 'post' in ctype.lower():
-                    email = email or val
-                elif 'telefon' in ctype.lower() or 'mobiil' in ctype.lower():
-                    phone = phone or val
-                elif 'www' in ctype.lower() or 'internet' in ctype.lower():
-                    website = website or val
-            # Extract main activity
-            activities = yld.get('teatatud_tegevusalad', [])
-            main_code = main_name = ""
-            for a in activities:
-                if a.get('on_pohitegevusala'):
-                    main_code = a.get('emtak_kood', '')
-                    main_name = a.get('emtak_tekstina', '')
-                    break
-            if not main_code and activities:
-                main_code = activities[0].get('emtak_kood', '')
-                main_name = activities[0].get('emtak_tekstina', '')
-            # County/city from ehak
-            ehak = item.get('asukoha_ehak_tekstina', '')
-            county = city = ""
-            if ehak:
-                parts = [p.strip() for p in ehak.split(',')]
-                county = next((p for p in reversed(parts) if 'maakond' in p), '')
-                city = next((p for p in parts if 'linn' in p or 'vald' in p), '')
-
-            emp = get_latest_employees(item)
-            status_val = yld.get('staatus_tekstina', '') or item.get('ettevotja_staatus_tekstina', '')
-            if to_en:
-                status_val = translate_value(status_val, True)
-                main_name = translate_value(main_name, True)
-
-            cap_amt, cap_cur = SQLiteBackend._extract_latest_capital(item)
-            writer.writerow([
-                item.get('ariregistri_kood', ''), item.get('nimi', ''), status_val,
-                county, city, item.get('ettevotja_oiguslik_vorm', ''),
-                yld.get('esmaregistreerimise_kpv', '') or item.get('ettevotja_esmakande_kpv', ''),
-                main_code, main_name, emp if emp is not None else '',
-                cap_amt if cap_amt is not None else '', cap_cur or '',
-                item.get('kmkr_nr', ''),
-                email, phone, website
-            ])
+            writer.writerow(csv_row(item, to_en))
     console.print(f"[success]Exported {count} companies to {output_path}[/success]")
 
+def _export_shard(db_path, part_path, fmt, code_range, to_en, standalone, filters):
+    """Process-pool worker: export one code range through its own read-only connection."""
+    db = SQLiteBackend(db_path, read_only=True)
+    count = 0
+    try:
+        results = db.search(code_range=code_range, **filters)
+        if fmt == ".csv":
+            with open_output(part_path, encoding='utf-8-sig' if standalone else 'utf-8', newline='') as f:
+                writer = csv.writer(f)
+                if standalone: writer.writerow(CSV_HEADERS)
+                for item in results:
+                    writer.writerow(csv_row(item, to_en)); count += 1
+        elif standalone:
+            count = write_json_stream(results, part_path, translate=to_en)
+        else:
+            # Bare fragment: items separated the same way write_json_stream does, framed by the parent
+            ndjson = fmt in (".ndjson", ".jsonl")
+            with open(part_path, 'w', encoding='utf-8') as f:
+                for item in results:
+                    if to_en: item = translate_item(item, to_en=True)
+                    if ndjson: f.write(json.dumps(item, ensure_ascii=False)); f.write("\n")
+                    else: f.write(",\n" if count else "\n"); f.write(json.dumps(item, ensure_ascii=False, indent=2))
+                    count += 1
+    finally:
+        db.conn.close()
+    return count
+
+def export_parallel(db, output_path, workers, lang="et", partitioned=False, **filters):
+    """Export CSV/JSON/NDJSON with one read-only SQLite connection per worker process.
+
+    The code range is split into shards (several per worker, for balance). Shard outputs are
+    concatenated in code order into output_path, or kept as part files in a directory named
+    after output_path when partitioned is set.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+    import tempfile
+    output_path = Path(output_path)
+    fmt, _ = output_format(output_path)
+    if fmt not in (".csv", ".json", ".ndjson", ".jsonl"): fmt = ".json"
+    shards = db.code_shards(workers * 4)
+    if partitioned:
+        part_dir = output_path.parent / output_path.name.split('.')[0]
+        part_dir.mkdir(parents=True, exist_ok=True)
+        suffix = "".join(output_path.suffixes)
+        parts = [part_dir / f"part-{i:05d}{suffix}" for i in range(len(shards))]
+    else:
+        part_dir = Path(tempfile.mkdtemp(prefix=".export-", dir=output_path.parent))
+        parts = [part_dir / f"part-{i:05d}{fmt}" for i in range(len(shards))]
+    try:
+        # spawn: never fork a process that holds an open SQLite connection
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(_export_shard, str(db.db_path), str(p), fmt, shard, lang == "en", partitioned, filters)
+                       for p, shard in zip(parts, shards)]
+            counts = [f.result() for f in futures]
+        if partitioned:
+            for p, n in zip(parts, counts):
+                if not n: p.unlink()
+            console.print(f"[success]Exported {sum(counts)} companies to {sum(1 for n in counts if n)} parts in {part_dir}[/success]")
+            return sum(counts)
+        with open_output(output_path, encoding='utf-8-sig' if fmt == ".csv" else 'utf-8', newline='' if fmt == ".csv" else None) as out:
+            if fmt == ".csv": csv.writer(out).writerow(CSV_HEADERS)
+            elif fmt == ".json": out.write("[")
+            written = 0
+            for p, n in zip(parts, counts):
+                if not n: continue
+                with open(p, 'r', encoding='utf-8', newline='') as part:
+                    if fmt == ".json":
+                        # Each fragment starts with its own "\n" separator; join fragments with commas
+                        if written: out.write(",")
+                    shutil.copyfileobj(part, out, 1 << 20)
+                written += n
+            if fmt == ".json": out.write("\n]\n" if written else "]\n")
+        console.print(f"[success]Exported {written} companies to {output_path}[/success]")
+        return written
+    finally:
+        if not partitioned: shutil.rmtree(part_dir, ignore_errors=True)
+
+# Column name and logical type per exported table; "category" columns are dictionary-encoded
+COLUMNAR_TABLES = {
+    "companies": [("code", "int64"), ("name", "string"), ("status", "category"), ("county", "category"),
+                  ("city", "category"), ("legal_form", "category"), ("founded", "date"), ("capital", "float64"),
+                  ("capital_currency", "category"), ("employees", "int32"), ("vat_number", "string"),
+                  ("email", "string"), ("phone", "string"), ("website", "string")],
+    "persons": [("company_code", "int64"), ("source", "category"), ("first_name", "string"), ("last_name", "string"),
+                ("full_name", "string"), ("id_code", "string"), ("id_hash", "string"), ("role", "category"),
+                ("start_date", "date"), ("end_date", "date"), ("ownership_pct", "float64"),
+                ("contribution_amount", "float64"), ("currency", "category"), ("country", "category")],
+    "activities": [("company_code", "int64"), ("emtak_code", "category"), ("emtak_name", "category"), ("is_main", "bool")],
+    "annual_reports": [("company_code", "int64"), ("period_end", "date"), ("employees", "int32"), ("activity", "category")],
+}
+
+def _columnar_value(kind, val):
+    if val is None or val == "": return None
+    try:
+        if kind == "date": return datetime.strptime(SQLiteBackend._normalize_date(str(val))[:10], "%Y-%m-%d").date()
+        if kind in ("int64", "int32"): return int(val)
+        if kind == "float64": return float(val)
+    except (TypeError, ValueError):
+        return None
+    if kind == "bool": return val in (1, True, "1", "true", "Jah", "jah")
+    return str(val)
+
+def export_columnar(db, output_dir, fmt="parquet", batch_size=50000, limit=None, **filters):
+    """Export companies, persons, activities and annual reports as Parquet or Arrow IPC files."""
+    import pyarrow as pa
+    types = {"int64": pa.int64(), "int32": pa.int32(), "float64": pa.float64(), "string": pa.string(),
+             "date": pa.date32(), "bool": pa.bool_(), "category": pa.dictionary(pa.int32(), pa.string())}
+    output_dir = Path(output_dir); output_dir.mkdir(parents=True, exist_ok=True)
+    counts = {}
+    for table, columns in COLUMNAR_TABLES.items():
+        schema = pa.schema([(name, types[kind]) for name, kind in columns])
+        path = output_dir / f"{table}.{'parquet' if fmt == 'parquet' else 'arrow'}"
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            writer = pq.ParquetWriter(path, schema, compression="zstd", write_statistics=True)
+        else:
+            writer = pa.ipc.new_file(path, schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+        # One growing dictionary per column, so each batch only adds a delta (required by IPC files)
+        dictionaries = {name: {} for name, kind in columns if kind == "category"}
+        count = 0
+        try:
+            for rows in db.iter_export_rows(table, batch_size=batch_size, limit=limit, **filters):
+                arrays = []
+                for i, (name, kind) in enumerate(columns):
+                    values = [_columnar_value(kind, r[i]) for r in rows]
+                    if kind == "category":
+                        lookup = dictionaries[name]
+                        indices = [None if v is None else lookup.setdefault(v, len(lookup)) for v in values]
+                        arrays.append(pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()), pa.array(list(lookup), pa.string())))
+                    else:
+                        arrays.append(pa.array(values, types[kind]))
+                batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+                if fmt == "parquet": writer.write_batch(batch, row_group_size=batch_size)
+                else: writer.write_batch(batch)
+                count += len(rows)
+        finally:
+            writer.close()
+        counts[table] = count
+        console.print(f"[success]Exported {count:,} {table} rows to {path}[/success]")
+    return counts
+
+BATCH_HEADERS = ["input", "match", "score", "code", "name", "status", "county", "city", "legal_form", "founded",
+                 "employees", "capital", "capital_currency", "vat_number", "email", "phone", "website"]
+
+def read_batch_input(path, column=None):
+    """Iterator of lookup values from a CSV file or '-' for stdin: the named column (header row expected) or the first one.
+
+    The header is read right away, so a column it doesn't have raises ValueError before any lookup.
+    """
+    f = sys.stdin if str(path) == "-" else open(path, encoding='utf-8-sig', newline='')
+    def close():
+        if f is not sys.stdin: f.close()
+    try:
+        dialect = "excel"
+        if f is not sys.stdin:
+            # Registry and spreadsheet exports use ';' as often as ','
+            try: dialect = csv.Sniffer().sniff(f.read(4096), delimiters=",;\t")
+            except csv.Error: pass
+            f.seek(0)
+        reader = csv.reader(f, dialect); idx = 0
+        if column is not None:
+            header = next(reader, [])
+            if str(column).isdigit(): idx = int(column)
+            elif column in header: idx = header.index(column)
+            else: raise ValueError(f"Column {column!r} not found in {path}; its header has: {', '.join(header) or '(empty)'}")
+    except BaseException:
+        close(); raise
+    def values():
+        try:
+            for row in reader:
+                if row: yield row[idx] if idx < len(row) else ""
+        finally:
+            close()
+    return values()
+
+def batch_lookup(db, values, output_path="-", chunk_size=50000, fuzzy=False, min_score=0.6):
+    """Stream lookup results for many codes/names to CSV or NDJSON (stdout for '-'). Returns (inputs, matched)."""
+    ndjson = output_format(output_path)[0] in (".ndjson", ".jsonl")
+    out = sys.stdout if str(output_path) == "-" else open_output(output_path, encoding='utf-8' if ndjson else 'utf-8-sig', newline='')
+    inputs = matched = 0; last = -1
+    try:
+        writer = None if ndjson else csv.writer(out)
+        if writer: writer.writerow(BATCH_HEADERS)
+        for seq, value, match, score, row in db.lookup_batch(values, chunk_size=chunk_size, fuzzy=fuzzy, min_score=min_score):
+            # A name shared by several companies repeats its input row, so count it once
+            if seq != last: inputs += 1; matched += bool(match); last = seq
+            record = [value, match, score, *(row or [None] * len(db.BATCH_COLUMNS))]
+            if ndjson: out.write(json.dumps(dict(zip(BATCH_HEADERS, record)), ensure_ascii=False)); out.write("\n")
+            else: writer.writerow(["" if v is None else v for v in record])
+    finally:
+        if out is not sys.stdout: out.close()
+    return inputs, matched
+
 def cmd_report(db, report_type, lang="et", **kwargs):
     """Execute a pre-built business report."""
     to_en = (lang == "en")
@@ -1446,6 +4037,8 @@ def cmd_report(db, report_type, lang="et", **kwargs):
             console.print("[warning]Please specify --county[/warning]"); return
         title = f"{'Regional Report' if to_en else 'Piirkondlik aruanne'}: {county}"
         console.print(f"\n[bold blue]{title}[/bold blue]\n")
+        display_analysis(db.analyze(by="municipality", location=county, top=15), by="municipality", lang=lang)
+        console.print()
         display_analysis(db.analyze(by="status", location=county, top=10), by="status", lang=lang)
         console.print()
         display_analysis(db.analyze(by="emtak", location=county, top=15), by="emtak", lang=lang)
@@ -1455,26 +4048,24 @@ def cmd_report(db, report_type, lang="et", **kwargs):
         display_analysis(db.analyze(by="legal-form", location=county, top=10), by="legal-form", lang=lang)
 
     elif report_type == "bankruptcies":
-        period = kwargs.get('period')
+        # Dated by the liquidation and bankruptcy entries on the registry card, not by founding date
+        period = kwargs.get('period'); location = kwargs.get('location')
+        try: fa, fb = period_range(period) if period else (None, None)
+        except ValueError as e: console.print(f"[danger]{e}[/danger]"); return
         title = f"{'Bankruptcies & Liquidations' if to_en else 'Pankrotid ja likvideerimised'}"
         if period:
             title += f" {period}"
         console.print(f"\n[bold blue]{title}[/bold blue]\n")
-        fa = f"{period}-01-01" if period else None
-        fb = f"{period}-12-31" if period else None
-        for st in ["Likvideerimisel", "Pankrotis"]:
-            results = db.analyze(by="emtak", status=st, founded_after=fa, founded_before=fb, top=10)
-            if results:
-                st_label = translate_value(st, to_en)
-                console.print(f"\n[bold yellow]{st_label}[/bold yellow]")
-                display_analysis(results, by="emtak", lang=lang)
-        console.print()
-        for st in ["Likvideerimisel", "Pankrotis"]:
-            results = db.analyze(by="county", status=st, founded_after=fa, founded_before=fb, top=10)
-            if results:
-                st_label = translate_value(st, to_en)
-                console.print(f"\n[bold yellow]{st_label} - {'by county' if to_en else 'maakonniti'}[/bold yellow]")
-                display_analysis(results, by="county", lang=lang)
+        kinds = {"liquidation": ("Likvideerimiskanded", "Liquidation entries"), "bankruptcy": ("Pankrotikanded", "Bankruptcy entries")}
+        for kind, (et_label, en_label) in kinds.items():
+            by_time = "month" if period else "entry-year"
+            timeline = db.event_counts(by="month" if period else "year", event_type=kind, date_from=fa, date_to=fb,
+                                       location=location, top=120)
+            if timeline:
+                console.print(f"\n[bold yellow]{en_label if to_en else et_label}[/bold yellow]")
+                display_analysis(timeline, by=by_time, lang=lang)
+                display_analysis(db.event_counts(by="county", event_type=kind, date_from=fa, date_to=fb, location=location, top=10),
+                                 by="county", lang=lang)
     elif report_type == "employee-trend":
         code = kwargs.get('code')
         industry = kwargs.get('industry')
@@ -1496,7 +4087,35 @@ def cmd_report(db, report_type, lang="et", **kwargs):
         console.print(f"[warning]Unknown report type: {report_type}[/warning]")
         console.print("Available: market-overview, new-companies, top-industries, industry-growth, regional, bankruptcies, employee-trend")
 
+def show_next_page(cursor, lang="et", stderr=False):
+    """Tell the user how to fetch the next page; on stderr when stdout carries JSON."""
+    hint = f"{UI_LABELS[lang]['next_page']}: --cursor {cursor}"
+    if stderr: print(hint, file=sys.stderr)
+    else: console.print(f"[info]{hint}[/info]")
+
+def display_profile(records, threshold_ms, lang="et"):
+    """Per-query timings from --profile, with the plans of the queries over the slow threshold."""
+    from rich.table import Table
+    from rich import box
+    to_en = (lang == "en")
+    if not records: return
+    t = Table(title="Query Profile" if to_en else "Päringute profiil", box=box.SIMPLE_HEAD, header_style="bold cyan")
+    t.add_column("Query" if to_en else "Päring", style="bold white")
+    t.add_column("ms", justify="right"); t.add_column("Rows" if to_en else "Ridu", justify="right")
+    t.add_column("VM steps" if to_en else "VM samme", justify="right")
+    t.add_column("Full scan" if to_en else "Täisskann", style="warning")
+    for r in records:
+        ms = f"[danger]{r['ms']:.1f}[/danger]" if r["ms"] >= threshold_ms else f"{r['ms']:.1f}"
+        t.add_row(r["label"], ms, f"{r['rows']:,}", f"{r['vm_steps']:,}", ", ".join(s[5:] for s in r.get("full_scans", [])))
+    console.print(t)
+    for r in records:
+        if "plan" not in r: continue
+        console.print(f"[warning]{r['label']}[/warning] [dim]{r['sql'][:200]}[/dim]")
+        for step in r["plan"]: console.print(f"    {step}")
+
 def display_person_results(results, lang="et"):
+    from rich.table import Table
+    from rich import box
     to_en = (lang == "en")
     t = Table(title="Person Search Results" if to_en else "Isikuotsingu tulemused", box=box.ROUNDED, header_style="bold yellow", expand=True)
     t.add_column("Person" if to_en else "Isik", style="bold white", max_width=30)
@@ -1516,20 +4135,47 @@ def display_person_results(results, lang="et"):
     console.print(t)
     console.print(f"\n[success]{'Found' if to_en else 'Leitud'}: {len(results)} {'records' if to_en else 'kirjet'}[/success]")
 
+def display_events(results, lang="et"):
+    from rich.table import Table
+    from rich import box
+    lbl = UI_LABELS[lang]; to_en = (lang == "en")
+    if not results:
+        console.print(f"[warning]{lbl['no_results']}[/warning]"); return
+    t = Table(title=lbl["registry"], box=box.ROUNDED, header_style="bold yellow", expand=True)
+    t.add_column(lbl["date"], style="cyan"); t.add_column("Code" if to_en else "Kood", justify="right")
+    t.add_column("Company" if to_en else "Ettevote", style="bold white", max_width=40)
+    t.add_column(lbl["entry_type"]); t.add_column(lbl["entry_num"], justify="right", style="dim")
+    for r in results:
+        t.add_row(r['date'] or '-', str(r['company_code']), r['company_name'] or '', translate_value(r['event_type'], to_en) or '-',
+                  f"#{r['entry_no']}" if r['entry_no'] is not None else '')
+    console.print(t)
+
 def display_person_network(results, name=None, lang="et"):
+    from rich.tree import Tree
     to_en = (lang == "en")
     if not results:
         console.print(f"[warning]{'No results found.' if to_en else 'Tulemusi ei leitud.'}[/warning]")
         return
     title = f"{'Network' if to_en else 'Voorgustik'}: {name or results[0].get('full_name', 'Unknown')}"
     tree = Tree(f"[bold blue]{title}[/bold blue]")
-    # Group by source
-    by_source = defaultdict(list)
-    for r in results:
-        by_source[r['source']].append(r)
+    # Namesakes (several person entities) get a branch each; --entity picks one of them
+    by_entity = defaultdict(list)
+    for r in results: by_entity[r.get('person_entity_id')].append(r)
     source_labels = {'board': 'Board Member' if to_en else 'Juhatuse liige',
                      'shareholder': 'Shareholder' if to_en else 'Osanik',
                      'beneficiary': 'Beneficiary' if to_en else 'Kasusaaja'}
+    for entity, rows in by_entity.items():
+        branch = tree
+        if len(by_entity) > 1:
+            first = rows[0]; ident = first.get('id_code') or (first.get('id_hash') or '')[:8] or '-'
+            branch = tree.add(f"[bold]{first.get('full_name') or '?'}[/bold] [dim]({ident}, --entity {entity})[/dim]")
+        _add_network_sources(branch, rows, source_labels, to_en)
+    console.print(tree)
+
+def _add_network_sources(tree, results, source_labels, to_en):
+    by_source = defaultdict(list)
+    for r in results:
+        by_source[r['source']].append(r)
     for src, items in by_source.items():
         node = tree.add(f"[bold yellow]{source_labels.get(src, src)}[/bold yellow] ({len(items)})")
         for r in items:
@@ -1541,9 +4187,23 @@ def display_person_network(results, name=None, lang="et"):
             elif r.get('role'):
                 detail = f" [dim]{translate_value(r['role'], to_en)}[/dim]"
             node.add(f"[cyan]{r.get('company_name', 'N/A')}[/cyan] ({r.get('company_code', '')}){detail}{status_tag}")
-    console.print(tree)
+
+def display_top_persons(results, source=None, lang="et"):
+    from rich.table import Table
+    from rich import box
+    to_en = (lang == "en")
+    if not results:
+        console.print(f"[warning]{'No results found.' if to_en else 'Tulemusi ei leitud.'}[/warning]"); return
+    title = {None: ("Most Connected Persons", "Enim seotud isikud"), "board": ("Most Board Seats", "Enim juhatuse kohti"),
+             "shareholder": ("Most Shareholdings", "Enim osalusi"), "beneficiary": ("Most Beneficial Ownerships", "Enim kasusaaja rolle")}[source]
+    t = Table(title=title[0] if to_en else title[1], box=box.ROUNDED, header_style="bold yellow")
+    t.add_column("Person" if to_en else "Isik", style="bold white"); t.add_column("ID Code" if to_en else "Isikukood", style="magenta")
+    t.add_column("Companies" if to_en else "Ettevotteid", justify="right", style="green"); t.add_column("Entity" if to_en else "Olem", justify="right", style="dim")
+    for entity, name, id_code, companies in results: t.add_row(name or "-", id_code or "-", str(companies), str(entity))
+    console.print(t)
 
 def display_group_tree(group_data, lang="et"):
+    from rich.tree import Tree
     to_en = (lang == "en")
     company = group_data.get("company", {})
     if not company:
@@ -1571,7 +4231,30 @@ def display_group_tree(group_data, lang="et"):
             depth_nodes[depth] = n
     console.print(tree)
 
+def display_company_links(results, code, lang="et"):
+    from rich.table import Table
+    from rich import box
+    to_en = (lang == "en")
+    if not results:
+        console.print(f"[warning]{'No linked companies found.' if to_en else 'Seotud ettevotteid ei leitud.'}[/warning]"); return
+    roles = {'board': 'board' if to_en else 'juhatus', 'shareholder': 'shareholder' if to_en else 'osanik',
+             'beneficiary': 'beneficiary' if to_en else 'kasusaaja'}
+    t = Table(title=f"{'Linked Companies' if to_en else 'Seotud ettevotted'}: {code}", box=box.ROUNDED, header_style="bold yellow")
+    t.add_column("Hops" if to_en else "Samme", justify="right", style="dim"); t.add_column("Code" if to_en else "Kood", style="magenta")
+    t.add_column("Company" if to_en else "Ettevote", style="cyan"); t.add_column("Status" if to_en else "Staatus")
+    t.add_column("Via" if to_en else "Labi", style="white")
+    for c in results:
+        # One line per link from the previous hop: person, roles (there -> here), the company it comes from
+        via = [f"{v['person'] or '?'} ({roles.get(v['source'], v['source'])} -> {roles.get(v['linked_source'], v['linked_source'])}"
+               f"{', ' + v['since'] if v['since'] else ''}{' - ' + v['until'] if v['until'] else ''})"
+               + (f" [dim]< {v['from_code']}[/dim]" if c['hops'] > 1 else "") for v in c['via'][:3]]
+        if len(c['via']) > 3: via.append(f"[dim]+{len(c['via']) - 3}[/dim]")
+        t.add_row(str(c['hops']), str(c['code']), c['name'] or '-', shorten_status(c['status'] or '', to_en), "\n".join(via))
+    console.print(t)
+
 def display_employee_trend(trend, code=None, lang="et"):
+    from rich.table import Table
+    from rich import box
     to_en = (lang == "en")
     title = "Employee Trend" if to_en else "Tootajate trend"
     if code:
@@ -1609,6 +4292,8 @@ def display_employee_trend(trend, code=None, lang="et"):
     console.print(t)
 
 def display_analysis(results, by, lang="et"):
+    from rich.table import Table
+    from rich import box
     lbl = UI_LABELS[lang]; to_en = (lang == "en")
     by_label = lbl["analysis_by"].get(by, by)
     title = f"{lbl['analysis_title']}: {by_label}"
@@ -1638,19 +4323,29 @@ def main():
     parser.add_argument("--no-db", action="store_true")
     parser.add_argument("--en", action="store_true"); parser.add_argument("--ee", action="store_true"); parser.add_argument("-v", "--verbose", action="store_true")
     parser.add_argument("--list-industries", action="store_true", help="Show all available industry names")
+    parser.add_argument("--profile", action="store_true", help="Time each query and show plans for slow ones")
+    parser.add_argument("--backend", choices=["sqlite", "duckdb"], default="sqlite",
+                        help="Storage engine: data/registry.db (SQLite, default) or data/registry.duckdb (DuckDB, columnar)")
+    parser.add_argument("--slow-ms", type=float, default=100.0,
+                        help="Queries at least this slow are logged to data/slow_queries.jsonl with their plan (default: 100)")
     sub = parser.add_subparsers(dest="cmd")
 
     # Core commands
     for n, al in {"sync": ["sünk"], "merge": ["ühenda"]}.items():
         sp = sub.add_parser(n, aliases=al); sp.add_argument("--force", action="store_true")
+        sp.add_argument("--swap", action="store_true",
+                        help="Build a new database file next to the live one, check it and swap it in atomically")
+        sp.add_argument("--decoder", choices=["auto", *JSON_DECODERS], default="auto",
+                        help="JSON decoder for the registry files (default: fastest installed)")
     sub.add_parser("enrich", aliases=["rikasta"]).add_argument("codes", nargs="+")
     sub.add_parser("stats", aliases=["statistika"])
 
     # Search command (detailed dossier view)
     srch = sub.add_parser("search", aliases=["otsi"])
-    srch.add_argument("term", nargs="?"); srch.add_argument("-l", "--location"); srch.add_argument("-s", "--status"); srch.add_argument("-p", "--person")
+    srch.add_argument("term", nargs="?"); srch.add_argument("-l", "--location"); srch.add_argument("-s", "--status", help=STATUS_HELP); srch.add_argument("-p", "--person")
     srch.add_argument("--emtak"); srch.add_argument("--industry"); srch.add_argument("--founded-after"); srch.add_argument("--founded-before"); srch.add_argument("--legal-form")
     srch.add_argument("--json", action="store_true"); srch.add_argument("-t", "--translate", action="store_true"); srch.add_argument("--limit", type=int, default=5)
+    srch.add_argument("--cache", action="store_true", help="Keep decoded dossiers for code lookups in data/cache/dossiers.db")
     for s in ["core", "general", "history", "personnel", "ownership", "beneficiaries", "operations", "registry", "enrichment"]:
         srch.add_argument(f"--{s}", action="append_const", dest="sections", const=s)
 
@@ -1658,8 +4353,8 @@ def main():
     fnd = sub.add_parser("find", aliases=["leia"], help="Find companies with simple filters")
     fnd.add_argument("query", nargs="?", help="Company name or code")
     fnd.add_argument("--industry", help="Industry name (e.g., software, construction, restaurant)")
-    fnd.add_argument("-l", "--location", help="County or city name")
-    fnd.add_argument("-s", "--status", help="Company status filter")
+    fnd.add_argument("-l", "--location", help="County, municipality or settlement; typos and missing diacritics are tolerated")
+    fnd.add_argument("-s", "--status", help=STATUS_HELP)
     fnd.add_argument("--min-employees", type=int, help="Minimum employee count")
     fnd.add_argument("--max-employees", type=int, help="Maximum employee count")
     fnd.add_argument("--founded-after", help="Founded after date (YYYY-MM-DD)")
@@ -1672,14 +4367,18 @@ def main():
     fnd.add_argument("--has-website", action="store_true", help="Only companies with website")
     fnd.add_argument("--growing", action="store_true", help="Only companies with growing employee count")
     fnd.add_argument("--limit", type=int, default=50, help="Max results (default: 50)")
+    fnd.add_argument("--cursor", help="Continue from the cursor printed under the previous page")
+    fnd.add_argument("--snapshot", action="store_true", help="Filter on the in-memory NumPy snapshot (built on first use)")
+    fnd.add_argument("--fuzzy", action="store_true", help="Rank names by similarity (typos, abbreviations, legal forms)")
+    fnd.add_argument("--min-score", type=float, default=0.3, help="Lowest similarity kept with --fuzzy (0-1, default: 0.3)")
     fnd.add_argument("--full", action="store_true", help="Show full dossier instead of summary")
     fnd.add_argument("--json", action="store_true", help="Output as JSON")
     fnd.add_argument("--csv", help="Export results to CSV file")
 
     # Analyze command
     anl = sub.add_parser("analyze", aliases=["analüüs"])
-    anl.add_argument("--by", required=True, choices=["county", "status", "legal-form", "emtak", "year", "capital-range", "employee-range", "role", "country"])
-    anl.add_argument("--emtak"); anl.add_argument("--industry"); anl.add_argument("--location"); anl.add_argument("--status"); anl.add_argument("--legal-form")
+    anl.add_argument("--by", required=True, choices=["county", "municipality", "settlement", "status", "legal-form", "emtak", "year", "capital-range", "employee-range", "role", "country"])
+    anl.add_argument("--emtak"); anl.add_argument("--industry"); anl.add_argument("--location"); anl.add_argument("--status", help=STATUS_HELP); anl.add_argument("--legal-form")
     anl.add_argument("--founded-after"); anl.add_argument("--founded-before")
     anl.add_argument("--top", type=int, default=20); anl.add_argument("--json", action="store_true")
 
@@ -1691,7 +4390,10 @@ def main():
     per.add_argument("--source", choices=["board", "shareholder", "beneficiary"], help="Filter by source")
     per.add_argument("--code", help="Filter by company code")
     per.add_argument("--network", action="store_true", help="Show all companies for this person")
+    per.add_argument("--entity", type=int, help="Person entity id (shown for namesakes in --network)")
+    per.add_argument("--top", action="store_true", help="Rank persons by the number of companies (with --source: board seats, ...)")
     per.add_argument("--limit", type=int, default=50)
+    per.add_argument("--cursor", help="Continue from the cursor printed under the previous page")
 
     # Group command
     grp = sub.add_parser("group", aliases=["kontsern"], help="Corporate ownership chain mapping")
@@ -1699,49 +4401,111 @@ def main():
     grp.add_argument("--direction", choices=["up", "down", "both"], default="both", help="Direction: up (owners), down (subsidiaries), both")
     grp.add_argument("--depth", type=int, default=5, help="Max recursion depth")
 
+    # Links command (companies connected through shared board members, shareholders, beneficiaries)
+    lnk = sub.add_parser("links", aliases=["seosed"], help="Companies linked through shared people, up to --hops links away")
+    lnk.add_argument("code", help="Company registry code")
+    lnk.add_argument("--hops", type=int, default=2, help="Most links between the company and a result (default: 2)")
+    lnk.add_argument("--source", action="append", choices=["board", "shareholder", "beneficiary"],
+                     help="Follow only links where the person has this role at both ends (repeatable)")
+    lnk.add_argument("--current", action="store_true", help="Follow only links where both roles are still open")
+    lnk.add_argument("--limit", type=int, default=200); lnk.add_argument("--json", action="store_true")
+
     # Report command (pre-built business reports)
     rpt = sub.add_parser("report", aliases=["aruanne"], help="Pre-built business intelligence reports")
     rpt.add_argument("type", choices=["market-overview", "new-companies", "top-industries", "industry-growth", "regional", "bankruptcies", "employee-trend"])
-    rpt.add_argument("--period", help="Year for time-based reports (e.g., 2024)")
+    rpt.add_argument("--period", help="Year for time-based reports (e.g., 2024); bankruptcies also takes 2024-Q3 or 2024-07")
     rpt.add_argument("--industry", help="Industry name for industry reports")
     rpt.add_argument("-l", "--location", help="Location filter")
-    rpt.add_argument("--county", help="County for regional report")
+    rpt.add_argument("--county", help="County or municipality for the regional report")
     rpt.add_argument("--code", help="Company code for company-specific reports")
 
+    # Events command (registry-card entries by date, type and place)
+    evt = sub.add_parser("events", aliases=["sündmused"], help="Registry-card entries by date range, type and location")
+    evt.add_argument("--type", help=EVENT_HELP)
+    evt.add_argument("--period", help="Year, quarter or month: 2024, 2024-Q3 or 2024-07")
+    evt.add_argument("--from", dest="date_from", help="First date (YYYY-MM-DD)"); evt.add_argument("--to", dest="date_to", help="Last date (YYYY-MM-DD)")
+    evt.add_argument("-l", "--location", help="Location filter"); evt.add_argument("--code", help="One company's timeline")
+    evt.add_argument("--by", choices=["county", "municipality", "type", "month", "year"], help="Count entries per group instead of listing them")
+    evt.add_argument("--limit", type=int, default=50); evt.add_argument("--cursor", help="Continue from the cursor printed under the previous page")
+    evt.add_argument("--json", action="store_true")
+
+    # Serve command (long-running read-only query service)
+    srv = sub.add_parser("serve", aliases=["teenus"], help="Run a local read-only JSON query service")
+    srv.add_argument("--host", default="127.0.0.1"); srv.add_argument("--port", type=int, default=8765)
+    srv.add_argument("--pool", type=int, default=4, help="Number of pooled read-only connections")
+    srv.add_argument("--slow-log", action="store_true", help="Log queries slower than --slow-ms to data/slow_queries.jsonl")
+
+    # Batch command (many codes or names from a file)
+    bat = sub.add_parser("batch", aliases=["hulgi"], help="Resolve a file of registry codes or company names in one pass")
+    bat.add_argument("input", help="CSV/text file with one code or name per row, or - for stdin")
+    bat.add_argument("-c", "--column", help="Column name (file has a header row) or 0-based index; default: first column")
+    bat.add_argument("-o", "--output", default="-", help="Output .csv or .ndjson (add .gz or .zst to compress); default: CSV to stdout")
+    bat.add_argument("--chunk-size", type=int, default=50000, help="Input rows resolved per query")
+    bat.add_argument("--fuzzy", action="store_true", help="Fall back to the best fuzzy name match for names without an exact hit")
+    bat.add_argument("--min-score", type=float, default=0.6, help="Lowest similarity accepted with --fuzzy (default: 0.6)")
+
     # Export command (improved with filters)
     exp = sub.add_parser("export", aliases=["ekspordi"], help="Export companies to CSV or JSON")
-    exp.add_argument("output", help="Output file (.csv or .json)")
+    exp.add_argument("output", help="Output file (.csv, .json or .ndjson; add .gz or .zst to compress)")
     exp.add_argument("--industry", help="Industry name filter")
     exp.add_argument("-l", "--location", help="Location filter")
-    exp.add_argument("-s", "--status", help="Status filter")
+    exp.add_argument("-s", "--status", help=STATUS_HELP)
     exp.add_argument("--legal-form", help="Legal form filter")
     exp.add_argument("--founded-after"); exp.add_argument("--founded-before")
     exp.add_argument("--min-employees", type=int); exp.add_argument("--max-employees", type=int)
     exp.add_argument("--min-capital", type=float); exp.add_argument("--max-capital", type=float)
     exp.add_argument("--has-email", action="store_true"); exp.add_argument("--has-phone", action="store_true"); exp.add_argument("--has-website", action="store_true")
     exp.add_argument("--limit", type=int, help="Max companies to export")
+    exp.add_argument("--format", choices=["parquet", "arrow"], help="Write a directory of columnar tables instead of one file")
+    exp.add_argument("--workers", type=int, default=1, help="Export in parallel with this many processes")
+    exp.add_argument("--partitioned", action="store_true", help="With --workers, keep one part file per shard")
 
     args = parser.parse_args(); setup_logging(args.verbose)
 
     # Language detection
-    et_cmds = ["otsi", "rikasta", "ühenda", "sünk", "ekspordi", "analüüs", "statistika", "leia", "aruanne", "isik", "kontsern"]
-    en_cmds = ["search", "enrich", "merge", "sync", "export", "analyze", "stats", "find", "report", "person", "group"]
+    et_cmds = ["otsi", "rikasta", "ühenda", "sünk", "ekspordi", "analüüs", "statistika", "leia", "aruanne", "isik", "kontsern", "seosed", "teenus", "hulgi", "sündmused"]
+    en_cmds = ["search", "enrich", "merge", "sync", "export", "analyze", "stats", "find", "report", "person", "group", "links", "serve", "batch", "events"]
     cmd_typed = sys.argv[1] if len(sys.argv) > 1 else ""
     if args.en: lang = "en"
     elif args.ee: lang = "et"
     else: lang = "et" if (cmd_typed in et_cmds or (cmd_typed not in en_cmds and cmd_typed != "")) else "en"
 
+    if getattr(args, "cursor", None):
+        try: decode_cursor(args.cursor)
+        except ValueError as e: console.print(f"[danger]{e}[/danger]"); return
+
     # --list-industries (no DB needed)
     if args.list_industries:
         display_industry_list(lang=lang); return
 
-    reg = EstonianRegistry(use_db=not args.no_db)
+    if args.cmd in ["serve", "teenus"]:
+        if args.backend != "sqlite": console.print("[warning]The query service reads the SQLite database only.[/warning]")
+        serve(EstonianRegistry(use_db=False).db_path, host=args.host, port=args.port, pool_size=args.pool,
+              slow_ms=args.slow_ms if args.slow_log else None); return
+
+    backend = None
+    if args.backend == "duckdb" and not args.no_db:
+        try:
+            Path("data").mkdir(exist_ok=True); backend = DuckDBBackend(Path("data") / "registry.duckdb")
+        except ImportError:
+            console.print("[danger]The DuckDB backend needs duckdb and pyarrow (pip install duckdb pyarrow).[/danger]"); return
+        # Built on SQLite internals (profiler, trigram index, read-only worker handles)
+        if args.cmd in ["batch", "hulgi"]:
+            console.print("[danger]Batch lookups need the SQLite backend.[/danger]"); return
+        ignored = [flag for flag, used in (("--profile", args.profile), ("--fuzzy", getattr(args, "fuzzy", False)),
+                                            ("--workers", getattr(args, "workers", 1) > 1)) if used]
+        if ignored: console.print(f"[warning]Not available with --backend duckdb, ignored: {', '.join(ignored)}[/warning]")
+        args.profile = False; args.fuzzy = False; args.workers = 1
+    reg = EstonianRegistry(backend=backend, use_db=not args.no_db)
+    profiler = reg.db.enable_profiling(args.slow_ms, reg.data_dir / "slow_queries.jsonl") if args.profile and reg.db else None
 
     if args.cmd in ["stats", "statistika"]:
         display_stats(reg.db.get_stats(), lang=lang)
 
-    elif args.cmd in ["sync", "sünk"]: reg.sync(force=getattr(args, 'force', False))
-    elif args.cmd in ["merge", "ühenda"]: reg.merge(force=getattr(args, 'force', False))
+    elif args.cmd in ["sync", "sünk", "merge", "ühenda"]:
+        run = reg.sync if args.cmd in ["sync", "sünk"] else reg.merge
+        try: display_merge_report(run(force=args.force, decoder=args.decoder, swap=args.swap), lang=lang)
+        except (RuntimeError, ValueError) as e: console.print(f"[danger]{e}[/danger]")
     elif args.cmd in ["enrich", "rikasta"]: reg.enrich(args.codes)
 
     elif args.cmd in ["search", "otsi"]:
@@ -1749,13 +4513,23 @@ def main():
         if args.industry:
             emtak = resolve_industry(args.industry)
             if not emtak: return
-        results = reg.db.search(term=args.term, person=args.person, location=args.location, status=args.status,
-                                limit=args.limit, emtak=emtak, founded_after=args.founded_after,
-                                founded_before=args.founded_before, legal_form=args.legal_form)
+        to_en = args.translate or lang == "en"; translated = False
+        if args.cache and args.term and args.term.isdigit() and not (args.person or args.location or args.status or emtak
+                                                                     or args.founded_after or args.founded_before or args.legal_form):
+            # Plain code lookup: served from the dossier cache, already translated for --json
+            cache = DossierCache(reg.db, path=reg.data_dir / "cache" / "dossiers.db"); translated = args.json and to_en
+            results = list(cache.get_many([args.term], lang="en" if translated else None).values())
+            cache.close()
+        else:
+            # Section flags load only the stored sections they show (--json prints whole dossiers)
+            results = reg.db.search(term=args.term, person=args.person, location=args.location, status=args.status,
+                                    limit=args.limit, emtak=emtak, founded_after=args.founded_after,
+                                    founded_before=args.founded_before, legal_form=args.legal_form,
+                                    sections=None if args.json else stored_sections(args.sections))
         sections, count = args.sections or ["all"], 0
         for item in results:
             count += 1
-            if args.json: console.print(Syntax(json.dumps(translate_item(item, to_en=(args.translate or lang=="en")), indent=2, ensure_ascii=False), "json", theme="monokai"))
+            if args.json: print_json(item if translated else translate_item(item, to_en=to_en))
             else: display_company(item, sections=sections, lang=lang)
         if count == 0: console.print(f"[warning]{UI_LABELS[lang]['no_results']}[/warning]")
         else: console.print(f"\n[success]{UI_LABELS[lang]['results_found']}: {count}[/success]")
@@ -1765,16 +4539,32 @@ def main():
         if args.industry:
             emtak = resolve_industry(args.industry)
             if not emtak: return
-        # Use a higher limit for post-filtering by employees
-        fetch_limit = args.limit
-        if args.min_employees or args.max_employees or args.growing:
-            fetch_limit = None  # Fetch all, filter in Python
-        results = reg.db.search(term=args.query, location=args.location, status=args.status,
-                                limit=fetch_limit, emtak=emtak, founded_after=args.founded_after,
-                                founded_before=args.founded_before, legal_form=args.legal_form,
-                                min_capital=args.min_capital, max_capital=args.max_capital,
-                                has_email=args.has_email, has_phone=args.has_phone, has_website=args.has_website)
-        if args.min_employees or args.max_employees:
+        # The snapshot filters on the employee_count column; without it employees are post-filtered in Python
+        snapshot = reg.load_snapshot() if args.snapshot else None
+        employees_in_sql = snapshot is not None
+        # One row past the page tells whether there is a next one
+        page = fetch_limit = args.limit + 1 if args.limit else None
+        if ((args.min_employees or args.max_employees) and not employees_in_sql) or args.growing:
+            fetch_limit = None  # No LIMIT in SQL: filtered in Python, read lazily until the page is full
+        term, scores = args.query, None
+        after = decode_cursor(args.cursor)["code"] if args.cursor else None
+        if args.fuzzy and args.query and not args.query.isdigit():
+            # Rank candidates by name first, then apply the other filters to just those codes
+            matches = reg.db.fuzzy_names(args.query, limit=max(args.limit or 50, 50), min_score=args.min_score)
+            term, scores = None, {code: score for code, _, score in matches}
+        results = found = reg.db.search(term=term, location=args.location, status=args.status,
+                                        limit=None if scores is not None else fetch_limit, emtak=emtak, founded_after=args.founded_after,
+                                        founded_before=args.founded_before, legal_form=args.legal_form,
+                                        min_capital=args.min_capital, max_capital=args.max_capital,
+                                        has_email=args.has_email, has_phone=args.has_phone, has_website=args.has_website,
+                                        min_employees=args.min_employees if employees_in_sql else None,
+                                        max_employees=args.max_employees if employees_in_sql else None,
+                                        codes=list(scores) if scores is not None else None,
+                                        after=after if scores is None else None, ordered=scores is None)
+        if scores is not None:
+            rank = {code: i for i, code in enumerate(scores)}
+            results = sorted(results, key=lambda item: rank[item['ariregistri_kood']])
+        if (args.min_employees or args.max_employees) and not employees_in_sql:
             results = filter_by_employees(results, args.min_employees, args.max_employees)
         if args.growing:
             results = filter_growing(results)
@@ -1783,7 +4573,10 @@ def main():
             for i, item in enumerate(gen):
                 if n and i >= n: break
                 yield item
-        results = limited(results, args.limit)
+        results = list(limited(results, page if scores is None else args.limit)); next_cursor = None
+        found.close()
+        if scores is None and args.limit and len(results) > args.limit:
+            results = results[:args.limit]; next_cursor = encode_cursor(code=results[-1]['ariregistri_kood'])
         if args.csv:
             # Collect results and export
             items = list(results)
@@ -1793,14 +4586,15 @@ def main():
                        min_employees=args.min_employees, max_employees=args.max_employees, limit=args.limit)
         elif args.json:
             items = list(results)
-            console.print(Syntax(json.dumps([translate_item(i, to_en=(lang=="en")) for i in items], indent=2, ensure_ascii=False), "json", theme="monokai"))
+            print_json([translate_item(i, to_en=(lang=="en")) for i in items])
         elif args.full:
             count = 0
             for item in results:
                 count += 1; display_company(item, lang=lang)
             if count == 0: console.print(f"[warning]{UI_LABELS[lang]['no_results']}[/warning]")
         else:
-            display_company_summary(results, lang=lang)
+            display_company_summary(results, lang=lang, scores=scores)
+        if next_cursor: show_next_page(next_cursor, lang, stderr=args.json)
 
     elif args.cmd in ["analyze", "analüüs"]:
         emtak = args.emtak
@@ -1811,35 +4605,83 @@ def main():
                                  legal_form=args.legal_form, founded_after=args.founded_after,
                                  founded_before=args.founded_before, top=args.top)
         if args.json:
-            console.print(Syntax(json.dumps([{"group": g, "count": c} for g, c in results], indent=2, ensure_ascii=False), "json", theme="monokai"))
+            print_json([{"group": g, "count": c} for g, c in results])
         else:
             display_analysis(results, by=args.by, lang=lang)
 
     elif args.cmd in ["person", "isik"]:
-        if args.network:
-            results = reg.db.person_network(name=args.name, id_code=args.id_code)
+        if args.top:
+            display_top_persons(reg.db.top_persons(source=args.source, top=args.limit), source=args.source, lang=lang)
+        elif args.network or args.entity:
+            results = reg.db.person_network(name=args.name, id_code=args.id_code, entity=args.entity)
             display_person_network(results, name=args.name or args.id_code, lang=lang)
         else:
-            results = reg.db.search_persons(name=args.name, id_code=args.id_code, role=args.role,
-                                            source=args.source, company_code=args.code, limit=args.limit)
+            results, next_cursor = reg.db.search_persons_page(name=args.name, id_code=args.id_code, role=args.role,
+                                                              source=args.source, company_code=args.code,
+                                                              limit=args.limit, cursor=args.cursor)
             display_person_results(results, lang=lang)
+            if next_cursor: show_next_page(next_cursor, lang)
 
     elif args.cmd in ["group", "kontsern"]:
         group_data = reg.db.find_group(args.code, direction=args.direction, max_depth=args.depth)
         display_group_tree(group_data, lang=lang)
 
+    elif args.cmd in ["links", "seosed"]:
+        results = reg.db.linked_companies(args.code, max_hops=args.hops, sources=args.source, current=args.current, limit=args.limit)
+        if args.json: print_json(results)
+        else: display_company_links(results, args.code, lang=lang)
+
+    elif args.cmd in ["events", "sündmused"]:
+        date_from, date_to = args.date_from, args.date_to
+        if args.period:
+            try: date_from, date_to = period_range(args.period)
+            except ValueError as e: console.print(f"[danger]{e}[/danger]"); return
+        filters = dict(event_type=args.type, date_from=date_from, date_to=date_to, location=args.location, company_code=args.code)
+        if args.by:
+            results = reg.db.event_counts(by=args.by, top=args.limit, **filters)
+            if args.json: print_json([{"group": g, "count": c} for g, c in results])
+            else: display_analysis(results, by="entry-year" if args.by == "year" else args.by, lang=lang)
+        else:
+            results, next_cursor = reg.db.events_page(limit=args.limit, cursor=args.cursor, **filters)
+            if args.json: print_json(results)
+            else: display_events(results, lang=lang)
+            if next_cursor: show_next_page(next_cursor, lang, stderr=args.json)
+
     elif args.cmd in ["report", "aruanne"]:
         cmd_report(reg.db, args.type, lang=lang, period=args.period,
                    industry=args.industry, location=args.location, county=args.county,
                    code=getattr(args, 'code', None))
 
+    elif args.cmd in ["batch", "hulgi"]:
+        try: values = read_batch_input(args.input, args.column)
+        except ValueError as e: console.print(f"[danger]{e}[/danger]"); return
+        inputs, matched = batch_lookup(reg.db, values, args.output, chunk_size=args.chunk_size,
+                                       fuzzy=args.fuzzy, min_score=args.min_score)
+        summary = f"Resolved {matched} of {inputs} inputs"
+        if args.output == "-": logger.info(summary)
+        else: console.print(f"[success]{summary} -> {args.output}[/success]")
+
     elif args.cmd in ["export", "ekspordi"]:
         output = Path(args.output)
         emtak = None
         if args.industry:
             emtak = resolve_industry(args.industry)
             if not emtak: return
-        if output.suffix.lower() == '.csv':
+        if args.format:
+            export_columnar(reg.db, output, fmt=args.format, emtak=emtak, location=args.location,
+                            status=args.status, legal_form=args.legal_form,
+                            founded_after=args.founded_after, founded_before=args.founded_before,
+                            min_employees=args.min_employees, max_employees=args.max_employees, limit=args.limit,
+                            min_capital=args.min_capital, max_capital=args.max_capital,
+                            has_email=args.has_email, has_phone=args.has_phone, has_website=args.has_website)
+        elif args.workers > 1 and not args.limit:
+            export_parallel(reg.db, output, args.workers, lang=lang, partitioned=args.partitioned,
+                            emtak=emtak, location=args.location, status=args.status, legal_form=args.legal_form,
+                            founded_after=args.founded_after, founded_before=args.founded_before,
+                            min_employees=args.min_employees, max_employees=args.max_employees,
+                            min_capital=args.min_capital, max_capital=args.max_capital,
+                            has_email=args.has_email, has_phone=args.has_phone, has_website=args.has_website)
+        elif output_format(output)[0] == '.csv':
             export_csv(reg.db, output, lang=lang, emtak=emtak, location=args.location,
                        status=args.status, legal_form=args.legal_form,
                        founded_after=args.founded_after, founded_before=args.founded_before,
@@ -1847,7 +4689,7 @@ def main():
                        min_capital=args.min_capital, max_capital=args.max_capital,
                        has_email=args.has_email, has_phone=args.has_phone, has_website=args.has_website)
         else:
-            # JSON export (original behavior with filters)
+            # JSON / NDJSON export, streamed straight from the search cursor
             results = reg.db.search(emtak=emtak, location=args.location, status=args.status,
                                     legal_form=args.legal_form, founded_after=args.founded_after,
                                     founded_before=args.founded_before, limit=args.limit,
@@ -1855,8 +4697,10 @@ def main():
                                     has_email=args.has_email, has_phone=args.has_phone, has_website=args.has_website)
             if args.min_employees or args.max_employees:
                 results = filter_by_employees(results, args.min_employees, args.max_employees)
-            data = [translate_item(i, to_en=(lang=="en")) for i in results]
-            with open(output, 'w', encoding='utf-8') as f: json.dump(data, f, ensure_ascii=False, indent=2)
-            console.print(f"[success]Exported {len(data)} companies to {output}[/success]")
+            count = write_json_stream(results, output, translate=(lang == "en"))
+            console.print(f"[success]Exported {count} companies to {output}[/success]")
+
+    if profiler:
+        display_profile(profiler.records, args.slow_ms, lang=lang)
 
 if __name__ == "__main__": main()
@@ -1,8 +1,17 @@
 import pytest
 import json
 import sqlite3
+import subprocess
+import sys
 from pathlib import Path
-from registry import EstonianRegistry, RegistryDB, translate_item, UI_LABELS
+import gzip
+import zipfile
+import asyncio
+from registry import (EstonianRegistry, RegistryDB, translate_item, translate_value, UI_LABELS, write_json_stream,
+                      export_columnar, export_csv, export_parallel, RegistryService, SCHEMA_VERSION,
+                      DossierCache, batch_lookup, read_batch_input, normalize_name,
+                      CompanySnapshot, decode_cursor, iter_json_batches, select_json_decoder, JSON_DECODERS, parse_ehak,
+                      resolve_status, status_code, period_range, group_sections, stored_sections)
 
 def test_translation_logic():
     item = {
@@ -21,12 +30,21 @@ def test_translation_logic():
     assert "Entered into register" in translated["status"]
     assert "Management board member" in translated["shareholders"][0]["role_description"]
 
+def test_translate_value_variants():
+    assert translate_value("Osaühing", to_en=True) == "Private limited company (Osaühing)"
+    assert translate_value("Osanik, Juhatuse liige", to_en=True) == "Shareholder, Management board member (Osanik, Juhatuse liige)"
+    # Comma-separated text without any known term is left alone, on every call (cached path)
+    assert translate_value("Tartu mnt 1, Tallinn", to_en=True) == "Tartu mnt 1, Tallinn"
+    assert translate_value("Tartu mnt 1, Tallinn", to_en=True) == "Tartu mnt 1, Tallinn"
+    assert translate_value("Osaühing", to_en=False) == "Osaühing"
+    assert translate_item({"kanded": [{"kandeliik_tekstina": "Esmakanne", "kande_nr": 1}, "Märkus"]}, to_en=True) == \
+        {"entries": [{"entry_type": "First entry (Esmakanne)", "entry_number": 1}, "Note (Märkus)"]}
+
 def test_registry_init(tmp_path):
     data_dir = tmp_path / "data"
     reg = EstonianRegistry(data_dir=str(data_dir), use_db=True)
     
     assert (data_dir / "downloads").exists()
-    assert (data_dir / "extracted").exists()
     assert reg.db is not None
     assert reg.db_path.exists()
 
@@ -58,6 +76,50 @@ def test_db_operations(tmp_path):
     stats = db.get_stats()
     assert stats["total"] == 1
 
+def test_schema_version(tmp_path):
+    db_path = tmp_path / "test.db"
+    RegistryDB(db_path).conn.close()
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    # A current database is opened without running any DDL
+    conn.execute("DROP INDEX idx_email"); conn.close()
+    RegistryDB(db_path).conn.close()
+    conn = sqlite3.connect(db_path)
+    assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_email'").fetchone()
+    # A pre-versioning database (user_version 0) is brought up to date
+    conn.execute("PRAGMA user_version = 0"); conn.close()
+    RegistryDB(db_path).conn.close()
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_email'").fetchone()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+
+def test_section_storage(tmp_path):
+    db = RegistryDB(tmp_path / "test.db")
+    db.insert_batch_base([{"ariregistri_kood": 100, "nimi": "Alpha OÜ"}])
+    cards = [[{"kaardi_nr": 1, "kanded": [{"kpv": "01.02.2010", "kande_nr": 1, "kandeliik_tekstina": "Esmakanne"}]}]]
+    holders = [[{"nimi_arinimi": "Tamm"}]]
+    db.update_batch_json("registrikaardid", {100: cards})
+    db.update_batch_json("osanikud", {100: holders, 999: holders})  # 999 is not a company
+    full = next(db.search(term="Alpha"))
+    assert full["registrikaardid"] == cards and full["osanikud"] == holders
+    assert json.loads(db.conn.execute("SELECT full_data FROM companies").fetchone()[0]) == {"ariregistri_kood": 100, "nimi": "Alpha OÜ"}
+    assert db.conn.execute("SELECT COUNT(*) FROM sections").fetchone()[0] == 2
+    # Section flags load only what they show
+    assert set(next(db.search(term="Alpha", sections=stored_sections(["core"])))) == {"ariregistri_kood", "nimi"}
+    assert set(next(db.get_companies([100], sections=stored_sections(["ownership"])))[1]) == {"ariregistri_kood", "nimi", "osanikud"}
+    assert stored_sections(["core", "all"]) is None and len(list(db.search(person="Tamm"))) == 1
+
+    # A v7 database, with the sections inside full_data, is split when it is opened
+    with db.conn:
+        db.conn.execute("UPDATE companies SET full_data = json_set(full_data, '$.registrikaardid', json(?), '$.osanikud', json(?))",
+                        (json.dumps(cards), json.dumps(holders)))
+        db.conn.execute("DELETE FROM sections"); db.conn.execute("DELETE FROM registry_events")
+    db.conn.execute("PRAGMA user_version = 7"); db.conn.close()
+    db = RegistryDB(tmp_path / "test.db")
+    assert next(db.search(term="Alpha")) == full and [e["event_type"] for e in db.events(company_code=100)] == ["Esmakanne"]
+    assert "osanikud" not in db.conn.execute("SELECT full_data FROM companies").fetchone()[0]
+
 def test_ui_labels():
     assert "Toimik" in UI_LABELS["et"]["dossier"]
     assert "Dossier" in UI_LABELS["en"]["dossier"]
@@ -72,4 +134,544 @@ def test_enrichment_storage(tmp_path):
     
     row = list(db.search(term="123"))[0]
     assert "enrichment" in row
-    assert row["enrichment"]["unmasked_ids"]["Test Person"] == "12345678901"
\ No newline at end of file
+    assert row["enrichment"]["unmasked_ids"]["Test Person"] == "12345678901"
+
+def test_location_hierarchy(tmp_path):
+    assert parse_ehak("Kesklinna linnaosa, Tallinn, Harju maakond") == ("Harju maakond", "Tallinn", "Kesklinna linnaosa")
+    assert parse_ehak("Tartu linn, Tartu maakond") == ("Tartu maakond", "Tartu linn", None) and parse_ehak(None) == (None, None, None)
+    db = RegistryDB(tmp_path / "test.db")
+    places = ["Kesklinna linnaosa, Tallinn, Harju maakond", "Mustamäe linnaosa, Tallinn, Harju maakond", "Harku vald, Harju maakond",
+              "Tartu linn, Tartu maakond", "Jõhvi vald, Ida-Viru maakond", None]
+    db.insert_batch_base([{"ariregistri_kood": 100 + i, "nimi": f"Company {i}", "asukoha_ehak_tekstina": places[i % len(places)]}
+                          for i in range(60)])
+    def codes(location): return {d["ariregistri_kood"] for d in db.search(location=location)}
+    assert len(codes("Harju")) == 30 and codes("tallinn") == codes("Tallin") and len(codes("Tallinn")) == 20
+    assert codes("johvi") == codes("Jõhvi vald") == codes("IDA-VIRU") == {100 + i for i in range(4, 60, 6)}
+    assert codes("mustamae") == {100 + i for i in range(1, 60, 6)} and codes("Atlantis") == set()
+    assert next(db.search(term="Company 0"))["ariregistri_kood"] == 100 and db.conn.execute(
+        "SELECT linn FROM companies WHERE code = 100").fetchone()[0] == "Tallinn"
+    assert dict(db.analyze(by="municipality", location="Harju")) == {"Tallinn": 20, "Harku vald": 10}
+    assert dict(db.analyze(by="county"))["Unknown"] == 10
+    plan = " ".join(r[3] for r in db.conn.execute("EXPLAIN QUERY PLAN SELECT code FROM companies WHERE county_id IN (1)"))
+    assert "idx_county_id" in plan
+
+def test_status_codes(tmp_path):
+    assert status_code("Pankrotis") == status_code("N") == "bankrupt" and status_code("Registrist kustutatud") == "deleted"
+    assert resolve_status("bankrupt") == resolve_status("pankrotis") == ["bankrupt"] and resolve_status("Likvid") == ["liquidating"]
+    assert resolve_status("aktiivne") == resolve_status("Entered into register") == ["active"] and resolve_status("Atlantis") == []
+    db = RegistryDB(tmp_path / "test.db")
+    labels = ["Registrisse kantud", "Likvideerimisel", "Pankrotis", "Registrist kustutatud"]
+    db.insert_batch_base([{"ariregistri_kood": 100 + i, "nimi": f"Company {i}", "ettevotja_staatus_tekstina": labels[i % 4]}
+                          for i in range(40)])
+    db.insert_batch_base([{"ariregistri_kood": 200, "nimi": "Letter Only", "ettevotja_staatus": "L"}])
+    def codes(status): return {d["ariregistri_kood"] for d in db.search(status=status)}
+    assert codes("in liquidation") == codes("Likvideerimisel") == {100 + i for i in range(1, 40, 4)} | {200}
+    assert codes("deleted") == codes("kustutatud") == {100 + i for i in range(3, 40, 4)}
+    # A general-data update moves the code along with the label
+    db.update_batch_general([{"ariregistri_kood": 100, "yldandmed": {"staatus_tekstina": "Pankrotis"}}])
+    assert 100 in codes("bankrupt") and dict(db.analyze(by="status"))["Pankrotis"] == 11
+    plan = " ".join(r[3] for r in db.conn.execute("EXPLAIN QUERY PLAN SELECT code FROM companies WHERE status_code IN ('active')"))
+    assert "idx_status_code" in plan
+
+def test_registry_events(tmp_path):
+    assert period_range("2024-Q3") == ("2024-07-01", "2024-09-30") and period_range("2023-02") == ("2023-02-01", "2023-02-28")
+    with pytest.raises(ValueError): period_range("2024-13")
+    db = RegistryDB(tmp_path / "test.db")
+    places = ["Tartu linn, Tartu maakond", "Harku vald, Harju maakond"]
+    db.insert_batch_base([{"ariregistri_kood": 100 + i, "nimi": f"Company {i}", "asukoha_ehak_tekstina": places[i % 2]} for i in range(10)])
+    def card(*entries): return [[{"kaardi_nr": 1, "kanded": [{"kpv": d, "kande_nr": n, "kandeliik_tekstina": t} for n, (d, t) in enumerate(entries, 1)]}]]
+    db.update_batch_json("registrikaardid", {100 + i: card(("01.02.2010", "Esmakanne"), (f"{10 + i:02d}.0{7 + i % 3}.2024", "Likvideerimiskanne"))
+                                             for i in range(10)})
+    assert len(db.events(event_type="liquidation", date_from="2024-07-01", date_to="2024-09-30")) == 10
+    assert dict(db.event_counts(by="county", event_type="likvideeri", **dict(zip(("date_from", "date_to"), period_range("2024-08"))))) == \
+        {"Harju maakond": 2, "Tartu maakond": 1}
+    assert [e["event_type"] for e in db.events(company_code=100)] == ["Esmakanne", "Likvideerimiskanne"]
+    page, cursor = db.events_page(limit=4, event_type="Esmakanne")
+    assert len(page) == 4 and db.events_page(limit=10, cursor=cursor, event_type="Esmakanne")[0][0]["id"] > page[-1]["id"]
+    # A re-merged section replaces the company's events; populate_events() rebuilds them all from the dossiers
+    db.update_batch_json("registrikaardid", {100: card(("05.05.2020", "Pankrotikanne"))})
+    assert [e["event_kind"] for e in db.events(company_code=100)] == ["bankruptcy"]
+    db.populate_events()
+    assert db.conn.execute("SELECT COUNT(*) FROM registry_events").fetchone()[0] == 19
+    assert db.event_counts(by="year", event_type="bankrupt") == [("2020", 1)]
+
+def test_person_entities(tmp_path):
+    db = RegistryDB(tmp_path / "test.db")
+    db.insert_batch_base([{"ariregistri_kood": code, "nimi": f"Company {code}"} for code in range(100, 108)])
+    def person(first, last, id_code=None, id_hash=None):
+        return {"eesnimi": first, "nimi_arinimi": last, "isikukood_registrikood": id_code, "isikukood_hash": id_hash}
+    db.update_batch_json("kaardile_kantud_isikud", {
+        100: [[person("Mari", "Tamm", "48001010000", "h1")]], 101: [[person("MARI", "Tamm", id_hash="h1")]],
+        103: [[person("Jaan", "Kask", "37001010000")]], 104: [[person("Jaan", "Kask", "37501010000")]],
+        106: [[person("Peeter", "Mets")]], 107: [[person("Peeter", "Mets", "38001010000")]]})
+    db.update_batch_json("osanikud", {102: [[person("", "Tamm Mari")]]})
+    db.update_batch_json("kasusaajad", {105: [[{"eesnimi": "Jaan", "nimi": "Kask", "aadress_riik_tekstina": "Eesti"}]]})
+    db.populate_persons()
+    db.conn.execute("UPDATE companies SET enrichment = ? WHERE code = 106", (json.dumps({"unmasked_ids": {"PEETER METS": "38001010000"}}),))
+    db.populate_person_entities()
+    # The id hash and the name join Mari Tamm's rows; namesakes with different id codes stay apart
+    mari = db.person_network(name="tamm,  mari")
+    assert sorted(r["company_code"] for r in mari) == [100, 101, 102] and len({r["person_entity_id"] for r in mari}) == 1
+    assert len({r["person_entity_id"] for r in db.person_network(name="Jaan Kask")}) == 3
+    assert sorted(r["company_code"] for r in db.person_network(id_code="38001010000")) == [106, 107]
+    assert [r["company_code"] for r in db.person_network(entity=mari[0]["person_entity_id"], name="ignored")] != []
+    assert len(db.person_network(name="Tam")) == 3  # no such entity: substring match
+    assert db.top_persons(source="board", top=2) == [(mari[0]["person_entity_id"], "Mari Tamm", "48001010000", 2),
+                                                    (db.person_network(name="Peeter Mets")[0]["person_entity_id"], "Peeter Mets", "38001010000", 2)]
+    plan = " ".join(r[3] for r in db.conn.execute("EXPLAIN QUERY PLAN SELECT * FROM persons WHERE person_entity_id IN (1, 2)"))
+    assert "idx_persons_entity" in plan
+    # Enriching 105 regroups only the Jaan Kasks, and ends where a full rebuild does
+    def groups():
+        people = {}
+        for pid, entity in db.conn.execute("SELECT id, person_entity_id FROM persons ORDER BY id"): people.setdefault(entity, []).append(pid)
+        return sorted(people.values())
+    db.conn.execute("UPDATE companies SET enrichment = ? WHERE code = 105", (json.dumps({"unmasked_ids": {"Jaan Kask": "37001010000"}}),))
+    touched = db.populate_person_entities(codes=[105])
+    assert mari[0]["person_entity_id"] not in touched and db.person_network(entity=mari[0]["person_entity_id"], name="ignored")
+    assert sorted(r["company_code"] for r in db.person_network(id_code="37001010000")) == [103, 105]
+    partial = groups(); db.populate_person_entities()
+    assert groups() == partial and db.conn.execute("SELECT COUNT(*) FROM person_entities").fetchone()[0] == len(partial)
+
+def test_company_links(tmp_path):
+    db = RegistryDB(tmp_path / "test.db")
+    db.insert_batch_base([{"ariregistri_kood": code, "nimi": f"Company {code}"} for code in range(100, 106)])
+    def person(id_code, start=None, end=None):
+        return {"eesnimi": "", "nimi_arinimi": f"Person {id_code}", "isikukood_registrikood": id_code,
+                "algus_kpv": start, "lopp_kpv": end}
+    # 100 -A- 101 -B- 102 -C- 100 is a cycle; 103 hangs off 102 through a shareholding, 104 shares nobody
+    # it was ever with at the same time: person 5 left 103 before joining 104
+    db.update_batch_json("kaardile_kantud_isikud", {
+        100: [[person("1", "01.02.2010"), person("3")]], 101: [[person("1", "15.06.2012", "01.01.2020"), person("2")]],
+        102: [[person("2"), person("3")]], 104: [[person("9"), person("5", "01.01.2016")]]})
+    db.update_batch_json("osanikud", {102: [[person("4")]], 103: [[person("4", "01.01.2021"), person("5", None, "31.12.2015")]]})
+    db.populate_persons(); db.populate_person_entities(); db.populate_company_links()
+
+    edge = db.conn.execute("SELECT source, linked_source, since, until FROM company_links WHERE company_code = 100 AND linked_code = 101").fetchall()
+    assert [tuple(e) for e in edge] == [("board", "board", "2012-06-15", "2020-01-01")]
+    found = db.linked_companies(100, max_hops=5)
+    assert [(c["code"], c["hops"]) for c in found] == [(101, 1), (102, 1), (103, 2)]
+    assert [(v["from_code"], v["person"], v["source"], v["linked_source"]) for v in found[2]["via"]] == [(102, "Person 4", "shareholder", "shareholder")]
+    assert [c["code"] for c in db.linked_companies(100, max_hops=1)] == [101, 102]
+    assert [c["code"] for c in db.linked_companies(100, max_hops=5, sources=["board"])] == [101, 102]
+    assert [(c["code"], c["hops"]) for c in db.linked_companies(100, current=True)] == [(102, 1), (101, 2), (103, 2)]  # Person 1 left 101
+    assert db.linked_companies(104) == [] and len(db.linked_companies(100, limit=2)) == 2
+    # Rebuilding one person's edges leaves the table as it was
+    edges = lambda: sorted(tuple(r) for r in db.conn.execute("SELECT * FROM company_links"))
+    before = edges(); db.populate_company_links(entity_ids={found[0]["via"][0]["person_entity_id"], 999})
+    assert edges() == before
+    # Hubs in more than max_companies companies link nothing
+    db.populate_company_links(max_companies=1)
+    assert db.linked_companies(100) == []
+
+def test_dossier_cache(tmp_path):
+    db = RegistryDB(tmp_path / "test.db")
+    db.insert_batch_base([{"ariregistri_kood": 100 + i, "nimi": f"Company {i}"} for i in range(1200)])
+    assert {code for code, _ in db.get_companies([1299, 100, 100, 99999], chunk_size=2)} == {100, 1299}
+
+    cache = DossierCache(db, path=tmp_path / "cache" / "dossiers.db", maxsize=10)
+    found = cache.get_many(range(100, 1300), lang="en")
+    assert len(found) == 1200 and found[105]["name"] == "Company 5"
+    assert len(cache.lru) == 10 and cache.get(1299, lang="en") is found[1299]
+    cache.close()
+
+    # A new process is served from disk; enrichment replaces just that company's entry, also in a running process
+    cache = DossierCache(db, path=tmp_path / "cache" / "dossiers.db")
+    assert cache.disk.execute("SELECT COUNT(*) FROM dossiers").fetchone()[0] == 1200
+    assert "enrichment" not in cache.get(105)
+    db.update_enrichment(105, {"unmasked_ids": {"A": "1"}})
+    assert cache.get(105)["enrichment"]["unmasked_ids"] == {"A": "1"}
+    assert cache.disk.execute("SELECT COUNT(*) FROM dossiers WHERE lang = 'en' AND generation = ?", (db.generation(),)).fetchone()[0] == 1200
+    # A merge starts a new generation, which drops everything cached before it
+    db.bump_generation()
+    assert cache.get(106)["nimi"] == "Company 6" and len(cache.lru) == 1
+    assert cache.disk.execute("SELECT COUNT(*) FROM dossiers").fetchone()[0] == 1
+
+def test_batch_lookup(tmp_path):
+    db = RegistryDB(tmp_path / "test.db")
+    db.insert_batch_base([{"ariregistri_kood": 100 + i, "nimi": f"Company {i}"} for i in range(5)]
+                         + [{"ariregistri_kood": 200, "nimi": "Company 1"}])
+    src = tmp_path / "in.csv"
+    src.write_text("id;nimi\n;Company 1\n104;\n999;\n;Unknown\n", encoding="utf-8")
+    out = tmp_path / "out.ndjson"
+    assert batch_lookup(db, read_batch_input(src, "nimi"), out) == (4, 1)
+    assert batch_lookup(db, read_batch_input(src, "id"), out, chunk_size=2) == (4, 1)
+    with pytest.raises(ValueError, match="id, nimi"): read_batch_input(src, "kood")
+    rows = [json.loads(line) for line in out.read_text(encoding="utf-8").splitlines()]
+    assert [(r["input"], r["match"], r["code"]) for r in rows] == [("", None, None), ("104", "code", 104), ("999", None, None), ("", None, None)]
+    # A name shared by two companies gives one output row per company
+    assert [(m, r[0]) for _, _, m, _, r in db.lookup_batch(["Company 1"])] == [("name", 101), ("name", 200)]
+
+def test_fuzzy_names(tmp_path):
+    assert normalize_name("Bolt Technology OÜ") == normalize_name("BOLT technology ou") == "bolt technology"
+    assert normalize_name("Jaan Tamm FIE") == normalize_name("Jaan Tamm füüsilisest isikust ettevõtja") == "jaan tamm"
+    assert normalize_name("AS") == "as"
+    db = RegistryDB(tmp_path / "test.db")
+    db.insert_batch_base([{"ariregistri_kood": 1, "nimi": "Bolt Technology OÜ"}, {"ariregistri_kood": 2, "nimi": "Bolt Food OÜ"},
+                          {"ariregistri_kood": 3, "nimi": "Volt Tech AS"}, {"ariregistri_kood": 4, "nimi": "Põld ja Mets MTÜ"}])
+    db.build_name_index()
+    ranked = db.fuzzy_names("Bolt Technologi OU")
+    assert ranked[0][:2] == (1, "Bolt Technology OÜ") and ranked[0][2] > ranked[1][2]
+    assert db.fuzzy_names("pold ja mets") == [(4, "Põld ja Mets MTÜ", 1.0)]
+    assert db.fuzzy_names("zzzz") == []
+    hits = [(m, s, r and r[0]) for _, _, m, s, r in db.lookup_batch(["Bolt Technologi", "Qwerty"], fuzzy=True)]
+    assert hits[0][0] == "fuzzy" and hits[0][2] == 1 and hits[1] == (None, None, None)
+
+def test_snapshot_matches_sqlite(tmp_path):
+    pytest.importorskip("numpy")
+    import random
+    rng = random.Random(7)
+    db = RegistryDB(tmp_path / "registry.db")
+    counties = ["Harju maakond", "Tartu maakond", "Pärnu maakond", None]
+    db.insert_batch_base([{"ariregistri_kood": 1000 + i, "nimi": f"Company {i}", "ettevotja_oiguslik_vorm": rng.choice(["Osaühing", "Aktsiaselts"]),
+                           "ettevotja_staatus_tekstina": rng.choice(["Registrisse kantud", "Likvideerimisel"]),
+                           "asukoha_ehak_tekstina": rng.choice(counties) and f"Linn, {rng.choice(counties[:3])}"} for i in range(300)])
+    db.update_batch_general([{"ariregistri_kood": 1000 + i,
+        "esmaregistreerimise_kpv": f"1{rng.randint(0, 9)}.0{rng.randint(1, 9)}.{rng.randint(1995, 2024)}" if i % 7 else None, "yldandmed": {
+        "kapitalid": [{"kapitali_suurus": rng.choice([2500, 25000, 100000])}] if i % 3 else [],
+        "sidevahendid": [{"liik_tekstina": "E-post", "sisu": "a@b.ee"}] if i % 2 else [],
+        "info_majandusaasta_aruannetest": [{"tootajate_arv": rng.randint(0, 50)}] if i % 4 else [],
+        "teatatud_tegevusalad": [{"emtak_kood": rng.choice(["62011", "4120", "56101"]), "on_pohitegevusala": True},
+                                 {"emtak_kood": rng.choice(["6202", "47"]), "on_pohitegevusala": False}][:1 + i % 2]}}
+        for i in range(300)])
+    CompanySnapshot.build(db).save(tmp_path / "snapshot")
+    snap = CompanySnapshot.load(tmp_path / "snapshot", generation=db.generation())
+    assert len(snap) == 300 and CompanySnapshot.load(tmp_path / "snapshot", generation=99) is None
+    cases = [dict(emtak=["62"]), dict(emtak="4120", location="harju"), dict(status="Likvid", min_capital=10000),
+             dict(founded_after="2010-01-01", founded_before="2020"), dict(legal_form="Osa", has_email=True),
+             dict(min_employees=10), dict(max_employees=20, max_capital=30000), dict(emtak=["6202"], code_range=(1100, 1200))]
+    for filters in cases:
+        db.snapshot = None; expected = sorted(d["ariregistri_kood"] for d in db.search(**filters))
+        db.snapshot = snap; got = [d["ariregistri_kood"] for d in db.search(**filters)]
+        assert got == expected and expected, filters
+    assert len(list(db.search(emtak=["62"], limit=5))) == 5
+
+def test_keyset_pages(tmp_path):
+    db = RegistryDB(tmp_path / "test.db")
+    db.insert_batch_base([{"ariregistri_kood": 100 + i * 3, "nimi": f"Company {i}", "ettevotja_oiguslik_vorm": "Osaühing" if i % 2 else "Aktsiaselts"}
+                          for i in range(25)])
+    seen, cursor = [], None
+    while True:
+        page, cursor = db.search_page(limit=4, cursor=cursor, legal_form="Osa")
+        seen += [d["ariregistri_kood"] for d in page]
+        if not cursor: break
+    assert seen == [100 + i * 3 for i in range(1, 25, 2)]
+    with pytest.raises(ValueError): decode_cursor("not a cursor")
+
+    with db.conn:
+        db.conn.executemany("INSERT INTO persons (company_code, source, full_name) VALUES (?, 'board', ?)",
+                            [(100, name) for name in ["Mari Maasikas", "Jaan Tamm", None, "Jaan Tamm", "Ülle Õun", None, "Aadu Kask"]])
+    names, cursor = [], None
+    while True:
+        rows, cursor = db.search_persons_page(limit=2, cursor=cursor)
+        names += [(r["full_name"], r["id"]) for r in rows]
+        if not cursor: break
+    assert names == sorted(names, key=lambda n: (n[0] is not None, n[0] or "", n[1])) and len(names) == 7
+
+def test_query_profiler(tmp_path):
+    db = RegistryDB(tmp_path / "test.db")
+    db.insert_batch_base([{"ariregistri_kood": 100 + i, "nimi": f"Company {i}", "ettevotja_oiguslik_vorm": "Osaühing"} for i in range(50)])
+    profiler = db.enable_profiling(threshold_ms=0, log_path=tmp_path / "slow.jsonl")
+    assert len(list(db.search(legal_form="Osa", limit=5))) == 5
+    db.analyze(by="legal-form")
+    search, analyze = profiler.records
+    assert (search["label"], search["rows"]) == ("search", 5) and analyze["label"] == "analyze:legal-form"
+    assert analyze["full_scans"]
+    logged = [json.loads(line) for line in (tmp_path / "slow.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert [r["label"] for r in logged] == ["search", "analyze:legal-form"] and logged[0]["plan"]
+    # A single-row read reports at once; a cursor left early reports on close(), not on garbage collection
+    assert db.is_empty() is False and profiler.records[2]["rows"] == 1
+    cursor = db._query("codes", "SELECT code FROM companies"); cursor.fetchone()
+    assert len(profiler.records) == 3
+    cursor.close()
+    assert (profiler.records[3]["label"], profiler.records[3]["rows"]) == ("codes", 1)
+
+def write_registry_zips(download_dir, n):
+    import zipfile
+    download_dir.mkdir(parents=True, exist_ok=True)
+    csv_rows = "ariregistri_kood;nimi;ettevotja_oiguslik_vorm\n" + "".join(f"{100 + i};Company {i};Osaühing\n" for i in range(n))
+    files = {"ettevotja_rekvisiidid__lihtandmed.csv": csv_rows,
+             "ettevotja_rekvisiidid__yldandmed.json": json.dumps([{"ariregistri_kood": 100 + i, "staatus_tekstina": "Registrisse kantud"} for i in range(n)]),
+             "ettevotja_rekvisiidid__osanikud.json": json.dumps([{"ariregistri_kood": 100 + i, "osanikud": [{"nimi_arinimi": "Tamm"}]} for i in range(n)])}
+    for name, content in files.items():
+        with zipfile.ZipFile(download_dir / (name + ".zip"), "w") as zf: zf.writestr(name, content)
+
+def test_merge_metrics(tmp_path):
+    write_registry_zips(tmp_path / "data" / "downloads", 30)
+    reg = EstonianRegistry(data_dir=tmp_path / "data", chunk_size=10)
+    report = reg.merge()
+    assert [f["file"] for f in report["files"]] == ["ettevotja_rekvisiidid__lihtandmed.csv.zip", "ettevotja_rekvisiidid__yldandmed.json.zip",
+                                                    "ettevotja_rekvisiidid__osanikud.json.zip"]
+    csv_file = report["files"][0]
+    assert (csv_file["items"], csv_file["batches"]) == (30, 3) and csv_file["bytes_read"] > 0
+    assert {"read", "encode", "write", "other"} <= set(csv_file["stages"]) and csv_file["batch_commit_ms"]["max"] >= 0
+    assert "name_index" in [s["step"] for s in report["steps"]]
+    assert json.loads(Path(report["path"]).read_text(encoding="utf-8"))["items"] == 90
+    assert next(reg.db.search(term="Company 7"))["osanikud"] == [[{"nimi_arinimi": "Tamm"}]]
+    assert reg.merge()["files"] == []  # nothing left to process
+
+def test_group_sections(tmp_path):
+    import zipfile
+    items = [{"ariregistri_kood": c, "osanikud": [i]} for i, c in enumerate([103, 101, 103, 102, 101, 103])]
+    expected = [(101, [[1], [4]]), (102, [[3]]), (103, [[0], [2], [5]])]
+    assert list(group_sections(items, "osanikud")) == expected
+    assert list(group_sections(items, "osanikud", run_size=2, tmp_dir=tmp_path)) == expected
+
+    # A company whose items land in different batches keeps all of them
+    write_registry_zips(tmp_path / "data" / "downloads", 30)
+    name = "ettevotja_rekvisiidid__osanikud.json"
+    split = [{"ariregistri_kood": 100 + i % 30, "osanikud": [{"nimi_arinimi": f"Osanik {i}"}]} for i in range(60)]
+    with zipfile.ZipFile(tmp_path / "data" / "downloads" / (name + ".zip"), "w") as zf: zf.writestr(name, json.dumps(split))
+    reg = EstonianRegistry(data_dir=tmp_path / "data", chunk_size=10)
+    report = reg.merge()
+    assert next(reg.db.get_companies([107]))[1]["osanikud"] == [[{"nimi_arinimi": "Osanik 7"}], [{"nimi_arinimi": "Osanik 37"}]]
+    assert report["files"][2]["items"] == 60 and report["files"][2]["batches"] == 3
+
+def test_json_decoders(tmp_path):
+    import shutil, zipfile
+    items = [{"ariregistri_kood": 100 + i, "kapital": 2500.5, "arv": i, "nimi": "Õun OÜ", "osad": [{"summa": 2500.0}]} for i in range(7)]
+    path = tmp_path / "items.json"; path.write_text(json.dumps(items), encoding="utf-8")
+    with zipfile.ZipFile(tmp_path / "items.zip", "w") as zf: zf.write(path, "items.json")
+    assert select_json_decoder() in JSON_DECODERS
+    available = [d for d in JSON_DECODERS if d != "jq" or shutil.which("jq")]
+    for decoder in available:
+        assert [len(b) for b in iter_json_batches(path, batch_size=3, decoder=decoder)] == [3, 3, 1]
+        with zipfile.ZipFile(tmp_path / "items.zip") as zf, zf.open("items.json") as raw:
+            decoded = [item for batch in iter_json_batches(raw, decoder=decoder) for item in batch]
+        assert decoded == items and type(decoded[0]["kapital"]) is float
+        assert type(decoded[0]["osad"][0]["summa"]) is int  # 2500.0 is stored as 2500 whichever decoder ran
+    with pytest.raises(ValueError): select_json_decoder("simdjson")
+
+def test_synthetic_registry(tmp_path):
+    import zipfile
+    from bench import generate_registry
+    first = generate_registry(tmp_path / "data" / "downloads", companies=200, seed=3)
+    again = generate_registry(tmp_path / "again", companies=200, seed=3)
+    for a, b in zip(first, again):
+        with zipfile.ZipFile(a) as za, zipfile.ZipFile(b) as zb:
+            assert za.read(za.namelist()[0]) == zb.read(zb.namelist()[0])
+
+    reg = EstonianRegistry(data_dir=tmp_path / "data")
+    reg.merge(force=True)
+    sources = dict(reg.db.conn.execute("SELECT source, COUNT(*) FROM persons GROUP BY source").fetchall())
+    assert set(sources) == {"board", "shareholder", "beneficiary"} and reg.db.get_stats()["total"] == 200
+    holder = reg.db.conn.execute("SELECT id_code FROM persons WHERE source = 'shareholder' AND length(id_code) = 8").fetchone()[0]
+    assert reg.db.find_group(holder, direction="down")["subsidiaries"]
+
+def test_bulk_load(tmp_path):
+    from bench import generate_registry
+    generate_registry(tmp_path / "downloads", companies=200, seed=5)
+    regs = {}
+    for mode in ("indexed", "bulk"):
+        (tmp_path / mode).mkdir(); (tmp_path / "downloads").rename(tmp_path / mode / "downloads")
+        regs[mode] = EstonianRegistry(data_dir=tmp_path / mode)
+        report = regs[mode].merge(force=True, bulk=mode == "bulk")
+        (tmp_path / mode / "downloads").rename(tmp_path / "downloads")
+    assert "indexes" in {s["step"] for s in report["steps"]}
+    indexes = "SELECT name, sql FROM sqlite_master WHERE type = 'index' ORDER BY name"
+    indexed, bulk = regs["indexed"].db, regs["bulk"].db
+    assert bulk.conn.execute(indexes).fetchall() == indexed.conn.execute(indexes).fetchall()
+    assert bulk.conn.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0] > 0
+    assert bulk.conn.execute("PRAGMA synchronous").fetchone()[0] == indexed.conn.execute("PRAGMA synchronous").fetchone()[0]
+    assert bulk.get_stats() == indexed.get_stats()
+    assert bulk.analyze("status") == indexed.analyze("status")
+    for table in ("persons", "registry_events"):
+        query = f"SELECT * FROM {table} ORDER BY id"
+        assert [tuple(r) for r in bulk.conn.execute(query)] == [tuple(r) for r in indexed.conn.execute(query)]
+
+    # Opening the database while a load runs leaves its indexes dropped
+    load = bulk.bulk_load(); load.__enter__()
+    during = RegistryDB(tmp_path / "bulk" / "registry.db")
+    assert len(during.conn.execute(indexes).fetchall()) < len(indexed.conn.execute(indexes).fetchall()); during.conn.close()
+    load.__exit__(None, None, None)
+    assert bulk.conn.execute(indexes).fetchall() == indexed.conn.execute(indexes).fetchall()
+
+    # A load killed before its indexes were rebuilt gets them back on the next open
+    bulk.conn.close()
+    script = f"import os, registry; load = registry.RegistryDB({str(tmp_path / 'bulk' / 'registry.db')!r}).bulk_load(); load.__enter__(); os._exit(1)"
+    subprocess.run([sys.executable, "-c", script], cwd=Path(__file__).resolve().parent.parent)
+    killed = sqlite3.connect(tmp_path / "bulk" / "registry.db")
+    assert len(killed.execute(indexes).fetchall()) < len(indexed.conn.execute(indexes).fetchall()); killed.close()
+    reopened = RegistryDB(tmp_path / "bulk" / "registry.db")
+    assert reopened.conn.execute(indexes).fetchall() == indexed.conn.execute(indexes).fetchall()
+
+def test_merge_swap(tmp_path):
+    from bench import generate_registry
+    generate_registry(tmp_path / "data" / "downloads", companies=400, seed=4)
+    reg = EstonianRegistry(data_dir=tmp_path / "data"); reg.merge(force=True)
+    # A board member of several companies, masked in one company's open data, whose namesake has another id code
+    name, code, id_code = reg.db.conn.execute("""SELECT full_name, company_code, id_code FROM persons
+        WHERE source = 'board' AND company_code <> 10000007
+          AND full_name IN (SELECT full_name FROM persons GROUP BY full_name HAVING COUNT(DISTINCT id_code) > 1)
+          AND id_code IN (SELECT id_code FROM persons GROUP BY id_code HAVING COUNT(DISTINCT company_code) > 1)
+        ORDER BY id""").fetchone()
+    zp = tmp_path / "data" / "downloads" / "ettevotja_rekvisiidid__kaardile_kantud_isikud.json.zip"
+    with zipfile.ZipFile(zp) as zf: member = zf.namelist()[0]; items = json.loads(zf.read(member))
+    for item in items:
+        for person in item["kaardile_kantud_isikud"] if item["ariregistri_kood"] == code else []:
+            if person["isikukood_registrikood"] == id_code: person["isikukood_registrikood"] = None
+    with zipfile.ZipFile(zp, "w") as zf: zf.writestr(member, json.dumps(items))
+    reg.merge(force=True)
+    companies = lambda db: db.conn.execute("""SELECT e.companies FROM persons p JOIN person_entities e ON e.id = p.person_entity_id
+                                              WHERE p.company_code = ? AND p.source = 'board' AND p.id_code IS NULL""", (code,)).fetchone()[0]
+    assert companies(reg.db) == 1
+    # Enrichment unmasks the id, which joins the row to the rest of that person's roles
+    reg.db.update_enrichment(code, {"unmasked_ids": {name: id_code}}); reg.db.populate_person_entities(codes=[code])
+    joined = companies(reg.db)
+    assert joined > 1
+    reg.db.update_enrichment(10000007, {"isikukoodid": ["38001010000"]})
+    live_path = reg.db_path
+    # A reader mid-transaction on the live file, and the query service, while the next generation is built
+    reader = RegistryDB(live_path, read_only=True); reader.conn.execute("BEGIN")
+    before = reader.generation()
+
+    async def scenario():
+        service = RegistryService(live_path, pool_size=1)
+        await service.start("127.0.0.1", 0)
+        first = (await service.dispatch("GET", "/health"))[1]
+        report = reg.merge(swap=True)
+        second = (await service.dispatch("GET", "/health"))[1]
+        await service.close()
+        return first, report, second
+
+    first, report, second = asyncio.run(scenario())
+    assert live_path.is_symlink() and report["swap"]["rows"]["companies"] == (400, 400)
+    assert reader.generation() == before and len(list(reader.search(limit=5))) == 5
+    fresh = RegistryDB(live_path, read_only=True)
+    assert fresh.generation() > before and next(fresh.get_companies([10000007]))[1]["enrichment"]
+    assert companies(fresh) == joined  # the copied enrichment is there before persons are resolved
+    assert first["generation"] == before and second["generation"] == fresh.generation()
+
+    # A build that fails its checks leaves the live generation in place
+    current = live_path.resolve()
+    (tmp_path / "data" / "downloads" / "ettevotja_rekvisiidid__lihtandmed.csv.zip").unlink()
+    with pytest.raises(RuntimeError): reg.merge(swap=True)
+    assert live_path.resolve() == current and len(list((tmp_path / "data").glob("registry-*.db"))) == 1
+    assert reg.db.get_stats()["total"] == 400
+
+def test_duckdb_parity(tmp_path):
+    pytest.importorskip("duckdb"); pytest.importorskip("pyarrow")
+    import shutil
+    from bench import generate_registry
+    from registry import DuckDBBackend
+    generate_registry(tmp_path / "sqlite" / "downloads", companies=300, seed=5)
+    shutil.copytree(tmp_path / "sqlite" / "downloads", tmp_path / "duckdb" / "downloads")
+    lite = EstonianRegistry(data_dir=tmp_path / "sqlite").db
+    duck = EstonianRegistry(data_dir=tmp_path / "duckdb", backend=DuckDBBackend(tmp_path / "duckdb" / "registry.duckdb")).db
+    for db, name in ((lite, "sqlite"), (duck, "duckdb")):
+        EstonianRegistry(data_dir=tmp_path / name, backend=db).merge(force=True)
+
+    codes = [r[0] for r in lite.conn.execute("SELECT code FROM companies ORDER BY code").fetchall()]
+    assert list(duck.get_companies(codes)) == list(lite.get_companies(codes))
+    for filters in [dict(term="Tarkvara"), dict(emtak=["62"], location="Tartu"), dict(person="Tamm"),
+                    dict(status="likvideer"), dict(legal_form="osaühing", min_employees=3), dict(has_email=True, max_capital=10000)]:
+        assert [d["ariregistri_kood"] for d in duck.search(**filters)] == [d["ariregistri_kood"] for d in lite.search(ordered=True, **filters)], filters
+    for by in ["county", "municipality", "status", "legal-form", "year", "emtak", "capital-range", "employee-range", "role", "country"]:
+        assert sorted(duck.analyze(by, top=1000)) == sorted(lite.analyze(by, top=1000)), by
+    # Person ids come from each backend's own sequence
+    rows = lambda found: sorted((tuple((k, v) for k, v in r.items() if k != "id") for r in found), key=repr)
+    assert rows(duck.search_persons(name="Kask", limit=None)) == rows(lite.search_persons(name="Kask", limit=None))
+    assert rows(duck.events(limit=None, event_type="bankruptcy")) == rows(lite.events(limit=None, event_type="bankruptcy"))
+    holder = lite.conn.execute("SELECT id_code FROM persons WHERE source = 'shareholder' AND length(id_code) = 8").fetchone()[0]
+    group = lambda db: {k: v if k == "company" else rows(v) for k, v in db.find_group(holder).items()}
+    assert group(duck) == group(lite)
+    hub = lite.conn.execute("SELECT company_code FROM company_links GROUP BY company_code ORDER BY COUNT(*) DESC, company_code").fetchone()[0]
+    assert duck.linked_companies(hub, max_hops=3) == lite.linked_companies(hub, max_hops=3) != []
+    assert duck.employee_trend(emtak="62") == lite.employee_trend(emtak="62")
+    assert duck.employee_trend(code=codes[3]) == lite.employee_trend(code=codes[3])
+    assert sorted(duck.event_counts("county")) == sorted(lite.event_counts("county"))
+    assert duck.get_stats() == lite.get_stats()
+
+def test_json_stream_export(tmp_path):
+    db = RegistryDB(tmp_path / "test.db")
+    db.insert_batch_base([{"ariregistri_kood": 100 + i, "nimi": f"Company {i}", "ettevotja_staatus_tekstina": "Registrisse kantud"} for i in range(3)])
+
+    count = write_json_stream(db.search(), tmp_path / "out.json", translate=True)
+    data = json.loads((tmp_path / "out.json").read_text(encoding="utf-8"))
+    assert count == 3
+    assert [d["registry_code"] for d in data] == [100, 101, 102]
+
+    write_json_stream(db.search(), tmp_path / "out.ndjson.gz")
+    with gzip.open(tmp_path / "out.ndjson.gz", "rt", encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert [d["nimi"] for d in lines] == ["Company 0", "Company 1", "Company 2"]
+
+    assert write_json_stream(iter([]), tmp_path / "empty.json") == 0
+    assert json.loads((tmp_path / "empty.json").read_text(encoding="utf-8")) == []
+
+def test_columnar_export(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    db = RegistryDB(tmp_path / "test.db")
+    db.insert_batch_base([{"ariregistri_kood": 200 + i, "nimi": f"Company {i}", "ettevotja_staatus_tekstina": "Registrisse kantud",
+                           "asukoha_ehak_tekstina": "Tartu linn, Tartu maakond", "ettevotja_esmakande_kpv": "05.03.2021"} for i in range(5)])
+    db.update_batch_general([{"ariregistri_kood": 200, "teatatud_tegevusalad": [{"emtak_kood": "6201", "on_pohitegevusala": True}]}])
+    db.update_batch_json("osanikud", {200: [{"osanikud": [{"eesnimi": "Mari", "nimi_arinimi": "Maasikas", "osaluse_protsent": "100"}]}]})
+    db.populate_persons()
+
+    counts = export_columnar(db, tmp_path / "out", fmt="parquet", batch_size=2)
+    assert counts == {"companies": 5, "persons": 1, "activities": 0, "annual_reports": 0}
+    companies = pq.read_table(tmp_path / "out" / "companies.parquet")
+    assert str(companies.schema.field("county").type).startswith("dictionary")
+    assert companies.column("founded").to_pylist()[0].isoformat() == "2021-03-05"
+    assert pq.ParquetFile(tmp_path / "out" / "companies.parquet").metadata.num_row_groups == 3
+    persons = pq.read_table(tmp_path / "out" / "persons.parquet").to_pylist()
+    assert persons[0]["full_name"] == "Mari Maasikas" and persons[0]["ownership_pct"] == 100.0
+
+def test_parallel_export_matches_serial(tmp_path):
+    db = RegistryDB(tmp_path / "test.db")
+    db.insert_batch_base([{"ariregistri_kood": 1000 + i, "nimi": f"Company {i}", "ettevotja_staatus_tekstina": "Registrisse kantud"}
+                          for i in range(40)])
+
+    export_csv(db, tmp_path / "serial.csv")
+    export_parallel(db, tmp_path / "parallel.csv", workers=2)
+    assert (tmp_path / "parallel.csv").read_bytes() == (tmp_path / "serial.csv").read_bytes()
+
+    assert export_parallel(db, tmp_path / "parallel.json", workers=3, status="Registrisse") == 40
+    data = json.loads((tmp_path / "parallel.json").read_text(encoding="utf-8"))
+    assert [d["ariregistri_kood"] for d in data] == list(range(1000, 1040))
+
+    export_parallel(db, tmp_path / "dataset.ndjson", workers=2, partitioned=True)
+    parts = sorted((tmp_path / "dataset").glob("part-*.ndjson"))
+    assert len(parts) > 1
+    assert sum(len(p.read_text(encoding="utf-8").splitlines()) for p in parts) == 40
+
+def test_query_service(tmp_path):
+    db = RegistryDB(tmp_path / "test.db")
+    db.insert_batch_base([{"ariregistri_kood": 10001, "nimi": "Alpha LLC", "ettevotja_staatus_tekstina": "Registrisse kantud",
+                           "asukoha_ehak_tekstina": "Tallinn, Harju maakond"}])
+    db.update_batch_json("osanikud", {10001: [{"osanikud": [{"eesnimi": "John", "nimi_arinimi": "Doe"}]}]})
+    db.populate_persons()
+
+    async def scenario():
+        service = RegistryService(tmp_path / "test.db", pool_size=2)
+        server = await service.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        responses, allowed = [], []
+        # Several requests over one keep-alive connection
+        for target in ["/search?term=Alpha&lang=en", "/persons?name=Doe", "/analyze?by=county", "/analyze?by=county", "/nope",
+                       "/search?industry=unknown-thing", "/links?code=10001&hops=3", "POST /search", "HEAD /health"]:
+            method, _, target = target.rpartition(" ")
+            writer.write(f"{method or 'GET'} {target} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            headers = {}
+            while (line := await reader.readline()) != b"\r\n":
+                k, _, v = line.decode().partition(":"); headers[k.lower()] = v.strip()
+            body = b"" if method == "HEAD" else await reader.readexactly(int(headers["content-length"]))
+            responses.append((status, json.loads(body) if body else headers)); allowed.append(headers.get("allow"))
+        writer.close()
+        await service.close()
+        # The answer cache keeps the cache_size most recently used answers, and drops expired ones
+        small = RegistryService(tmp_path / "test.db", cache_size=2)
+        for key in "abc": small._remember(key, key)
+        assert list(small.cache) == ["b", "c"]
+        small.cache["b"] = (0, "b"); small._remember("d", "d")
+        assert list(small.cache) == ["c", "d"]
+        return responses, allowed
+
+    (search, persons, analyze, cached, missing, bad, links, post, head), allowed = asyncio.run(scenario())
+    assert search[0] == 200 and search[1]["results"][0]["name"] == "Alpha LLC"
+    assert persons[1]["results"][0]["full_name"] == "John Doe"
+    assert analyze[1]["results"] == [{"group": "Harju maakond", "count": 1}] and cached == analyze
+    assert missing[0] == 404 and bad[0] == 400 and links == (200, {"count": 0, "results": []})
+    assert post[0] == 405 and allowed[-2] == "GET, HEAD" and head[0] == 200 and int(head[1]["content-length"]) > 0